@@ -16,5 +16,8 @@
 
 from sequence_example_lib import get_padded_batch
 from sequence_example_lib import make_sequence_example
+from sequence_example_lib import make_sparse_sequence_example
+from sequence_example_lib import pack_sequence_examples
+from sequence_example_lib import SerializedSequenceExample
 
 from tf_lib import HParams
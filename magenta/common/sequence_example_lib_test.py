@@ -0,0 +1,197 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for sequence_example_lib."""
+
+import os
+import tempfile
+import time
+
+# internal imports
+import numpy as np
+import tensorflow as tf
+
+from magenta.common import sequence_example_lib
+
+
+class SequenceExampleLibTest(tf.test.TestCase):
+
+  def testMakeSparseSequenceExample(self):
+    inputs = [[0.0, 1.0, 0.0, -1.0], [0.5, 0.0, 0.0, 0.0], [0.0] * 4]
+    labels = [1, 2, 3]
+    sequence_example = sequence_example_lib.make_sparse_sequence_example(
+        inputs, labels)
+    feature_list = sequence_example.feature_lists.feature_list
+    self.assertEqual(
+        [[1, 3], [0], []],
+        [list(feature.int64_list.value)
+         for feature in feature_list['input_indices'].feature])
+    self.assertEqual(
+        [[1.0, -1.0], [0.5], []],
+        [list(feature.float_list.value)
+         for feature in feature_list['input_values'].feature])
+    self.assertEqual(
+        labels,
+        [feature.int64_list.value[0]
+         for feature in feature_list['labels'].feature])
+
+  def testSerializeSequenceExample(self):
+    inputs = np.array([[0.0, 1.0, 0.0, -1.0], [0.5, 0.0, 0.0, 0.0]],
+                      dtype=np.float32)
+    labels = np.array([1, 300], dtype=np.int64)
+    self.assertEqual(
+        sequence_example_lib.make_sequence_example(
+            inputs.tolist(), labels.tolist()).SerializeToString(),
+        sequence_example_lib.serialize_sequence_example(inputs, labels))
+
+  def testSerializeSequenceExampleEmpty(self):
+    self.assertEqual(
+        sequence_example_lib.make_sequence_example([], []),
+        tf.train.SequenceExample.FromString(
+            sequence_example_lib.serialize_sequence_example([], [])))
+
+  def testSerializeSparseSequenceExample(self):
+    inputs = np.array([[0.0, 1.0, 0.0, -1.0], [0.0] * 4], dtype=np.float32)
+    labels = np.array([-1, 2], dtype=np.int64)
+    self.assertEqual(
+        sequence_example_lib.make_sparse_sequence_example(
+            inputs, labels.tolist()),
+        tf.train.SequenceExample.FromString(
+            sequence_example_lib.serialize_sparse_sequence_example(
+                inputs, labels)))
+
+  def testSerializedSequenceExample(self):
+    inputs = [[0.0, 1.0], [1.0, 0.0]]
+    sequence_example = sequence_example_lib.make_sequence_example(
+        inputs, [0, 1])
+    serialized = sequence_example_lib.SerializedSequenceExample(
+        sequence_example_lib.serialize_sequence_example(inputs, [0, 1]))
+    self.assertEqual(sequence_example, serialized.to_proto())
+    self.assertEqual(serialized, sequence_example)
+    self.assertNotEqual(
+        serialized,
+        sequence_example_lib.make_sequence_example(inputs, [1, 1]))
+
+  def testGetPaddedBatchSparseInputs(self):
+    inputs = [[0.0, 1.0, 0.0, -1.0], [0.5, 0.0, 0.0, 0.0], [0.0] * 4]
+    labels = [1, 2, 3]
+    filename = os.path.join(tempfile.mkdtemp(dir=self.get_temp_dir()),
+                            'sparse.tfrecord')
+    writer = tf.python_io.TFRecordWriter(filename)
+    writer.write(sequence_example_lib.make_sparse_sequence_example(
+        inputs, labels).SerializeToString())
+    writer.close()
+
+    with self.test_session() as sess:
+      batch = sequence_example_lib.get_padded_batch(
+          [filename], 1, 4, num_enqueuing_threads=1, sparse_inputs=True)
+      coord = tf.train.Coordinator()
+      threads = tf.train.start_queue_runners(sess, coord)
+      inputs_, labels_, lengths_ = sess.run(batch)
+      coord.request_stop()
+      coord.join(threads, stop_grace_period_secs=1)
+
+    self.assertEqual([inputs], inputs_.tolist())
+    self.assertEqual([labels], labels_.tolist())
+    self.assertEqual([3], lengths_.tolist())
+
+  def testPackSequenceExamples(self):
+    sequence_examples = [
+        sequence_example_lib.make_sequence_example(
+            [[float(i), 1.0]] * length, [i] * length)
+        for i, length in enumerate([3, 2, 4, 7, 0, 1], 1)]
+    packed = list(sequence_example_lib.pack_sequence_examples(
+        sequence_examples, 5))
+
+    def feature_values(sequence_example, key):
+      return [list(feature.float_list.value or feature.int64_list.value)
+              for feature in
+              sequence_example.feature_lists.feature_list[key].feature]
+
+    self.assertEqual([[1, 1, 1, 2, 2], [3, 3, 3, 3, 0], [4, 4, 4, 4, 4],
+                      [4, 4, 6, 0, 0]],
+                     [sum(feature_values(example, 'labels'), [])
+                      for example in packed])
+    self.assertEqual([[1, 1, 1, 2, 2], [1, 1, 1, 1, 0], [1, 1, 1, 1, 1],
+                      [1, 1, 2, 0, 0]],
+                     [sum(feature_values(example, 'segment_ids'), [])
+                      for example in packed])
+    self.assertEqual([[3.0, 1.0]] * 4 + [[0.0, 0.0]],
+                     feature_values(packed[1], 'inputs'))
+
+    with self.assertRaises(ValueError):
+      list(sequence_example_lib.pack_sequence_examples(sequence_examples, 0))
+
+  def testGetPaddedBatchPackedSparseInputs(self):
+    sequence_examples = [
+        sequence_example_lib.make_sparse_sequence_example(
+            [[0.0, 1.0, 0.0], [0.5, 0.0, 0.0]], [1, 2]),
+        sequence_example_lib.make_sparse_sequence_example(
+            [[0.0, 0.0, 1.0]], [3])]
+    filename = os.path.join(tempfile.mkdtemp(dir=self.get_temp_dir()),
+                            'packed.tfrecord')
+    writer = tf.python_io.TFRecordWriter(filename)
+    for packed in sequence_example_lib.pack_sequence_examples(
+        sequence_examples, 4):
+      writer.write(packed.SerializeToString())
+    writer.close()
+
+    with self.test_session() as sess:
+      batch = sequence_example_lib.get_padded_batch(
+          [filename], 1, 3, num_enqueuing_threads=1, sparse_inputs=True,
+          packed=True)
+      coord = tf.train.Coordinator()
+      threads = tf.train.start_queue_runners(sess, coord)
+      inputs_, labels_, lengths_, segment_ids_ = sess.run(batch)
+      coord.request_stop()
+      coord.join(threads, stop_grace_period_secs=1)
+
+    self.assertEqual([[[0.0, 1.0, 0.0], [0.5, 0.0, 0.0], [0.0, 0.0, 1.0],
+                       [0.0, 0.0, 0.0]]], inputs_.tolist())
+    self.assertEqual([[1, 2, 3, 0]], labels_.tolist())
+    self.assertEqual([4], lengths_.tolist())
+    self.assertEqual([[1, 1, 2, 0]], segment_ids_.tolist())
+
+
+class SequenceExampleSerializationBenchmark(tf.test.Benchmark):
+  """Compares building SequenceExample protos to writing the wire format.
+
+  Run with `--benchmarks=all`.
+  """
+
+  def _report(self, name, fn, iters=20):
+    start = time.time()
+    for _ in range(iters):
+      fn()
+    self.report_benchmark(name=name, iters=iters,
+                          wall_time=(time.time() - start) / iters)
+
+  def benchmarkSerializeSequenceExample(self):
+    num_steps, input_size = 1024, 74
+    inputs = (np.random.rand(num_steps, input_size) < 0.1).astype(np.float32)
+    labels = np.random.randint(0, 40, size=num_steps)
+    self._report('make_sequence_example', lambda: (
+        sequence_example_lib.make_sequence_example(
+            inputs.tolist(), labels.tolist()).SerializeToString()))
+    self._report('serialize_sequence_example', lambda: (
+        sequence_example_lib.serialize_sequence_example(inputs, labels)))
+    self._report('make_sparse_sequence_example', lambda: (
+        sequence_example_lib.make_sparse_sequence_example(
+            inputs, labels.tolist()).SerializeToString()))
+    self._report('serialize_sparse_sequence_example', lambda: (
+        sequence_example_lib.serialize_sparse_sequence_example(
+            inputs, labels)))
+
+
+if __name__ == '__main__':
+  tf.test.main()
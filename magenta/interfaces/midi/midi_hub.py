@@ -354,13 +354,17 @@ class MidiCaptor(threading.Thread):
     stop_time: The float wall time in seconds when the capture is to be stopped
         or None.
     stop_signal: A MidiSignal to use as a signal to stop capture.
+    melody_builder: An optional magenta.music.StreamingMelodyBuilder that is
+        fed each captured note as it ends, keeping an up-to-date quantized
+        melody of the capture. Its `start_time` should match `start_time`.
   """
   _metaclass__ = abc.ABCMeta
 
   # A message that is used to wake the consumer thread.
   _WAKE_MESSAGE = None
 
-  def __init__(self, qpm, start_time=0, stop_time=None, stop_signal=None):
+  def __init__(self, qpm, start_time=0, stop_time=None, stop_signal=None,
+               melody_builder=None):
     # A lock for synchronization.
     self._lock = threading.RLock()
     self._receive_queue = Queue.Queue()
@@ -369,6 +373,7 @@ class MidiCaptor(threading.Thread):
     self._start_time = start_time
     self._stop_time = stop_time
     self._stop_regex = re.compile(str(stop_signal))
+    self._melody_builder = melody_builder
     # A set of active MidiSignals being used by iterators.
     self._iter_signals = []
     # An event that is set when `stop` has been called.
@@ -415,6 +420,17 @@ class MidiCaptor(threading.Thread):
     """
     pass
 
+  def _note_closed(self, note):
+    """Called by children with each captured note once its end time is set.
+
+    Must be serialized.
+
+    Args:
+      note: The NoteSequence.Note proto that has ended.
+    """
+    if self._melody_builder is not None:
+      self._melody_builder.add_note(note)
+
   def run(self):
     """Captures incoming messages until stop time or signal received."""
     while True:
@@ -451,8 +467,18 @@ class MidiCaptor(threading.Thread):
 
     # Acquire lock to avoid race condition with `iterate`.
     with self._lock:
+      open_note_indices = [i for i, note in
+                           enumerate(self._captured_sequence.notes)
+                           if not note.end_time]
       # Set final captured sequence.
       self._captured_sequence = self.captured_sequence(end_time)
+      if self._melody_builder is not None:
+        # Match the truncation of the final captured sequence and add the
+        # notes it closed.
+        self._melody_builder.truncate(end_time)
+        for i in open_note_indices:
+          if i < len(self._captured_sequence.notes):
+            self._melody_builder.add_note(self._captured_sequence.notes[i])
       # Wake up all generators.
       for regex, queue in self._iter_signals:
         queue.put(MidiCaptor._WAKE_MESSAGE)
@@ -686,6 +712,7 @@ class MonophonicMidiCaptor(MidiCaptor):
         return
 
       self._open_note.end_time = msg.time
+      self._note_closed(self._open_note)
       self._open_note = None
 
     elif msg.type == 'note_on':
@@ -695,6 +722,7 @@ class MonophonicMidiCaptor(MidiCaptor):
           return
         # End the previous note.
         self._open_note.end_time = msg.time
+        self._note_closed(self._open_note)
 
       new_note = self._captured_sequence.notes.add()
       new_note.start_time = msg.time
@@ -724,6 +752,7 @@ class PolyphonicMidiCaptor(MidiCaptor):
         return
 
       self._open_notes[msg.note].end_time = msg.time
+      self._note_closed(self._open_notes[msg.note])
       del self._open_notes[msg.note]
 
     elif msg.type == 'note_on':
@@ -884,7 +913,8 @@ class MidiHub(object):
         self._outport.send(msg)
         self._open_notes.add(msg.note)
 
-  def start_capture(self, qpm, start_time, stop_time=None, stop_signal=None):
+  def start_capture(self, qpm, start_time, stop_time=None, stop_signal=None,
+                    melody_builder=None):
     """Starts a MidiCaptor to compile incoming messages into a NoteSequence.
 
     If neither `stop_time` nor `stop_signal`, are provided, the caller must
@@ -898,6 +928,8 @@ class MidiHub(object):
       stop_time: The optional float wall time in seconds to stop the capture.
       stop_signal: The optional mido.Message to use as a signal to use to stop
          the capture.
+      melody_builder: An optional magenta.music.StreamingMelodyBuilder to feed
+         captured notes to as they end.
 
     Returns:
       The MidiCaptor thread.
@@ -905,7 +937,8 @@ class MidiHub(object):
     captor_class = (MonophonicMidiCaptor if
                     self._texture_type == TextureType.MONOPHONIC else
                     PolyphonicMidiCaptor)
-    captor = captor_class(qpm, start_time, stop_time, stop_signal)
+    captor = captor_class(qpm, start_time, stop_time, stop_signal,
+                          melody_builder)
     with self._lock:
       self._captors.append(captor)
     captor.start()
@@ -24,11 +24,13 @@ import tensorflow as tf
 
 from magenta.common import concurrency
 from magenta.interfaces.midi import midi_hub
+from magenta.music import melodies_lib
 from magenta.music import testing_lib
 from magenta.protobuf import music_pb2
 
 
 Note = collections.namedtuple('Note', ['pitch', 'velocity', 'start', 'end'])
+NO_EVENT = melodies_lib.MELODY_NO_EVENT
 
 
 class MockMidiPort(mido.ports.BaseIOPort):
@@ -298,6 +300,27 @@ class MidiHubTest(tf.test.TestCase):
         [Note(1, 64, 2, 5), Note(2, 64, 3, 4), Note(3, 64, 4, stop_time)])
     self.assertProtoEquals(captured_seq, expected_seq)
 
+  def testStartCapture_MelodyBuilder(self):
+    start_time = 1.0
+    self.midi_hub = midi_hub.MidiHub(self.port, self.port,
+                                     midi_hub.TextureType.MONOPHONIC)
+    melody_builder = melodies_lib.StreamingMelodyBuilder(
+        120, steps_per_quarter=4, start_time=start_time)
+    captor = self.midi_hub.start_capture(120, start_time,
+                                         melody_builder=melody_builder)
+
+    self.send_capture_messages()
+    time.sleep(0.1)
+
+    stop_time = 5.5
+    captor.stop(stop_time=stop_time)
+
+    # At 120 qpm and 4 steps per quarter, there are 8 steps per second.
+    expected_melody = melodies_lib.Melody(
+        [NO_EVENT] * 8 + [1] + [NO_EVENT] * 7 + [2] + [NO_EVENT] * 7 + [3] +
+        [NO_EVENT] * 11)
+    self.assertEqual(expected_melody, melody_builder.melody)
+
   def testStartCapture_Multiple(self):
     captor_1 = self.midi_hub.start_capture(
         120, 0.0, stop_signal=midi_hub.MidiSignal(note=3))
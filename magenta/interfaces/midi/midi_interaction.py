@@ -173,9 +173,17 @@ class CallAndResponseMidiInteraction(MidiInteraction):
       self._midi_hub.start_metronome(
           self._qpm, call_start_quarters * quarter_duration)
 
+      # If the generator can take a quantized primer melody, build it as the
+      # call is captured so it is ready as soon as the call ends.
+      melody_builder = None
+      if hasattr(self._sequence_generator, 'create_melody_builder'):
+        melody_builder = self._sequence_generator.create_melody_builder(
+            self._qpm, call_start_quarters * quarter_duration)
+
       # Start a captor at the beginning of the call stage.
       captor = self._midi_hub.start_capture(
-          self._qpm, call_start_quarters * quarter_duration)
+          self._qpm, call_start_quarters * quarter_duration,
+          melody_builder=melody_builder)
 
       if self._phrase_bars is not None:
         # The duration of the call stage in quarter notes.
@@ -204,15 +212,11 @@ class CallAndResponseMidiInteraction(MidiInteraction):
       # Stop the captor at the appropriate time.
       captor.stop(stop_time=(
           (call_start_quarters + capture_quarters) * quarter_duration))
-      captured_sequence = captor.captured_sequence()
 
       # Check to see if a stop has been requested during capture.
       if self._stop_signal.is_set():
         break
 
-      # Set times in `captured_sequence` so that the call start is at 0.
-      adjust_times(captured_sequence, -(call_start_quarters * quarter_duration))
-
       # Generate sequence.
       response_start_quarters = call_quarters
       response_end_quarters = 2 * call_quarters
@@ -223,8 +227,17 @@ class CallAndResponseMidiInteraction(MidiInteraction):
           end_time_seconds=response_end_quarters * quarter_duration)
 
       # Generate response.
-      response_sequence = self._sequence_generator.generate(
-          captured_sequence, generator_options)
+      if melody_builder is not None:
+        # The melody was quantized during capture, relative to the call start.
+        response_sequence = self._sequence_generator.generate_from_melody(
+            melody_builder.melody, generator_options, self._qpm)
+      else:
+        captured_sequence = captor.captured_sequence()
+        # Set times in `captured_sequence` so that the call start is at 0.
+        adjust_times(captured_sequence,
+                     -(call_start_quarters * quarter_duration))
+        response_sequence = self._sequence_generator.generate(
+            captured_sequence, generator_options)
 
       # Set times in `captured_sequence` back to the wall times.
       adjust_times(response_sequence, call_start_quarters * quarter_duration)
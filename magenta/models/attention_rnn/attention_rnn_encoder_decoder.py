@@ -16,6 +16,8 @@
 import collections
 
 # internal imports
+import numpy as np
+
 import magenta
 
 NUM_SPECIAL_MELODY_EVENTS = magenta.music.NUM_SPECIAL_MELODY_EVENTS
@@ -39,6 +41,73 @@ NUM_BINARY_TIME_COUNTERS = 7
 LOOKBACK_DISTANCES = [STEPS_PER_BAR, STEPS_PER_BAR * 2]
 
 
+class _MelodyState(object):
+  """The running state of a melody prefix used to compute model inputs.
+
+  Attributes:
+    current_note: The pitch of the currently playing note, or None.
+    is_attack: Whether the last event was a note-on event.
+    is_ascending: Whether the last change in pitch was upwards, or None if
+        there has been no change in pitch.
+    last_3_notes: A deque of the last 3 distinct pitches played, most recent
+        last.
+    key_estimator: A MajorKeyEstimator over all notes played.
+    last_3_notes_key_estimator: A MajorKeyEstimator over `last_3_notes`.
+  """
+
+  def __init__(self):
+    self.current_note = None
+    self.is_attack = False
+    self.is_ascending = None
+    self.last_3_notes = collections.deque(maxlen=3)
+    self.key_estimator = magenta.music.MajorKeyEstimator()
+    self.last_3_notes_key_estimator = magenta.music.MajorKeyEstimator()
+
+  def update(self, note):
+    """Advances the state by one melody event in constant time.
+
+    Args:
+      note: The next integer Melody event.
+    """
+    if note == MELODY_NO_EVENT:
+      self.is_attack = False
+    elif note == MELODY_NOTE_OFF:
+      self.current_note = None
+    else:
+      self.is_attack = True
+      self.current_note = note
+      self.key_estimator.add_event(note)
+      if self.last_3_notes:
+        if note > self.last_3_notes[-1]:
+          self.is_ascending = True
+        if note < self.last_3_notes[-1]:
+          self.is_ascending = False
+      if note in self.last_3_notes:
+        self.last_3_notes.remove(note)
+      else:
+        if len(self.last_3_notes) == self.last_3_notes.maxlen:
+          self.last_3_notes_key_estimator.remove_event(self.last_3_notes[0])
+        self.last_3_notes_key_estimator.add_event(note)
+      self.last_3_notes.append(note)
+
+
+class _EncoderState(magenta.music.EncoderState):
+  """An EncoderState that keeps a running _MelodyState of the melody."""
+
+  def __init__(self, encoder_decoder, events):
+    self._melody_state = _MelodyState()
+    super(_EncoderState, self).__init__(encoder_decoder, events)
+
+  def _add_event(self, position):
+    self._melody_state.update(self._events[position])
+
+  def _get_input(self, position):
+    # pylint: disable=protected-access
+    return self._encoder_decoder._state_to_input(self._melody_state,
+                                                 self._events, position)
+    # pylint: enable=protected-access
+
+
 class MelodyEncoderDecoder(magenta.music.MelodyEncoderDecoder):
   """A MelodyEncoderDecoder specific to the attention RNN model.
 
@@ -87,32 +156,27 @@ class MelodyEncoderDecoder(magenta.music.MelodyEncoderDecoder):
     Returns:
       An input vector, an self.input_size length list of floats.
     """
-    current_note = None
-    is_attack = False
-    is_ascending = None
-    last_3_notes = collections.deque(maxlen=3)
-    sub_melody = magenta.music.Melody(events[:position + 1])
-    for note in sub_melody:
-      if note == MELODY_NO_EVENT:
-        is_attack = False
-      elif note == MELODY_NOTE_OFF:
-        current_note = None
-      else:
-        is_attack = True
-        current_note = note
-        if last_3_notes:
-          if note > last_3_notes[-1]:
-            is_ascending = True
-          if note < last_3_notes[-1]:
-            is_ascending = False
-        if note in last_3_notes:
-          last_3_notes.remove(note)
-        last_3_notes.append(note)
+    state = _MelodyState()
+    for note in events.prefix(position + 1):
+      state.update(note)
+    return self._state_to_input(state, events, position)
 
+  def _state_to_input(self, state, events, position):
+    """Returns the input vector for a position given the melody state there.
+
+    Args:
+      state: A _MelodyState object that has been updated with the events of
+          `events` up to and including `position`.
+      events: A magenta.music.Melody object.
+      position: An integer event position in the melody.
+
+    Returns:
+      An input vector, an self.input_size length list of floats.
+    """
     input_ = [0.0] * self.input_size
-    if current_note:
+    if state.current_note:
       # The pitch of current note if a note is playing.
-      input_[current_note - self.min_note] = 1.0
+      input_[state.current_note - self.min_note] = 1.0
       # A note is playing.
       input_[self.note_range] = 1.0
     else:
@@ -120,12 +184,12 @@ class MelodyEncoderDecoder(magenta.music.MelodyEncoderDecoder):
       input_[self.note_range + 1] = 1.0
 
     # The current event is the note-on event of the currently playing note.
-    if is_attack:
+    if state.is_attack:
       input_[self.note_range + 2] = 1.0
 
     # Whether the melody is currently ascending or descending.
-    if is_ascending is not None:
-      input_[self.note_range + 3] = 1.0 if is_ascending else -1.0
+    if state.is_ascending is not None:
+      input_[self.note_range + 3] = 1.0 if state.is_ascending else -1.0
 
     # Last event is repeating N bars ago.
     for i, lookback_distance in enumerate(LOOKBACK_DISTANCES):
@@ -135,31 +199,141 @@ class MelodyEncoderDecoder(magenta.music.MelodyEncoderDecoder):
         input_[self.note_range + 4 + i] = 1.0
 
     # Binary time counter giving the metric location of the *next* note.
-    n = len(sub_melody)
+    n = position + 1
     for i in range(NUM_BINARY_TIME_COUNTERS):
       input_[self.note_range + 6 + i] = 1.0 if (n / 2 ** i) % 2 else -1.0
 
     # The next event is the start of a bar.
-    if len(sub_melody) % STEPS_PER_BAR == 0:
+    if n % STEPS_PER_BAR == 0:
       input_[self.note_range + 13] = 1.0
 
     # The keys the current melody is in.
-    key_histogram = sub_melody.get_major_key_histogram()
-    max_val = max(key_histogram)
-    for i, key_val in enumerate(key_histogram):
-      if key_val == max_val:
-        input_[self.note_range + 14 + i] = 1.0
+    key_histogram = state.key_estimator.get_major_key_histogram()
+    max_val = key_histogram.max()
+    for i in np.flatnonzero(key_histogram == max_val):
+      input_[self.note_range + 14 + i] = 1.0
 
     # The keys the last 3 notes are in.
-    last_3_note_melody = magenta.music.Melody(list(last_3_notes))
-    key_histogram = last_3_note_melody.get_major_key_histogram()
-    max_val = max(key_histogram)
-    for i, key_val in enumerate(key_histogram):
-      if key_val == max_val:
-        input_[self.note_range + 14 + NOTES_PER_OCTAVE + i] = 1.0
+    key_histogram = state.last_3_notes_key_estimator.get_major_key_histogram()
+    max_val = key_histogram.max()
+    for i in np.flatnonzero(key_histogram == max_val):
+      input_[self.note_range + 14 + NOTES_PER_OCTAVE + i] = 1.0
 
     return input_
 
+  def encode_batch(self, events):
+    """Returns the inputs and labels for every position in the melody.
+
+    A vectorized equivalent of calling self.events_to_input and
+    self.events_to_label at each position. The melody state features are
+    computed with prefix scans over the whole melody instead of by updating a
+    _MelodyState one event at a time; only the last 3 distinct notes are
+    tracked with a loop, and that loop visits note-on events only.
+
+    Args:
+      events: A magenta.music.Melody object.
+
+    Returns:
+      inputs: A float32 array of shape [len(events), self.input_size].
+      labels: An int64 array of shape [len(events)].
+    """
+    events = np.asarray(events, dtype=np.int64)
+    num_events = len(events)
+    positions = np.arange(num_events)
+    inputs = np.zeros((num_events, self.input_size), dtype=np.float32)
+
+    def latest(mask):
+      # The index of the last position at or before each position where `mask`
+      # is True, or -1 if there is none.
+      return np.maximum.accumulate(np.where(mask, positions, -1))
+
+    note_positions = np.flatnonzero(events >= MIN_MIDI_PITCH)
+    notes = events[note_positions]
+
+    # The pitch of current note if a note is playing, otherwise silence.
+    last_change = latest(events != MELODY_NO_EVENT)
+    current_notes = np.where(last_change >= 0, events[last_change],
+                             MELODY_NOTE_OFF)
+    playing = current_notes > 0
+    inputs[positions[playing], current_notes[playing] - self.min_note] = 1.0
+    inputs[playing, self.note_range] = 1.0
+    inputs[~playing, self.note_range + 1] = 1.0
+
+    # The current event is the note-on event of the currently playing note.
+    # Note-off events leave this flag unchanged.
+    last_attack_change = latest(events != MELODY_NOTE_OFF)
+    inputs[(last_attack_change >= 0) &
+           (events[last_attack_change] >= MIN_MIDI_PITCH),
+           self.note_range + 2] = 1.0
+
+    # Whether the melody is currently ascending or descending.
+    directions = np.zeros(num_events, dtype=np.int64)
+    directions[note_positions[1:]] = np.sign(notes[1:] - notes[:-1])
+    last_direction = latest(directions != 0)
+    inputs[:, self.note_range + 3] = np.where(
+        last_direction >= 0, directions[last_direction], 0)
+
+    # Last event is repeating N bars ago.
+    repeats = [magenta.music.lookback_repeats(events, lookback_distance)
+               for lookback_distance in LOOKBACK_DISTANCES]
+    for i, repeat in enumerate(repeats):
+      inputs[repeat, self.note_range + 4 + i] = 1.0
+
+    # Binary time counter giving the metric location of the *next* note.
+    n = positions + 1
+    for i in range(NUM_BINARY_TIME_COUNTERS):
+      inputs[:, self.note_range + 6 + i] = np.where((n >> i) & 1, 1.0, -1.0)
+
+    # The next event is the start of a bar.
+    inputs[n % STEPS_PER_BAR == 0, self.note_range + 13] = 1.0
+
+    # The keys the current melody and the last 3 notes are in.
+    note_histograms = np.zeros((num_events, NOTES_PER_OCTAVE), dtype=np.int64)
+    note_histograms[note_positions, notes % NOTES_PER_OCTAVE] = 1
+    note_histograms = np.cumsum(note_histograms, axis=0)
+    last_3_notes = collections.deque(maxlen=3)
+    last_3_notes_histograms = np.zeros((num_events, NOTES_PER_OCTAVE),
+                                       dtype=np.int64)
+    for position, note in zip(note_positions, notes):
+      if note in last_3_notes:
+        last_3_notes.remove(note)
+      last_3_notes.append(note)
+      for last_note in last_3_notes:
+        last_3_notes_histograms[position, last_note % NOTES_PER_OCTAVE] += 1
+    last_note_position = latest(events >= MIN_MIDI_PITCH)
+    last_3_notes_histograms = np.where(
+        (last_note_position >= 0)[:, np.newaxis],
+        last_3_notes_histograms[last_note_position], 0)
+    for offset, histograms in ((14, note_histograms),
+                               (14 + NOTES_PER_OCTAVE,
+                                last_3_notes_histograms)):
+      key_histograms = np.dot(histograms, magenta.music.MAJOR_KEY_PROFILES)
+      inputs[:, self.note_range + offset:
+             self.note_range + offset + NOTES_PER_OCTAVE] = (
+                 key_histograms == key_histograms.max(axis=1)[:, np.newaxis])
+
+    labels = np.where(events == MELODY_NOTE_OFF, self.note_range + 1,
+                      np.where(events == MELODY_NO_EVENT, self.note_range,
+                               events - self.min_note))
+    for i, repeat in enumerate(repeats):
+      labels[repeat] = self.note_range + 2 + i
+    leading = positions < LOOKBACK_DISTANCES[-1]
+    labels[leading & (events == MELODY_NO_EVENT)] = (
+        self.note_range + len(LOOKBACK_DISTANCES) + 1)
+
+    return inputs, labels
+
+  def get_encoder_state(self, events):
+    """Returns an EncoderState that updates a _MelodyState per appended event.
+
+    Args:
+      events: A magenta.music.Melody object that will only be appended to.
+
+    Returns:
+      An EncoderState whose `get_input` takes constant time per new event.
+    """
+    return _EncoderState(self, events)
+
   def events_to_label(self, events, position):
     """Returns the label for the given position in the melody.
 
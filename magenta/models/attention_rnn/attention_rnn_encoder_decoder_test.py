@@ -18,6 +18,7 @@ import tensorflow as tf
 
 from magenta.models.attention_rnn import attention_rnn_encoder_decoder
 from magenta.music import melodies_lib
+from magenta.music import testing_lib
 
 NOTE_OFF = melodies_lib.MELODY_NOTE_OFF
 NO_EVENT = melodies_lib.MELODY_NO_EVENT
@@ -243,6 +244,66 @@ class AttentionRnnEncoderDecoderTest(tf.test.TestCase):
         [expected_inputs[-1:], expected_inputs[-1:]],
         melody_encoder_decoder.get_inputs_batch(melodies))
 
+  def testEncodeMatchesEventsToInput(self):
+    attention_rnn_encoder_decoder.MIN_NOTE = 48
+    attention_rnn_encoder_decoder.MAX_NOTE = 84
+    melody_encoder_decoder = (
+        attention_rnn_encoder_decoder.MelodyEncoderDecoder())
+
+    melody_events = ([48, NO_EVENT, 49, 83, NOTE_OFF] + [NO_EVENT] * 11 +
+                     [60, 62, 60, 64, 67, NOTE_OFF, 65, 64] + [NO_EVENT] * 8 +
+                     [48, NOTE_OFF, 49, 82])
+    melody = melodies_lib.Melody(melody_events)
+    sequence_example = melody_encoder_decoder.squash_and_encode(melody)
+
+    inputs = [list(feature.float_list.value) for feature in
+              sequence_example.feature_lists.feature_list['inputs'].feature]
+    labels = [feature.int64_list.value[0] for feature in
+              sequence_example.feature_lists.feature_list['labels'].feature]
+    self.assertEqual(len(melody_events) - 1, len(inputs))
+    for i in range(len(melody_events) - 1):
+      self.assertEqual(melody_encoder_decoder.events_to_input(melody, i),
+                       inputs[i])
+      self.assertEqual(melody_encoder_decoder.events_to_label(melody, i + 1),
+                       labels[i])
+
+  def testEncodeBatchMatchesEventsToInput(self):
+    attention_rnn_encoder_decoder.MIN_NOTE = 48
+    attention_rnn_encoder_decoder.MAX_NOTE = 84
+    melody_encoder_decoder = (
+        attention_rnn_encoder_decoder.MelodyEncoderDecoder())
+
+    melody_events = ([48, NO_EVENT, 49, 83, NOTE_OFF] + [NO_EVENT] * 11 +
+                     [60, 62, 60, 64, 67, NOTE_OFF, 65, 64] + [NO_EVENT] * 8 +
+                     [48, NOTE_OFF, 49, 82] + [NO_EVENT] * 12 +
+                     [60, 62, 60, 64, 67, NOTE_OFF, 65, 64])
+    melody = melodies_lib.Melody(melody_events)
+    testing_lib.assert_encode_batch_matches_events_to_input(
+        self, melody_encoder_decoder, melody)
+
+  def testEncoderStateMatchesEventsToInput(self):
+    attention_rnn_encoder_decoder.MIN_NOTE = 48
+    attention_rnn_encoder_decoder.MAX_NOTE = 84
+    melody_encoder_decoder = (
+        attention_rnn_encoder_decoder.MelodyEncoderDecoder())
+
+    melody_events = ([48, NO_EVENT, 49, 83, NOTE_OFF] + [NO_EVENT] * 11 +
+                     [60, 62, 60, 64, 67, NOTE_OFF, 65, 64] + [NO_EVENT] * 8 +
+                     [48, NOTE_OFF, 49, 82])
+    melody = melodies_lib.Melody(melody_events[:3])
+    encoder_state = melody_encoder_decoder.get_encoder_state(melody)
+    self.assertEqual(melody_encoder_decoder.events_to_input(melody, 2),
+                     encoder_state.get_input())
+    for event in melody_events[3:]:
+      melody.append_event(event)
+      self.assertEqual(
+          melody_encoder_decoder.events_to_input(melody, len(melody) - 1),
+          encoder_state.get_input())
+
+    melody.set_length(10)
+    with self.assertRaises(ValueError):
+      encoder_state.get_input()
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -14,6 +14,8 @@
 """A MelodyEncoderDecoder specific to the basic RNN model."""
 
 # internal imports
+import numpy as np
+
 import magenta
 
 NUM_SPECIAL_MELODY_EVENTS = magenta.music.NUM_SPECIAL_MELODY_EVENTS
@@ -115,6 +117,27 @@ class MelodyEncoderDecoder(magenta.music.MelodyEncoderDecoder):
     """
     return self.melody_event_to_model_event(events[position])
 
+  def encode_batch(self, events):
+    """Returns the one-hot inputs and labels for every position in the melody.
+
+    A vectorized equivalent of calling self.events_to_input and
+    self.events_to_label at each position.
+
+    Args:
+      events: A Melody object.
+
+    Returns:
+      inputs: A float32 array of shape [len(events), self.input_size].
+      labels: An int64 array of shape [len(events)].
+    """
+    events = np.asarray(events, dtype=np.int64)
+    labels = np.where(events < 0,
+                      events + NUM_SPECIAL_MELODY_EVENTS,
+                      events - self.min_note + NUM_SPECIAL_MELODY_EVENTS)
+    inputs = np.zeros((len(labels), self.input_size), dtype=np.float32)
+    inputs[np.arange(len(labels)), labels] = 1.0
+    return inputs, labels
+
   def class_index_to_event(self, class_index, events):
     """Returns the melody event for the given class index.
 
@@ -18,6 +18,7 @@ import tensorflow as tf
 
 from magenta.models.basic_rnn import basic_rnn_encoder_decoder
 from magenta.music import melodies_lib
+from magenta.music import testing_lib
 
 NOTE_OFF = melodies_lib.MELODY_NOTE_OFF
 NO_EVENT = melodies_lib.MELODY_NO_EVENT
@@ -125,6 +126,19 @@ class BasicRnnEncoderDecoderTest(tf.test.TestCase):
         expected_last_event_inputs_batch,
         melody_encoder_decoder.get_inputs_batch(melodies))
 
+  def testEncodeBatchMatchesEventsToInput(self):
+    basic_rnn_encoder_decoder.MIN_NOTE = 48
+    basic_rnn_encoder_decoder.MAX_NOTE = 84
+    melody_encoder_decoder = basic_rnn_encoder_decoder.MelodyEncoderDecoder()
+
+    melody_events = ([48, NO_EVENT, 49, 83, NOTE_OFF] + [NO_EVENT] * 11 +
+                     [60, 62, 60, 64, 67, NOTE_OFF, 65, 64] + [NO_EVENT] * 8 +
+                     [48, NOTE_OFF, 49, 82] + [NO_EVENT] * 12 +
+                     [60, 62, 60, 64, 67, NOTE_OFF, 65, 64])
+    melody = melodies_lib.Melody(melody_events)
+    testing_lib.assert_encode_batch_matches_events_to_input(
+        self, melody_encoder_decoder, melody)
+
 
 if __name__ == '__main__':
   tf.test.main()
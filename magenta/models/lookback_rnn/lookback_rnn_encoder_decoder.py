@@ -14,6 +14,8 @@
 """A MelodyEncoderDecoder specific to the lookback RNN model."""
 
 # internal imports
+import numpy as np
+
 import magenta
 
 NUM_SPECIAL_MELODY_EVENTS = magenta.music.NUM_SPECIAL_MELODY_EVENTS
@@ -186,6 +188,128 @@ class MelodyEncoderDecoder(magenta.music.MelodyEncoderDecoder):
     # specific event.
     return self.melody_event_to_model_event(events[position])
 
+  def _model_events(self, melody_events):
+    """A vectorized self.melody_event_to_model_event for an array of events."""
+    return np.where(melody_events < 0,
+                    melody_events + NUM_SPECIAL_MELODY_EVENTS,
+                    melody_events - self.min_note + NUM_SPECIAL_MELODY_EVENTS)
+
+  def _next_lookback_events(self, events, lookback_distance):
+    """Returns the event of the next step `lookback_distance` steps ago.
+
+    Args:
+      events: An int64 array of melody events.
+      lookback_distance: The lookback distance in steps.
+
+    Returns:
+      An int64 array with, at each position, the event that the next step
+      would repeat from `lookback_distance` steps earlier, or MELODY_NO_EVENT
+      if that is before the start of the melody.
+    """
+    num_events = len(events)
+    lookback_events = np.full(num_events, MELODY_NO_EVENT, dtype=np.int64)
+    if lookback_distance - 1 < num_events:
+      lookback_events[lookback_distance - 1:] = (
+          events[:num_events - lookback_distance + 1])
+    return lookback_events
+
+  def encode_batch(self, events):
+    """Returns the inputs and labels for every position in the melody.
+
+    A vectorized equivalent of calling self.events_to_input and
+    self.events_to_label at each position.
+
+    Args:
+      events: A magenta.music.Melody object.
+
+    Returns:
+      inputs: A float32 array of shape [len(events), self.input_size].
+      labels: An int64 array of shape [len(events)].
+    """
+    events = np.asarray(events, dtype=np.int64)
+    num_events = len(events)
+    positions = np.arange(num_events)
+    inputs = np.zeros((num_events, self.input_size), dtype=np.float32)
+    model_events = self._model_events(events)
+
+    # Last event.
+    inputs[positions, model_events] = 1.0
+
+    # Next event if repeating N positions ago.
+    for i, lookback_distance in enumerate(LOOKBACK_DISTANCES):
+      lookback_events = self._next_lookback_events(events, lookback_distance)
+      inputs[positions,
+             i * self.num_model_events +
+             self._model_events(lookback_events)] = 1.0
+
+    # Binary time counter giving the metric location of the *next* note.
+    n = positions + 1
+    for i in range(NUM_BINARY_TIME_COUNTERS):
+      inputs[:, 3 * self.num_model_events + i] = np.where(
+          (n >> i) & 1, 1.0, -1.0)
+
+    # Last event is repeating N bars ago.
+    repeats = [magenta.music.lookback_repeats(events, lookback_distance)
+               for lookback_distance in LOOKBACK_DISTANCES]
+    for i, repeat in enumerate(repeats):
+      inputs[repeat, 3 * self.num_model_events + 5 + i] = 1.0
+
+    # More distant repeats take precedence over closer repeats, and leading
+    # no-events are labeled as repeating the most distant lookback.
+    labels = model_events
+    for i, repeat in enumerate(repeats):
+      labels[repeat] = self.num_model_events + i
+    leading = positions < LOOKBACK_DISTANCES[-1]
+    labels[leading & (events == MELODY_NO_EVENT)] = (
+        self.num_model_events + len(LOOKBACK_DISTANCES) - 1)
+
+    return inputs, labels
+
+  def encode_transpositions_batch(self, melody, transpositions):
+    """Returns the inputs and labels of several transpositions of a melody.
+
+    The binary time counters, the repeat flags and the repeat labels don't
+    depend on the key, so the melody is encoded only once. Each
+    transposition then moves the one-hot events and labels of its notes.
+
+    Args:
+      melody: A magenta.music.Melody object.
+      transpositions: A list of integer transposition amounts in half steps.
+          Every transposed note must be in [`min_note`, `max_note`).
+
+    Returns:
+      inputs: A float32 array of shape
+          [len(transpositions), len(melody), self.input_size].
+      labels: An int64 array of shape [len(transpositions), len(melody)].
+    """
+    events = np.asarray(melody, dtype=np.int64)
+    transpositions = np.asarray(transpositions, dtype=np.int64)
+    base_inputs, base_labels = self.encode_batch(melody)
+    inputs = np.tile(base_inputs, (len(transpositions), 1, 1))
+    rows = np.arange(len(transpositions))[:, np.newaxis]
+
+    # The current event, and the next event if repeating N positions ago, at
+    # the same offsets as in encode_batch. The one-hot notes are all cleared
+    # before any is set, since they can share columns.
+    one_hot_notes = []
+    for offset, one_hot_events in (
+        [(0, events)] +
+        [(i * self.num_model_events,
+          self._next_lookback_events(events, lookback_distance))
+         for i, lookback_distance in enumerate(LOOKBACK_DISTANCES)]):
+      positions = np.nonzero(one_hot_events >= 0)[0]
+      columns = offset + self._model_events(one_hot_events[positions])
+      inputs[:, positions, columns] = 0.0
+      one_hot_notes.append((positions, columns))
+    for positions, columns in one_hot_notes:
+      inputs[rows, positions, columns + transpositions[:, np.newaxis]] = 1.0
+
+    # Notes that aren't labeled as repeats.
+    is_note_label = ((base_labels >= NUM_SPECIAL_MELODY_EVENTS) &
+                     (base_labels < self.num_model_events))
+    labels = base_labels + np.outer(transpositions, is_note_label)
+    return inputs, labels
+
   def class_index_to_event(self, class_index, events):
     """Returns the melody event for the given class index.
 
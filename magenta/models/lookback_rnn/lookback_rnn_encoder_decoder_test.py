@@ -18,6 +18,7 @@ import tensorflow as tf
 
 from magenta.models.lookback_rnn import lookback_rnn_encoder_decoder
 from magenta.music import melodies_lib
+from magenta.music import testing_lib
 
 NOTE_OFF = melodies_lib.MELODY_NOTE_OFF
 NO_EVENT = melodies_lib.MELODY_NO_EVENT
@@ -264,6 +265,47 @@ class LookbackRnnEncoderDecoderTest(tf.test.TestCase):
         [expected_inputs[-1:], expected_inputs[-1:]],
         melody_encoder_decoder.get_inputs_batch(melodies))
 
+  def testEncodeBatchMatchesEventsToInput(self):
+    lookback_rnn_encoder_decoder.MIN_NOTE = 48
+    lookback_rnn_encoder_decoder.MAX_NOTE = 84
+    melody_encoder_decoder = lookback_rnn_encoder_decoder.MelodyEncoderDecoder()
+
+    melody_events = ([48, NO_EVENT, 49, 83, NOTE_OFF] + [NO_EVENT] * 11 +
+                     [60, 62, 60, 64, 67, NOTE_OFF, 65, 64] + [NO_EVENT] * 8 +
+                     [48, NOTE_OFF, 49, 82] + [NO_EVENT] * 12 +
+                     [60, 62, 60, 64, 67, NOTE_OFF, 65, 64])
+    melody = melodies_lib.Melody(melody_events)
+    testing_lib.assert_encode_batch_matches_events_to_input(
+        self, melody_encoder_decoder, melody)
+
+  def testEncodeBatchShortMelodies(self):
+    lookback_rnn_encoder_decoder.MIN_NOTE = 48
+    lookback_rnn_encoder_decoder.MAX_NOTE = 84
+    melody_encoder_decoder = lookback_rnn_encoder_decoder.MelodyEncoderDecoder()
+
+    # Lengths around the lookback distances exercise the edges of the shifted
+    # event arrays.
+    melody_events = ([60, NO_EVENT, 62, NOTE_OFF] * 4 + [60, 64] * 8 +
+                     [NO_EVENT] * 3)
+    for length in [0, 1, 15, 16, 17, 31, 32, 33, len(melody_events)]:
+      testing_lib.assert_encode_batch_matches_events_to_input(
+          self, melody_encoder_decoder,
+          melodies_lib.Melody(melody_events[:length]))
+
+  def testEncodeTranspositions(self):
+    lookback_rnn_encoder_decoder.MIN_NOTE = 48
+    lookback_rnn_encoder_decoder.MAX_NOTE = 84
+    melody_encoder_decoder = lookback_rnn_encoder_decoder.MelodyEncoderDecoder()
+
+    melody_events = ([50, NO_EVENT, 51, 80, NOTE_OFF] + [NO_EVENT] * 11 +
+                     [60, 62, 60, 64, 67, NOTE_OFF, 65, 64] + [NO_EVENT] * 8 +
+                     [50, NOTE_OFF, 51, 80] + [NO_EVENT] * 12 +
+                     [60, 62, 60, 64, 67, NOTE_OFF, 65, 64])
+    for length in [0, 1, 17, 33, len(melody_events)]:
+      testing_lib.assert_encode_transpositions_matches_encode_batch(
+          self, melody_encoder_decoder,
+          melodies_lib.Melody(melody_events[:length]), [-2, 0, 1, 3])
+
 
 if __name__ == '__main__':
   tf.test.main()
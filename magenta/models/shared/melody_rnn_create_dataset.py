@@ -17,15 +17,19 @@ This script will extract melodies from NoteSequence protos and save them to
 TensorFlow's SequenceExample protos for input to the melody RNN models.
 """
 
+import hashlib
 import os
+import sqlite3
 
 # internal imports
+import numpy as np
 import tensorflow as tf
 import magenta
 
 from magenta.pipelines import dag_pipeline
 from magenta.pipelines import pipeline
 from magenta.pipelines import pipelines_common
+from magenta.pipelines import statistics
 from magenta.protobuf import music_pb2
 
 
@@ -39,15 +43,161 @@ tf.app.flags.DEFINE_string('output_dir', None,
 tf.app.flags.DEFINE_float('eval_ratio', 0.0,
                           'Fraction of input to set aside for eval set. '
                           'Partition is randomly selected.')
+tf.app.flags.DEFINE_boolean('sparse_inputs', False,
+                            'If true, only the nonzero elements of each input '
+                            'vector are written, which makes the TFRecord '
+                            'files smaller and faster to parse. Models must '
+                            'then be trained with the sparse_inputs hparam '
+                            'set to true.')
+tf.app.flags.DEFINE_string('encoding_cache', None,
+                           'Path to an sqlite file caching the encoded '
+                           'melodies. Melodies encoded by an earlier run with '
+                           'the same encoder are read from the cache instead '
+                           'of being encoded again.')
+tf.app.flags.DEFINE_integer('window_bars', 0,
+                            'If positive, melodies are sliced into windows of '
+                            'this many bars, so that every training example '
+                            'has the same length. Melodies shorter than a '
+                            'window are discarded.')
+tf.app.flags.DEFINE_integer('window_stride_bars', 0,
+                            'The number of bars between the starts of '
+                            'consecutive windows. Defaults to window_bars.')
+tf.app.flags.DEFINE_integer('pack_length', 0,
+                            'If positive, the encoded melodies in each output '
+                            'file are packed into SequenceExamples of this '
+                            'many steps, so that training batches contain '
+                            'little padding. Models must then be trained with '
+                            'the packed hparam set to true.')
+tf.app.flags.DEFINE_integer('num_workers', 1,
+                            'The number of processes in which to run the '
+                            'pipeline. If greater than 1, the order of the '
+                            'SequenceExamples in the output files is not '
+                            'deterministic.')
+tf.app.flags.DEFINE_boolean('detailed_statistics', True,
+                            'If false, only counter statistics are computed, '
+                            'and histograms such as melody lengths are '
+                            'skipped.')
 tf.app.flags.DEFINE_string('log', 'INFO',
                            'The threshold for what messages will be logged '
                            'DEBUG, INFO, WARN, ERROR, or FATAL.')
 
 
+# sqlite limits the number of parameters in a single query.
+_MAX_KEYS_PER_QUERY = 500
+
+
+class EncodedMelodyCache(object):
+  """A persistent cache of serialized SequenceExamples, stored with sqlite.
+
+  Entries are keyed by strings computed by `EncoderPipeline`, and every entry
+  is committed as soon as it is added so that a crashed run loses nothing.
+  The database is opened on first use in each process, so a cache may be
+  created before `pipeline.run_pipeline_parallel` forks its workers.
+  """
+
+  def __init__(self, path):
+    """Opens or creates the cache.
+
+    Args:
+      path: Path to the sqlite database file.
+    """
+    self._path = path
+    self._connection = None
+    self._connection_pid = None
+
+  def _connect(self):
+    """Returns this process's connection to the cache, opening it if needed.
+
+    A connection cannot be used by processes forked after it was opened, so
+    each worker process of `pipeline.run_pipeline_parallel` opens its own.
+
+    Returns:
+      A sqlite3.Connection.
+    """
+    if self._connection_pid != os.getpid():
+      # Wait for other processes' writes rather than failing.
+      self._connection = sqlite3.connect(self._path, timeout=60.0,
+                                         isolation_level=None)
+      self._connection_pid = os.getpid()
+      # Write-ahead logging lets readers proceed while another process writes.
+      self._connection.execute('PRAGMA journal_mode = WAL')
+      # Entries only need to survive the process crashing, not the machine.
+      self._connection.execute('PRAGMA synchronous = OFF')
+      self._connection.execute(
+          'CREATE TABLE IF NOT EXISTS examples '
+          '(key TEXT PRIMARY KEY, serialized BLOB NOT NULL)')
+    return self._connection
+
+  def get(self, key):
+    """Returns the serialized SequenceExample for `key`, or None."""
+    row = self._connect().execute(
+        'SELECT serialized FROM examples WHERE key = ?', (key,)).fetchone()
+    return bytes(row[0]) if row else None
+
+  def put(self, key, serialized):
+    """Stores the serialized SequenceExample for `key`."""
+    self._connect().execute(
+        'INSERT OR REPLACE INTO examples VALUES (?, ?)',
+        (key, sqlite3.Binary(serialized)))
+
+  def get_many(self, keys):
+    """Returns the serialized SequenceExamples for many keys at once.
+
+    Args:
+      keys: A list of keys.
+
+    Returns:
+      A dictionary mapping each of `keys` found in the cache to its serialized
+      SequenceExample.
+    """
+    found = {}
+    for i in range(0, len(keys), _MAX_KEYS_PER_QUERY):
+      chunk = keys[i:i + _MAX_KEYS_PER_QUERY]
+      rows = self._connect().execute(
+          'SELECT key, serialized FROM examples WHERE key IN (%s)' %
+          ','.join('?' * len(chunk)), chunk)
+      found.update((key, bytes(serialized)) for key, serialized in rows)
+    return found
+
+  def put_many(self, entries):
+    """Stores many serialized SequenceExamples in a single transaction.
+
+    Args:
+      entries: A dictionary mapping keys to serialized SequenceExamples.
+    """
+    connection = self._connect()
+    connection.execute('BEGIN')
+    try:
+      connection.executemany(
+          'INSERT OR REPLACE INTO examples VALUES (?, ?)',
+          [(key, sqlite3.Binary(serialized))
+           for key, serialized in entries.items()])
+    except Exception:
+      connection.execute('ROLLBACK')
+      raise
+    connection.execute('COMMIT')
+
+  def close(self):
+    """Closes this process's connection to the cache, if it has one.
+
+    A connection inherited from the process that forked this one is left for
+    that process to close.
+    """
+    if self._connection_pid == os.getpid():
+      self._connection.close()
+    self._connection = None
+    self._connection_pid = None
+
+
 class EncoderPipeline(pipeline.Pipeline):
-  """A Module that converts monophonic melodies to a model specific encoding."""
+  """A Module that converts monophonic melodies to a model specific encoding.
 
-  def __init__(self, melody_encoder_decoder):
+  The SequenceExamples are output already serialized, since the dataset only
+  writes them to disk.
+  """
+
+  def __init__(self, melody_encoder_decoder, sparse_inputs=False,
+               cache=None):
     """Constructs a EncoderPipeline.
 
     A magenta.music.MelodyEncoderDecoder is needed to provide the
@@ -55,18 +205,84 @@ class EncoderPipeline(pipeline.Pipeline):
 
     Args:
       melody_encoder_decoder: A magenta.music.MelodyEncoderDecoder object.
+      sparse_inputs: If True, only the nonzero elements of each input vector
+          are stored in the output SequenceExamples.
+      cache: An optional EncodedMelodyCache. Melodies found in the cache are
+          not encoded again, and newly encoded melodies are added to it.
+          Entries are keyed by the encoder-decoder's class, `version` and
+          configuration as well as the melody, so bumping the version
+          invalidates them.
     """
     super(EncoderPipeline, self).__init__(
         input_type=magenta.music.Melody,
-        output_type=tf.train.SequenceExample)
+        output_type=magenta.common.SerializedSequenceExample)
     self.melody_encoder_decoder = melody_encoder_decoder
+    self.sparse_inputs = sparse_inputs
+    self.cache = cache
+    encoder_decoder_type = type(melody_encoder_decoder)
+    self._cache_key_prefix = repr((
+        encoder_decoder_type.__module__, encoder_decoder_type.__name__,
+        melody_encoder_decoder.version, melody_encoder_decoder.min_note, melody_encoder_decoder.max_note,
+        melody_encoder_decoder.transpose_to_key,
+        melody_encoder_decoder.input_size, melody_encoder_decoder.num_classes,
+        bool(sparse_inputs)))
+
+  def _cache_key(self, melody):
+    """Returns the cache key of a melody under this pipeline's encoding."""
+    key = hashlib.sha1(self._cache_key_prefix.encode('utf-8'))
+    key.update(np.asarray(melody, dtype=np.int8).tobytes())
+    return key.hexdigest()
 
   def transform(self, melody):
-    encoded = self.melody_encoder_decoder.squash_and_encode(melody)
+    if self.cache is None:
+      return [self.melody_encoder_decoder.squash_and_encode(
+          melody, sparse_inputs=self.sparse_inputs, serialized=True)]
+
+    key = self._cache_key(melody)
+    serialized = self.cache.get(key)
+    if serialized is None:
+      encoded = self.melody_encoder_decoder.squash_and_encode(
+          melody, sparse_inputs=self.sparse_inputs, serialized=True)
+      self.cache.put(key, encoded.SerializeToString())
+      self._set_stats([statistics.Counter('encoding_cache_misses', 1)])
+    else:
+      encoded = magenta.common.SerializedSequenceExample(serialized)
+      self._set_stats([statistics.Counter('encoding_cache_hits', 1)])
     return [encoded]
 
-  def get_stats(self):
-    return {}
+  def transform_batch(self, melodies):
+    if self.cache is None:
+      return super(EncoderPipeline, self).transform_batch(melodies)
+
+    # Look up the whole batch in one query, and add all newly encoded
+    # melodies to the cache in one transaction.
+    keys = [self._cache_key(melody) for melody in melodies]
+    cached = self.cache.get_many(list(set(keys)))
+    new_entries = {}
+    outputs = []
+    for key, melody in zip(keys, melodies):
+      serialized = cached.get(key)
+      if serialized is None:
+        serialized = new_entries.get(key)
+      if serialized is None:
+        encoded = self.melody_encoder_decoder.squash_and_encode(
+            melody, sparse_inputs=self.sparse_inputs, serialized=True)
+        new_entries[key] = encoded.SerializeToString()
+      else:
+        encoded = magenta.common.SerializedSequenceExample(serialized)
+      outputs.append([encoded])
+    if new_entries:
+      self.cache.put_many(new_entries)
+
+    num_misses = len(new_entries)
+    stats = []
+    if num_misses:
+      stats.append(statistics.Counter('encoding_cache_misses', num_misses))
+    if num_misses < len(melodies):
+      stats.append(statistics.Counter('encoding_cache_hits',
+                                      len(melodies) - num_misses))
+    self._set_stats(stats)
+    return outputs
 
 
 def get_pipeline(melody_encoder_decoder):
@@ -82,9 +298,13 @@ def get_pipeline(melody_encoder_decoder):
   melody_extractor = pipelines_common.MelodyExtractor(
       min_bars=7, min_unique_pitches=5,
       gap_bars=1.0, ignore_polyphonic_notes=False)
-  encoder_pipeline = EncoderPipeline(melody_encoder_decoder)
+  cache = (EncodedMelodyCache(os.path.expanduser(FLAGS.encoding_cache))
+           if FLAGS.encoding_cache else None)
+  encoder_pipeline = EncoderPipeline(melody_encoder_decoder,
+                                     sparse_inputs=FLAGS.sparse_inputs,
+                                     cache=cache)
   partitioner = pipelines_common.RandomPartition(
-      tf.train.SequenceExample,
+      magenta.common.SerializedSequenceExample,
       ['eval_melodies', 'training_melodies'],
       [FLAGS.eval_ratio])
 
@@ -93,14 +313,60 @@ def get_pipeline(melody_encoder_decoder):
          encoder_pipeline: melody_extractor,
          partitioner: encoder_pipeline,
          dag_pipeline.Output(): partitioner}
+  if FLAGS.window_bars > 0:
+    windower = pipelines_common.MelodyWindower(
+        window_bars=FLAGS.window_bars,
+        stride_bars=FLAGS.window_stride_bars or None)
+    dag[windower] = melody_extractor
+    dag[encoder_pipeline] = windower
   return dag_pipeline.DAGPipeline(dag)
 
 
+def pack_dataset(path, packed_length):
+  """Packs the SequenceExamples in a TFRecord file in place.
+
+  Args:
+    path: The path to a TFRecord file of tf.train.SequenceExamples.
+    packed_length: The number of steps in each packed SequenceExample.
+
+  Returns:
+    A (number of SequenceExamples, number of packed SequenceExamples) tuple.
+  """
+  counts = [0, 0]
+
+  def read_sequence_examples():
+    for serialized in tf.python_io.tf_record_iterator(path):
+      counts[0] += 1
+      yield tf.train.SequenceExample.FromString(serialized)
+
+  packed_path = path + '.packing'
+  with tf.python_io.TFRecordWriter(packed_path) as writer:
+    for packed in magenta.common.pack_sequence_examples(
+        read_sequence_examples(), packed_length):
+      counts[1] += 1
+      writer.write(packed.SerializeToString())
+  tf.gfile.Rename(packed_path, path, overwrite=True)
+  return tuple(counts)
+
+
 def run_from_flags(pipeline_instance):
   tf.logging.set_verbosity(FLAGS.log)
+  statistics.set_verbosity(statistics.DETAILED if FLAGS.detailed_statistics
+                           else statistics.BASIC)
   FLAGS.input = os.path.expanduser(FLAGS.input)
   FLAGS.output_dir = os.path.expanduser(FLAGS.output_dir)
-  pipeline.run_pipeline_serial(
-      pipeline_instance,
-      pipeline.tf_record_iterator(FLAGS.input, pipeline_instance.input_type),
-      FLAGS.output_dir)
+  input_iterator = pipeline.tf_record_iterator(
+      FLAGS.input, pipeline_instance.input_type)
+  if FLAGS.num_workers > 1:
+    pipeline.run_pipeline_parallel(
+        pipeline_instance, input_iterator, FLAGS.output_dir,
+        num_workers=FLAGS.num_workers)
+  else:
+    pipeline.run_pipeline_serial(
+        pipeline_instance, input_iterator, FLAGS.output_dir)
+  if FLAGS.pack_length > 0:
+    for name in pipeline_instance.output_type_as_dict:
+      path = os.path.join(FLAGS.output_dir, name + '.tfrecord')
+      num_examples, num_packed = pack_dataset(path, FLAGS.pack_length)
+      tf.logging.info('Packed %d SequenceExamples into %d in %s',
+                      num_examples, num_packed, path)
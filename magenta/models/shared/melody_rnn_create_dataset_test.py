@@ -13,17 +13,25 @@
 # limitations under the License.
 """Tests for melody_rnn_create_dataset."""
 
+import os
+import sqlite3
+import tempfile
+
 # internal imports
 import tensorflow as tf
 import magenta
 
 from magenta.models.shared import melody_rnn_create_dataset
+from magenta.pipelines import pipeline
 from magenta.pipelines import pipelines_common
 from magenta.protobuf import music_pb2
 
 
 FLAGS = tf.app.flags.FLAGS
 
+NOTE_OFF = magenta.music.MELODY_NOTE_OFF
+NO_EVENT = magenta.music.MELODY_NO_EVENT
+
 
 class MelodyRNNPipelineTest(tf.test.TestCase):
 
@@ -50,7 +58,7 @@ class MelodyRNNPipelineTest(tf.test.TestCase):
     quantized = quantizer.transform(note_sequence)[0]
     print quantized.tracks
     melody = melody_extractor.transform(quantized)[0]
-    one_hot = one_hot_encoder.squash_and_encode(melody)
+    one_hot = one_hot_encoder.squash_and_encode(melody, serialized=True)
     print one_hot
     expected_result = {'training_melodies': [one_hot], 'eval_melodies': []}
 
@@ -58,6 +66,142 @@ class MelodyRNNPipelineTest(tf.test.TestCase):
     result = pipeline_inst.transform(note_sequence)
     self.assertEqual(expected_result, result)
 
+  def testEncoderPipelineCache(self):
+    cache = melody_rnn_create_dataset.EncodedMelodyCache(
+        os.path.join(tempfile.mkdtemp(dir=self.get_temp_dir()), 'cache.db'))
+    one_hot_encoder = magenta.music.OneHotMelodyEncoderDecoder(0, 127, 0)
+    encoder_pipeline = melody_rnn_create_dataset.EncoderPipeline(
+        one_hot_encoder, cache=cache)
+    melody_events = [12, NO_EVENT, 11, NOTE_OFF, 40, 55, 53]
+    expected = one_hot_encoder.squash_and_encode(
+        magenta.music.Melody(melody_events), serialized=True)
+
+    result = encoder_pipeline.transform(magenta.music.Melody(melody_events))
+    self.assertEqual([expected], result)
+    self.assertEqual(
+        ['EncoderPipeline_encoding_cache_misses'],
+        [stat.name for stat in encoder_pipeline.get_stats()])
+
+    result = encoder_pipeline.transform(magenta.music.Melody(melody_events))
+    self.assertEqual([expected], result)
+    self.assertEqual(
+        ['EncoderPipeline_encoding_cache_hits'],
+        [stat.name for stat in encoder_pipeline.get_stats()])
+
+    # A different encoder configuration does not reuse the cached encoding.
+    encoder_pipeline = melody_rnn_create_dataset.EncoderPipeline(
+        one_hot_encoder, sparse_inputs=True, cache=cache)
+    encoder_pipeline.transform(magenta.music.Melody(melody_events))
+    self.assertEqual(
+        ['EncoderPipeline_encoding_cache_misses'],
+        [stat.name for stat in encoder_pipeline.get_stats()])
+
+    # Neither does a new version of the encoding.
+    one_hot_encoder.version += 1
+    encoder_pipeline = melody_rnn_create_dataset.EncoderPipeline(
+        one_hot_encoder, cache=cache)
+    encoder_pipeline.transform(magenta.music.Melody(melody_events))
+    self.assertEqual(
+        ['EncoderPipeline_encoding_cache_misses'],
+        [stat.name for stat in encoder_pipeline.get_stats()])
+    cache.close()
+
+  def testEncoderPipelineCacheBatch(self):
+    cache = melody_rnn_create_dataset.EncodedMelodyCache(
+        os.path.join(tempfile.mkdtemp(dir=self.get_temp_dir()), 'cache.db'))
+    one_hot_encoder = magenta.music.OneHotMelodyEncoderDecoder(0, 127, 0)
+    encoder_pipeline = melody_rnn_create_dataset.EncoderPipeline(
+        one_hot_encoder, cache=cache)
+    melodies = [magenta.music.Melody(events)
+                for events in [[12, NO_EVENT, 11], [40, 55, 53], [12, 13]]]
+    expected = [[one_hot_encoder.squash_and_encode(melody, serialized=True)]
+                for melody in melodies]
+
+    encoder_pipeline.transform(melodies[0])
+    result = encoder_pipeline.transform_batch(melodies + melodies[1:2])
+    self.assertEqual(expected + expected[1:2], result)
+    stats = dict((stat.name, stat.count)
+                 for stat in encoder_pipeline.get_stats())
+    self.assertEqual({'EncoderPipeline_encoding_cache_hits': 2,
+                      'EncoderPipeline_encoding_cache_misses': 2}, stats)
+
+    self.assertEqual(expected, encoder_pipeline.transform_batch(melodies))
+    self.assertEqual(
+        ['EncoderPipeline_encoding_cache_hits'],
+        [stat.name for stat in encoder_pipeline.get_stats()])
+    cache.close()
+
+  def testEncodedMelodyCacheParallel(self):
+    FLAGS.eval_ratio = 0.0
+    note_sequences = []
+    for i in range(8):
+      note_sequence = music_pb2.NoteSequence()
+      note_sequence.time_signatures.add(numerator=4, denominator=4)
+      note_sequence.tempos.add(qpm=120)
+      magenta.music.testing_lib.add_track_to_sequence(
+          note_sequence, 0,
+          [(12 + i, 100, 0.00, 2.0), (11, 55, 2.1, 5.0), (40, 45, 5.1, 8.0),
+           (55, 120, 8.1, 11.0), (53 + i, 99, 11.1, 14.1)])
+      note_sequences.append(note_sequence)
+    one_hot_encoder = magenta.music.OneHotMelodyEncoderDecoder(0, 127, 0)
+
+    def run(output_dir, num_workers):
+      pipeline_inst = melody_rnn_create_dataset.get_pipeline(one_hot_encoder)
+      if num_workers > 1:
+        pipeline.run_pipeline_parallel(pipeline_inst, iter(note_sequences),
+                                       output_dir, num_workers=num_workers)
+      else:
+        pipeline.run_pipeline_serial(pipeline_inst, iter(note_sequences),
+                                     output_dir)
+      return sorted(tf.python_io.tf_record_iterator(
+          os.path.join(output_dir, 'training_melodies.tfrecord')))
+
+    FLAGS.encoding_cache = ''
+    expected = run(tempfile.mkdtemp(dir=self.get_temp_dir()), 1)
+    self.assertTrue(expected)
+
+    # Each worker opens its own connection to the cache, so the second run
+    # reads what the workers of the first run wrote.
+    cache_path = os.path.join(tempfile.mkdtemp(dir=self.get_temp_dir()),
+                              'cache.db')
+    FLAGS.encoding_cache = cache_path
+    try:
+      for _ in range(2):
+        self.assertEqual(
+            expected, run(tempfile.mkdtemp(dir=self.get_temp_dir()), 2))
+    finally:
+      FLAGS.encoding_cache = ''
+    connection = sqlite3.connect(cache_path)
+    self.assertEqual(
+        len(expected),
+        connection.execute('SELECT COUNT(*) FROM examples').fetchone()[0])
+    connection.close()
+
+    # Closing a cache that was never used, or closing it twice, is harmless.
+    cache = melody_rnn_create_dataset.EncodedMelodyCache(cache_path)
+    cache.close()
+    self.assertTrue(cache.get(''.join(['0'] * 40)) is None)
+    cache.close()
+    cache.close()
+
+  def testPackDataset(self):
+    path = os.path.join(tempfile.mkdtemp(dir=self.get_temp_dir()),
+                        'training_melodies.tfrecord')
+    writer = tf.python_io.TFRecordWriter(path)
+    for length in [3, 4, 2]:
+      writer.write(magenta.common.make_sequence_example(
+          [[1.0]] * length, [0] * length).SerializeToString())
+    writer.close()
+
+    self.assertEqual((3, 2), melody_rnn_create_dataset.pack_dataset(path, 6))
+    packed = [tf.train.SequenceExample.FromString(serialized)
+              for serialized in tf.python_io.tf_record_iterator(path)]
+    self.assertEqual(
+        [[1, 1, 1, 0, 0, 0], [1, 1, 1, 1, 2, 2]],
+        [[feature.int64_list.value[0] for feature in
+          example.feature_lists.feature_list['segment_ids'].feature]
+         for example in packed])
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -17,10 +17,91 @@
 import tensorflow as tf
 import magenta
 
+from tensorflow.python.util import nest
+
+
+class _StateResetWrapper(tf.nn.rnn_cell.RNNCell):
+  """Zeroes the state of a cell at the steps where a new sequence starts.
+
+  The last column of each input is a reset flag, 1.0 at the first step of a
+  sequence and 0.0 elsewhere. It is removed before the inputs are passed to the
+  wrapped cell. The wrapper has no variables of its own, so a model trained
+  with it can be run without it.
+  """
+
+  def __init__(self, cell):
+    self._cell = cell
+
+  @property
+  def state_size(self):
+    return self._cell.state_size
+
+  @property
+  def output_size(self):
+    return self._cell.output_size
+
+  def __call__(self, inputs, state, scope=None):
+    inputs, resets = inputs[:, :-1], inputs[:, -1:]
+    keep = 1.0 - resets
+    state = nest.pack_sequence_as(
+        state, [substate * keep for substate in nest.flatten(state)])
+    return self._cell(inputs, state, scope)
+
+
+def _factorized_logits(outputs_flat, first_classes, class_factors,
+                       conditional):
+  """Returns the logits of the two output heads of a factorized model.
+
+  Labels are factored as `first + num_first_classes * second`, like the
+  labels of magenta.music.LeadSheetProductEncoderDecoder. One linear head
+  predicts the first component (e.g. the melody event) and another predicts
+  the second (e.g. the chord), so the output layer is `num_first +
+  num_second` units wide and the joint distribution over all `num_first *
+  num_second` labels is never computed.
+
+  Args:
+    outputs_flat: The RNN outputs, a [num_steps, num_units] float tensor.
+    first_classes: A [num_steps] int64 tensor of the first components that the
+        second head is conditioned on: the labels' during training, and the
+        sampled ones during generation. Unused if `conditional` is False.
+    class_factors: A (num_first_classes, num_second_classes) tuple.
+    conditional: If True, the second head is also given the first component,
+        as a one-hot vector. Otherwise the components are predicted
+        independently.
+
+  Returns:
+    A (first_logits, second_logits) tuple of [num_steps, num_first_classes]
+    and [num_steps, num_second_classes] float tensors.
+  """
+  num_first_classes, num_second_classes = class_factors
+  first_logits = tf.contrib.layers.linear(
+      outputs_flat, num_first_classes, scope='first_class_logits')
+  if conditional:
+    outputs_flat = tf.concat(
+        1, [outputs_flat, tf.one_hot(first_classes, num_first_classes)])
+  second_logits = tf.contrib.layers.linear(
+      outputs_flat, num_second_classes, scope='second_class_logits')
+  return first_logits, second_logits
+
 
 def build_graph(mode, hparams, encoder_decoder, sequence_example_file=None):
   """Builds the TensorFlow graph.
 
+  If `hparams.factorized_output` is 'independent' or 'conditional', the
+  encoder-decoder must have a `class_factors` property, and the output layer
+  predicts the two factors of each label with separate heads (see
+  `_factorized_logits`). The loss is the sum of the heads' cross entropies,
+  and a step is predicted correctly if both heads are. Instead of 'softmax',
+  a generation graph then has a 'first_class_softmax' and a
+  'second_class_softmax'. For 'conditional', the second depends on the
+  'first_class' placeholder, a [batch_size, num_steps] int64 tensor that is
+  fed the first components sampled from the first softmax.
+
+  If `hparams.packed` is True, training and evaluation read SequenceExamples
+  packed by magenta.common.pack_sequence_examples. The RNN state is reset at
+  the start of each packed sequence, and the padding at the end of each row is
+  excluded from the loss and metrics.
+
   Args:
     mode: 'train', 'eval', or 'generate'. Only mode related ops are added to
         the graph.
@@ -34,13 +115,17 @@ def build_graph(mode, hparams, encoder_decoder, sequence_example_file=None):
     A tf.Graph instance which contains the TF ops.
 
   Raises:
-    ValueError: If mode is not 'train', 'eval', or 'generate', or if
+    ValueError: If mode is not 'train', 'eval', or 'generate', if
         sequence_example_file does not match a file when mode is 'train' or
-        'eval'.
+        'eval', or if hparams.factorized_output is not a valid value.
   """
   if mode not in ('train', 'eval', 'generate'):
     raise ValueError('The mode parameter must be \'train\', \'eval\', '
                      'or \'generate\'. The mode parameter was: %s' % mode)
+  if hparams.factorized_output not in (None, 'independent', 'conditional'):
+    raise ValueError('The factorized_output hparam must be \'independent\' '
+                     'or \'conditional\'. The factorized_output hparam was: '
+                     '%s' % hparams.factorized_output)
 
   tf.logging.info('hparams = %s', hparams.values())
 
@@ -49,12 +134,18 @@ def build_graph(mode, hparams, encoder_decoder, sequence_example_file=None):
   no_event_label = encoder_decoder.no_event_label
 
   with tf.Graph().as_default() as graph:
-    inputs, labels, lengths, = None, None, None
+    inputs, labels, lengths, segment_ids = None, None, None, None
     state_is_tuple = True
 
     if mode == 'train' or mode == 'eval':
-      inputs, labels, lengths = magenta.common.get_padded_batch(
-          [sequence_example_file], hparams.batch_size, input_size)
+      batch = magenta.common.get_padded_batch(
+          [sequence_example_file], hparams.batch_size, input_size,
+          sparse_inputs=bool(hparams.sparse_inputs),
+          packed=bool(hparams.packed))
+      if hparams.packed:
+        inputs, labels, lengths, segment_ids = batch
+      else:
+        inputs, labels, lengths = batch
 
     elif mode == 'generate':
       inputs = tf.placeholder(tf.float32, [hparams.batch_size, None,
@@ -78,38 +169,85 @@ def build_graph(mode, hparams, encoder_decoder, sequence_example_file=None):
     if hparams.attn_length:
       cell = tf.contrib.rnn.AttentionCellWrapper(
           cell, hparams.attn_length, state_is_tuple=state_is_tuple)
+    if segment_ids is not None:
+      # A step starts a new sequence when its segment ID differs from the
+      # previous step's. The reset flags are fed to the cell as an extra input
+      # column.
+      previous_segment_ids = tf.pad(segment_ids[:, :-1], [[0, 0], [1, 0]])
+      resets = tf.to_float(tf.not_equal(segment_ids, previous_segment_ids))
+      inputs = tf.concat(2, [inputs, tf.expand_dims(resets, 2)])
+      cell = _StateResetWrapper(cell)
     initial_state = cell.zero_state(hparams.batch_size, tf.float32)
 
     outputs, final_state = tf.nn.dynamic_rnn(
         cell, inputs, lengths, initial_state, parallel_iterations=1,
         swap_memory=True)
 
-    outputs_flat = tf.reshape(outputs, [-1, hparams.rnn_layer_sizes[-1]])
-    logits_flat = tf.contrib.layers.linear(outputs_flat, num_classes)
-
     if mode == 'train' or mode == 'eval':
       if hparams.skip_first_n_losses:
-        logits = tf.reshape(logits_flat, [hparams.batch_size, -1, num_classes])
-        logits = logits[:, hparams.skip_first_n_losses:, :]
-        logits_flat = tf.reshape(logits, [-1, num_classes])
+        outputs = outputs[:, hparams.skip_first_n_losses:, :]
         labels = labels[:, hparams.skip_first_n_losses:]
-
+        if segment_ids is not None:
+          segment_ids = segment_ids[:, hparams.skip_first_n_losses:]
       labels_flat = tf.reshape(labels, [-1])
-      softmax_cross_entropy = tf.nn.sparse_softmax_cross_entropy_with_logits(
-          logits_flat, labels_flat)
-      loss = tf.reduce_mean(softmax_cross_entropy)
-      perplexity = tf.reduce_mean(tf.exp(softmax_cross_entropy))
 
-      correct_predictions = tf.to_float(
-          tf.nn.in_top_k(logits_flat, labels_flat, 1))
-      accuracy = tf.reduce_mean(correct_predictions) * 100
+    outputs_flat = tf.reshape(outputs, [-1, hparams.rnn_layer_sizes[-1]])
+    if hparams.factorized_output:
+      num_first_classes, _ = encoder_decoder.class_factors
+      if mode != 'generate':
+        first_labels_flat = tf.mod(labels_flat, num_first_classes)
+        second_labels_flat = tf.floordiv(labels_flat, num_first_classes)
+        first_classes_flat = first_labels_flat
+      elif hparams.factorized_output == 'conditional':
+        first_class = tf.placeholder(tf.int64, [hparams.batch_size, None])
+        first_classes_flat = tf.reshape(first_class, [-1])
+      else:
+        first_classes_flat = None
+      first_logits_flat, second_logits_flat = _factorized_logits(
+          outputs_flat, first_classes_flat, encoder_decoder.class_factors,
+          hparams.factorized_output == 'conditional')
+    else:
+      logits_flat = tf.contrib.layers.linear(outputs_flat, num_classes)
+
+    if mode == 'train' or mode == 'eval':
+      if hparams.factorized_output:
+        softmax_cross_entropy = (
+            tf.nn.sparse_softmax_cross_entropy_with_logits(
+                first_logits_flat, first_labels_flat) +
+            tf.nn.sparse_softmax_cross_entropy_with_logits(
+                second_logits_flat, second_labels_flat))
+        correct_predictions = tf.to_float(tf.logical_and(
+            tf.nn.in_top_k(first_logits_flat, first_labels_flat, 1),
+            tf.nn.in_top_k(second_logits_flat, second_labels_flat, 1)))
+      else:
+        softmax_cross_entropy = tf.nn.sparse_softmax_cross_entropy_with_logits(
+            logits_flat, labels_flat)
+        correct_predictions = tf.to_float(
+            tf.nn.in_top_k(logits_flat, labels_flat, 1))
+      if segment_ids is None:
+        step_weights = tf.ones_like(softmax_cross_entropy)
+      else:
+        step_weights = tf.to_float(
+            tf.greater(tf.reshape(segment_ids, [-1]), 0))
+      num_steps = tf.reduce_sum(step_weights)
+      loss = tf.truediv(
+          tf.reduce_sum(tf.mul(softmax_cross_entropy, step_weights)),
+          num_steps)
+      perplexity = tf.truediv(
+          tf.reduce_sum(tf.mul(tf.exp(softmax_cross_entropy), step_weights)),
+          num_steps)
 
-      event_positions = tf.to_float(tf.not_equal(labels_flat, no_event_label))
+      correct_predictions = tf.mul(correct_predictions, step_weights)
+      accuracy = tf.truediv(tf.reduce_sum(correct_predictions), num_steps) * 100
+
+      event_positions = tf.mul(
+          tf.to_float(tf.not_equal(labels_flat, no_event_label)), step_weights)
       event_accuracy = tf.truediv(
           tf.reduce_sum(tf.mul(correct_predictions, event_positions)),
           tf.reduce_sum(event_positions)) * 100
 
-      no_event_positions = tf.to_float(tf.equal(labels_flat, no_event_label))
+      no_event_positions = tf.mul(
+          tf.to_float(tf.equal(labels_flat, no_event_label)), step_weights)
       no_event_accuracy = tf.truediv(
           tf.reduce_sum(tf.mul(correct_predictions, no_event_positions)),
           tf.reduce_sum(no_event_positions)) * 100
@@ -151,15 +289,34 @@ def build_graph(mode, hparams, encoder_decoder, sequence_example_file=None):
         tf.add_to_collection('summary_op', summary_op)
 
     elif mode == 'generate':
-      if hparams.temperature and hparams.temperature != 1.0:
-        logits_flat /= hparams.temperature
+      if hparams.factorized_output:
+        if hparams.temperature and hparams.temperature != 1.0:
+          first_logits_flat /= hparams.temperature
+          second_logits_flat /= hparams.temperature
+
+        num_first_classes, num_second_classes = encoder_decoder.class_factors
+        first_class_softmax = tf.reshape(
+            tf.nn.softmax(first_logits_flat),
+            [hparams.batch_size, -1, num_first_classes])
+        second_class_softmax = tf.reshape(
+            tf.nn.softmax(second_logits_flat),
+            [hparams.batch_size, -1, num_second_classes])
+
+        tf.add_to_collection('first_class_softmax', first_class_softmax)
+        tf.add_to_collection('second_class_softmax', second_class_softmax)
+        if hparams.factorized_output == 'conditional':
+          tf.add_to_collection('first_class', first_class)
+      else:
+        if hparams.temperature and hparams.temperature != 1.0:
+          logits_flat /= hparams.temperature
 
-      softmax_flat = tf.nn.softmax(logits_flat)
-      softmax = tf.reshape(softmax_flat, [hparams.batch_size, -1, num_classes])
+        softmax_flat = tf.nn.softmax(logits_flat)
+        softmax = tf.reshape(softmax_flat,
+                             [hparams.batch_size, -1, num_classes])
+        tf.add_to_collection('softmax', softmax)
 
       tf.add_to_collection('inputs', inputs)
       tf.add_to_collection('initial_state', initial_state)
       tf.add_to_collection('final_state', final_state)
-      tf.add_to_collection('softmax', softmax)
 
   return graph
@@ -14,12 +14,21 @@
 """Tests for melody_rnn_graph."""
 
 # internal imports
+import numpy as np
 import tensorflow as tf
 import magenta
 
 from magenta.models.shared import melody_rnn_graph
 
 
+class FactoredOneHotEncoderDecoder(magenta.music.OneHotMelodyEncoderDecoder):
+  """A OneHotMelodyEncoderDecoder whose 14 classes are factored as 2 x 7."""
+
+  @property
+  def class_factors(self):
+    return (2, 7)
+
+
 class MelodyRNNGraphTest(tf.test.TestCase):
 
   def setUp(self):
@@ -60,6 +69,93 @@ class MelodyRNNGraphTest(tf.test.TestCase):
         sequence_example_file='test')
     self.assertTrue(isinstance(g, tf.Graph))
 
+  def testBuildTrainGraphWithSparseInputs(self):
+    self.hparams.sparse_inputs = True
+    g = melody_rnn_graph.build_graph(
+        'train', self.hparams, self.encoder_decoder,
+        sequence_example_file='test')
+    self.assertTrue(isinstance(g, tf.Graph))
+
+  def testBuildTrainGraphWithPackedInputs(self):
+    self.hparams.packed = True
+    self.hparams.skip_first_n_losses = 2
+    g = melody_rnn_graph.build_graph(
+        'train', self.hparams, self.encoder_decoder,
+        sequence_example_file='test')
+    self.assertTrue(isinstance(g, tf.Graph))
+
+  def testStateResetWrapper(self):
+    inputs = np.random.rand(1, 5, 3).astype(np.float32)
+    resets = np.array([[[1.0], [0.0], [0.0], [1.0], [0.0]]], dtype=np.float32)
+    with self.test_session() as sess:
+      cell = tf.nn.rnn_cell.BasicLSTMCell(4, state_is_tuple=True)
+      with tf.variable_scope('rnn') as scope:
+        outputs, _ = tf.nn.dynamic_rnn(
+            melody_rnn_graph._StateResetWrapper(cell),
+            tf.constant(np.concatenate([inputs, resets], axis=2)),
+            dtype=tf.float32)
+        scope.reuse_variables()
+        first_outputs, _ = tf.nn.dynamic_rnn(
+            cell, tf.constant(inputs[:, :3]), dtype=tf.float32)
+        second_outputs, _ = tf.nn.dynamic_rnn(
+            cell, tf.constant(inputs[:, 3:]), dtype=tf.float32)
+      sess.run(tf.initialize_all_variables())
+      outputs_, first_outputs_, second_outputs_ = sess.run(
+          [outputs, first_outputs, second_outputs])
+    # With the reset, the second sequence is unaffected by the first.
+    self.assertAllClose(
+        np.concatenate([first_outputs_, second_outputs_], axis=1), outputs_)
+
+  def testBuildTrainGraphWithFactorizedOutput(self):
+    self.hparams.factorized_output = 'independent'
+    g = melody_rnn_graph.build_graph(
+        'train', self.hparams, FactoredOneHotEncoderDecoder(0, 12, 0),
+        sequence_example_file='test')
+    self.assertTrue(isinstance(g, tf.Graph))
+
+  def testBuildTrainGraphWithConditionalFactorizedOutput(self):
+    self.hparams.factorized_output = 'conditional'
+    g = melody_rnn_graph.build_graph(
+        'train', self.hparams, FactoredOneHotEncoderDecoder(0, 12, 0),
+        sequence_example_file='test')
+    self.assertTrue(isinstance(g, tf.Graph))
+
+  def testFactorizedOutputSoftmax(self):
+    self.hparams.batch_size = 2
+    self.hparams.dropout_keep_prob = 1.0
+    self.hparams.temperature = 1.0
+    self.hparams.factorized_output = 'conditional'
+    encoder_decoder = FactoredOneHotEncoderDecoder(0, 12, 0)
+    g = melody_rnn_graph.build_graph(
+        'generate', self.hparams, encoder_decoder)
+    self.assertFalse(g.get_collection('softmax'))
+    with self.test_session(graph=g) as sess:
+      sess.run(tf.initialize_all_variables())
+      inputs = np.random.rand(2, 3, encoder_decoder.input_size)
+      first_class_softmax = sess.run(
+          g.get_collection('first_class_softmax')[0],
+          {g.get_collection('inputs')[0]: inputs})
+      second_class_softmaxes = [
+          sess.run(g.get_collection('second_class_softmax')[0],
+                   {g.get_collection('inputs')[0]: inputs,
+                    g.get_collection('first_class')[0]:
+                        np.full((2, 3), first_class, dtype=np.int64)})
+          for first_class in range(2)]
+    self.assertEqual((2, 3, 2), first_class_softmax.shape)
+    self.assertAllClose(np.ones((2, 3)), first_class_softmax.sum(axis=2))
+    for second_class_softmax in second_class_softmaxes:
+      self.assertEqual((2, 3, 7), second_class_softmax.shape)
+      self.assertAllClose(np.ones((2, 3)), second_class_softmax.sum(axis=2))
+    # The second head is conditioned on the first class it is fed.
+    self.assertFalse(np.allclose(*second_class_softmaxes))
+
+  def testBuildGraphWithInvalidFactorizedOutput(self):
+    self.hparams.factorized_output = 'joint'
+    with self.assertRaises(ValueError):
+      melody_rnn_graph.build_graph(
+          'train', self.hparams, FactoredOneHotEncoderDecoder(0, 12, 0),
+          sequence_example_file='test')
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -138,13 +138,81 @@ class MelodyRnnSequenceGenerator(magenta.music.BaseSequenceGenerator):
     qpm = (primer_sequence.tempos[0].qpm
            if primer_sequence and primer_sequence.tempos
            else magenta.music.DEFAULT_QUARTERS_PER_MINUTE)
+    melody = extracted_melodies[0] if extracted_melodies else None
+    return self._generate_from_melody(melody, generate_section, qpm)
+
+  def create_melody_builder(self, qpm, start_time=0.0):
+    """Returns a StreamingMelodyBuilder for building primers as notes arrive.
+
+    Args:
+      qpm: The quarters per minute of the notes that will be added.
+      start_time: The time in seconds (float) that generation times are
+          measured from.
+
+    Returns:
+      A magenta.music.StreamingMelodyBuilder that quantizes at this
+      generator's `steps_per_quarter`, for use with `generate_from_melody`.
+    """
+    return magenta.music.StreamingMelodyBuilder(
+        qpm, steps_per_quarter=self._steps_per_quarter, start_time=start_time)
+
+  def generate_from_melody(self, primer_melody, generator_options, qpm):
+    """Generates a sequence from an already quantized primer melody.
+
+    This is equivalent to `generate` with a primer NoteSequence that quantizes
+    and extracts to `primer_melody`, such as one built by a
+    magenta.music.StreamingMelodyBuilder during MIDI capture, but skips
+    quantization and melody extraction.
+
+    Args:
+      primer_melody: The primer Melody, quantized at this generator's
+          `steps_per_quarter`. May be empty.
+      generator_options: A GeneratorOptions proto with options to use for
+          generation.
+      qpm: The quarters per minute of the primer melody and generated sequence.
+
+    Returns:
+      The generated NoteSequence proto.
+
+    Raises:
+      SequenceGeneratorException: If `generator_options` is invalid or the
+          requested section starts before the end of the primer melody.
+    """
+    if len(generator_options.generate_sections) != 1:
+      raise magenta.music.SequenceGeneratorException(
+          'This model supports only 1 generate_sections message, but got %s' %
+          len(generator_options.generate_sections))
+
+    generate_section = generator_options.generate_sections[0]
+    start_step = self._seconds_to_steps(
+        generate_section.start_time_seconds, qpm)
+    if len(primer_melody) and primer_melody.end_step > start_step:
+      raise magenta.music.SequenceGeneratorException(
+          'Got GenerateSection request for section that is before the end of '
+          'the primer melody. This model can only extend sequences. '
+          'Requested start step: %s, Final melody step: %s' %
+          (start_step, primer_melody.end_step))
+
+    self.initialize()
+    return self._generate_from_melody(copy.deepcopy(primer_melody),
+                                      generate_section, qpm)
+
+  def _generate_from_melody(self, melody, generate_section, qpm):
+    """Extends a primer melody over the requested section.
+
+    Args:
+      melody: The primer Melody, which is modified, or None.
+      generate_section: The GeneratorOptions.GenerateSection to generate.
+      qpm: The quarters per minute of the primer and generated sequence.
+
+    Returns:
+      The generated NoteSequence proto.
+    """
     start_step = self._seconds_to_steps(
         generate_section.start_time_seconds, qpm)
     end_step = self._seconds_to_steps(generate_section.end_time_seconds, qpm)
 
-    if extracted_melodies and extracted_melodies[0]:
-      melody = extracted_melodies[0]
-    else:
+    if not melody:
       tf.logging.warn('No melodies were extracted from the priming sequence. '
                       'Melodies will be generated from scratch.')
       melody = magenta.music.Melody([
@@ -160,13 +228,16 @@ class MelodyRnnSequenceGenerator(magenta.music.BaseSequenceGenerator):
     assert generated_sequence.total_time <= generate_section.end_time_seconds
     return generated_sequence
 
-  def generate_melody(self, num_steps, primer_melody):
+  def generate_melody(self, num_steps, primer_melody, random_state=None):
     """Generate a melody from a primer melody.
 
     Args:
       num_steps: An integer number of steps to generate. This is the total
           number of steps to generate, including the primer melody.
       primer_melody: The primer melody, a Melody object.
+      random_state: An optional numpy RandomState to sample events with, which
+          makes the generated melody reproducible. If None, the global numpy
+          random state is used.
 
     Returns:
       The generated Melody object (which begins with the provided primer
@@ -183,6 +254,8 @@ class MelodyRnnSequenceGenerator(magenta.music.BaseSequenceGenerator):
       raise MelodyRnnSequenceGeneratorException(
           'primer melody must be shorter than num_steps')
 
+    # Copying a melody is constant time; the primer's events are only copied
+    # once `squash` transposes them.
     melody = copy.deepcopy(primer_melody)
 
     transpose_amount = melody.squash(
@@ -195,20 +268,26 @@ class MelodyRnnSequenceGenerator(magenta.music.BaseSequenceGenerator):
     final_state = self._session.graph.get_collection('final_state')[0]
     softmax = self._session.graph.get_collection('softmax')[0]
 
+    # The encoder state computes the input for each newly sampled event
+    # without re-encoding the melody generated so far.
+    encoder_state = self._melody_encoder_decoder.get_encoder_state(melody)
+
     final_state_ = None
     for i in range(num_steps - (len(melody) + melody.start_step)):
       if i == 0:
-        inputs_ = self._melody_encoder_decoder.get_inputs_batch(
-            [melody], full_length=True)
+        # The primer inputs are built in bulk as a [len(melody), input_size]
+        # array and fed without converting them to nested lists.
+        inputs_ = [self._melody_encoder_decoder.encode_batch(melody)[0]]
         initial_state_ = self._session.run(initial_state)
       else:
-        inputs_ = self._melody_encoder_decoder.get_inputs_batch([melody])
+        inputs_ = [[encoder_state.get_input()]]
         initial_state_ = final_state_
 
       feed_dict = {inputs: inputs_, initial_state: initial_state_}
       final_state_, softmax_ = self._session.run(
           [final_state, softmax], feed_dict)
-      self._melody_encoder_decoder.extend_event_sequences([melody], softmax_)
+      self._melody_encoder_decoder.extend_event_sequences(
+          [melody], softmax_, random_state=random_state)
 
     melody.transpose(-transpose_amount)
 
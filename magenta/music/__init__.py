@@ -16,13 +16,20 @@
 
 from constants import *  # pylint: disable=wildcard-import
 
+from events_lib import EncoderState
+
 from melodies_lib import BadNoteException
 from melodies_lib import extract_melodies
+from melodies_lib import lookback_repeats
+from melodies_lib import MAJOR_KEY_PROFILES
+from melodies_lib import MajorKeyEstimator
 from melodies_lib import Melody
 from melodies_lib import MelodyEncoderDecoder
+from melodies_lib import MelodyView
 from melodies_lib import midi_file_to_melody
 from melodies_lib import OneHotMelodyEncoderDecoder
 from melodies_lib import PolyphonicMelodyException
+from melodies_lib import StreamingMelodyBuilder
 
 from midi_io import midi_file_to_sequence_proto
 from midi_io import midi_to_sequence_proto
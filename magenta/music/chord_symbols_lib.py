@@ -14,9 +14,19 @@
 """Utility functions for working with chord symbols."""
 
 import abc
-import music21
+import os
+import re
+import sqlite3
+import threading
+
+# internal imports
 import tensorflow as tf
 
+from magenta.music import constants
+
+NOTES_PER_OCTAVE = constants.NOTES_PER_OCTAVE
+NO_CHORD = constants.NO_CHORD
+
 # chord quality enum
 CHORD_QUALITY_MAJOR = 0
 CHORD_QUALITY_MINOR = 1
@@ -42,17 +52,31 @@ class ChordSymbolFunctions(object):
   """
   __metaclass__ = abc.ABCMeta
 
+  # The version of an implementation's interpretations. Bump it whenever the
+  # interpretation of any figure changes, so that CachedChordSymbolFunctions
+  # doesn't serve results cached by the old version.
+  version = 0
+
   @staticmethod
-  def get():
+  def get(cache_path=None):
     """Returns the default implementation of ChordSymbolFunctions.
 
-    Currently the default (and only) implementation of ChordSymbolFunctions is
-    Music21ChordSymbolFunctions.
+    The default implementation is BasicChordSymbolFunctions, which falls back
+    to Music21ChordSymbolFunctions for figures it cannot interpret.
+
+    Args:
+      cache_path: An optional path to an sqlite file in which to cache the
+          interpretations of chord symbols across processes and runs.
 
     Returns:
       A ChordSymbolFunctions object.
     """
-    return Music21ChordSymbolFunctions()
+    chord_symbol_functions = BasicChordSymbolFunctions(
+        fallback=Music21ChordSymbolFunctions())
+    if cache_path is not None:
+      chord_symbol_functions = CachedChordSymbolFunctions(
+          chord_symbol_functions, cache_path)
+    return chord_symbol_functions
 
   @abc.abstractmethod
   def transpose_chord_symbol(self, figure, transpose_amount):
@@ -117,6 +141,437 @@ class ChordSymbolFunctions(object):
     pass
 
 
+# Semitones above the root of each scale degree of a major scale, extended
+# through the thirteenth.
+_DEGREE_SEMITONES = {1: 0, 2: 2, 3: 4, 4: 5, 5: 7, 6: 9, 7: 11, 9: 14, 11: 17,
+                     13: 21}
+
+_ACCIDENTAL_SEMITONES = {'#': 1, '+': 1, 'b': -1, '-': -1, '': 0}
+
+# Chord kinds, as the figure suffix after the root, and the scale degrees they
+# contain. An accidental before a degree lowers or raises it by a half step.
+_CHORD_KIND_DEGREES = {
+    '': '1 3 5', 'M': '1 3 5', 'maj': '1 3 5', 'major': '1 3 5',
+    'm': '1 b3 5', 'min': '1 b3 5', 'minor': '1 b3 5',
+    '+': '1 3 #5', 'aug': '1 3 #5',
+    'o': '1 b3 b5', 'dim': '1 b3 b5',
+    '5': '1 5', 'power': '1 5', 'pedal': '1',
+    'sus': '1 4 5', 'sus4': '1 4 5', 'sus2': '1 2 5',
+    '6': '1 3 5 6', 'M6': '1 3 5 6', 'maj6': '1 3 5 6',
+    'm6': '1 b3 5 6', 'min6': '1 b3 5 6',
+    '69': '1 3 5 6 9', '6/9': '1 3 5 6 9', 'm69': '1 b3 5 6 9',
+    '7': '1 3 5 b7', 'dom7': '1 3 5 b7',
+    'M7': '1 3 5 7', 'maj7': '1 3 5 7', 'Maj7': '1 3 5 7',
+    'm7': '1 b3 5 b7', 'min7': '1 b3 5 b7',
+    'mM7': '1 b3 5 7', 'mmaj7': '1 b3 5 7', 'minmaj7': '1 b3 5 7',
+    'o7': '1 b3 b5 bb7', 'dim7': '1 b3 b5 bb7',
+    'm7b5': '1 b3 b5 b7',
+    '+7': '1 3 #5 b7', '7+': '1 3 #5 b7', 'aug7': '1 3 #5 b7',
+    '+M7': '1 3 #5 7', 'augmaj7': '1 3 #5 7',
+    '7sus': '1 4 5 b7', '7sus4': '1 4 5 b7', '7sus2': '1 2 5 b7',
+    '9': '1 3 5 b7 9', 'M9': '1 3 5 7 9', 'maj9': '1 3 5 7 9',
+    'm9': '1 b3 5 b7 9', 'min9': '1 b3 5 b7 9', 'mM9': '1 b3 5 7 9',
+    '11': '1 3 5 b7 9 11', 'M11': '1 3 5 7 9 11', 'maj11': '1 3 5 7 9 11',
+    'm11': '1 b3 5 b7 9 11', 'min11': '1 b3 5 b7 9 11',
+    '13': '1 3 5 b7 9 11 13', 'M13': '1 3 5 7 9 11 13',
+    'maj13': '1 3 5 7 9 11 13',
+    'm13': '1 b3 5 b7 9 11 13', 'min13': '1 b3 5 b7 9 11 13',
+}
+
+_DEGREE_RE = re.compile(r'(bb|##|[#b]?)(\d+)$')
+
+# A root or bass pitch name: a letter followed by any number of sharps ('#') or
+# flats ('-'). As in music21, 'b' is not a flat, so e.g. 'Bb7' is a B chord with
+# an added flat seventh.
+_PITCH_NAME_RE = re.compile(r'([A-G])([#\-]*)')
+
+# A chord modification, e.g. 'b9', 'add 9', 'alter #5', or 'omit3'.
+_MODIFICATION_RE = re.compile(r'\s*(add|alter|omit|no)?\s*([#+b\-]?)(\d+)')
+
+_LETTER_PITCH_CLASSES = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9,
+                         'B': 11}
+_LETTERS = 'CDEFGAB'
+
+# The name music21 gives each pitch class when it transposes a chord symbol.
+_PITCH_CLASS_NAMES = ['C', 'C#', 'D', 'E-', 'E', 'F', 'F#', 'G', 'G#', 'A',
+                      'B-', 'B']
+
+# Chord kinds music21 voices as ninth, eleventh, and thirteenth chords, with
+# the ninth (and eleventh and thirteenth) an octave above the other tones.
+_NINTH_KINDS = frozenset(['9', 'M9', 'maj9', 'm9', 'min9'])
+_ELEVENTH_KINDS = frozenset(['11', 'M11', 'maj11', 'm11', 'min11'])
+_THIRTEENTH_KINDS = frozenset(['13', 'M13', 'maj13', 'm13', 'min13'])
+_EXTENDED_KINDS = _NINTH_KINDS | _ELEVENTH_KINDS | _THIRTEENTH_KINDS
+
+# Chord kinds music21 allows in third inversion, i.e. with the seventh in the
+# bass. Notably this excludes the dominant seventh.
+_SEVENTH_KINDS = frozenset([
+    'M7', 'maj7', 'Maj7', 'm7', 'min7', 'm7b5', 'o7', 'dim7', '+7', '7+',
+    'aug7']) | _EXTENDED_KINDS
+
+# The inversion implied by a slash bass the given number of letter names above
+# the root.
+_BASS_LETTER_STEP_INVERSIONS = {0: 0, 2: 1, 4: 2, 6: 3, 1: 4, 3: 5, 5: 6}
+
+# Chords are voiced by diatonic step (seven per octave, counting from 1 at
+# C0) as well as MIDI pitch, and shifted by octaves until they lie between A1
+# and D4 inclusive. A slash bass that is a chord tone is placed in the octave
+# music21 gives pitches without one, otherwise an octave below the root.
+_ROOT_OCTAVE = 3
+_INVERSION_BASS_OCTAVE = 4
+_BASS_OCTAVE = 2
+_LOWEST_STEP = 13
+_HIGHEST_STEP = 30
+
+
+def _parse_degrees(degrees):
+  """Parses a space-separated string of scale degrees.
+
+  Args:
+    degrees: A string like '1 b3 5 b7'.
+
+  Returns:
+    A dictionary mapping each scale degree to its semitones above the root.
+  """
+  semitones = {}
+  for degree in degrees.split():
+    accidentals, number = _DEGREE_RE.match(degree).groups()
+    number = int(number)
+    semitones[number] = _DEGREE_SEMITONES[number] + sum(
+        _ACCIDENTAL_SEMITONES[accidental] for accidental in accidentals)
+  return semitones
+
+
+_CHORD_KINDS = dict((kind, _parse_degrees(degrees))
+                    for kind, degrees in _CHORD_KIND_DEGREES.items())
+
+# Longest kinds first, so that e.g. 'maj7' is matched before 'm'.
+_CHORD_KINDS_BY_LENGTH = sorted(_CHORD_KINDS, key=len, reverse=True)
+
+
+def _parse_pitch_name(name):
+  """Returns the letter and accidental offset of a pitch name, or None."""
+  match = _PITCH_NAME_RE.match(name)
+  if not match or match.end() != len(name):
+    return None
+  letter, accidentals = match.groups()
+  return letter, sum(_ACCIDENTAL_SEMITONES[accidental]
+                     for accidental in accidentals)
+
+
+def _pitch_class(letter, offset):
+  return (_LETTER_PITCH_CLASSES[letter] + offset) % 12
+
+
+def _transpose_pitch_name(letter, offset, transpose_amount):
+  """Transposes a pitch name, spelling the result the way music21 does.
+
+  music21 spells every pitch class the same way regardless of the key or the
+  original spelling, e.g. 'D-' transposed by 0 is 'C#'.
+
+  Args:
+    letter: The letter name of the pitch.
+    offset: The pitch's accidental offset in half steps.
+    transpose_amount: The integer number of half steps to transpose.
+
+  Returns:
+    The transposed pitch name, using '#' for sharps and '-' for flats.
+  """
+  return _PITCH_CLASS_NAMES[
+      (_pitch_class(letter, offset) + transpose_amount) % 12]
+
+
+def _parse_modifications(suffix, position):
+  """Parses the chord modifications at the end of a chord symbol figure.
+
+  Args:
+    suffix: The part of the figure between the root and the bass.
+    position: The index in `suffix` at which the modifications start.
+
+  Returns:
+    A list of (keyword, degree, semitones) tuples, or None if the rest of the
+    suffix is not a sequence of modifications. The semitones of an omitted
+    degree are None.
+  """
+  modifications = []
+  while position < len(suffix):
+    modification = _MODIFICATION_RE.match(suffix, position)
+    if not modification:
+      return None
+    keyword, accidental, degree = modification.groups()
+    if keyword is None and not accidental:
+      # A bare number is more likely part of a kind we don't know, e.g. the
+      # '4' in '7sus4', than a modification.
+      return None
+    degree = int(degree)
+    if degree not in _DEGREE_SEMITONES:
+      return None
+    if keyword in ('omit', 'no'):
+      semitones = None
+    else:
+      semitones = _DEGREE_SEMITONES[degree] + _ACCIDENTAL_SEMITONES[accidental]
+    modifications.append((keyword, degree, semitones))
+    position = modification.end()
+  return modifications
+
+
+class _ParsedChordSymbol(object):
+  """A chord symbol figure split into its parts.
+
+  Attributes:
+    letter: The letter name of the root.
+    offset: The accidental offset of the root in half steps.
+    suffix: The part of the figure between the root and the bass.
+    bass: A (letter, offset) tuple for the bass note, or None.
+    root: The pitch class of the root.
+    kind: The chord kind, a key of _CHORD_KINDS.
+    modifications: A list of (keyword, degree, semitones) tuples, one for each
+        modification following the kind. The keyword is 'add', 'alter',
+        'omit', 'no', or None.
+    quality: The chord quality enum value.
+  """
+
+  __slots__ = ('letter', 'offset', 'suffix', 'bass', 'root', 'kind',
+               'modifications', 'quality')
+
+
+def _parse_chord_symbol(figure):
+  """Parses a chord symbol figure.
+
+  Args:
+    figure: The chord symbol figure string.
+
+  Returns:
+    A _ParsedChordSymbol, or None if the figure is not understood.
+  """
+  parsed = _ParsedChordSymbol()
+
+  parsed.bass = None
+  slash = figure.rfind('/')
+  if slash >= 0:
+    parsed.bass = _parse_pitch_name(figure[slash + 1:])
+    if parsed.bass is not None:
+      figure = figure[:slash]
+
+  match = _PITCH_NAME_RE.match(figure)
+  if not match:
+    return None
+  parsed.letter, parsed.offset = _parse_pitch_name(match.group(0))
+  parsed.root = _pitch_class(parsed.letter, parsed.offset)
+  parsed.suffix = figure[match.end():]
+
+  # Use the longest kind after which the rest of the suffix parses, so that
+  # e.g. 'omit3' is not read as the kind 'o'.
+  for parsed.kind in _CHORD_KINDS_BY_LENGTH:
+    if parsed.suffix.startswith(parsed.kind):
+      parsed.modifications = _parse_modifications(
+          parsed.suffix, len(parsed.kind))
+      if parsed.modifications is not None:
+        break
+  else:
+    return None
+
+  degrees = dict(_CHORD_KINDS[parsed.kind])
+  for keyword, degree, semitones in parsed.modifications:
+    if keyword in ('omit', 'no'):
+      degrees.pop(degree, None)
+    else:
+      degrees[degree] = semitones
+
+  # As in music21, a chord without a 5th is major or minor by its 3rd alone.
+  triad = (degrees.get(3), degrees.get(5))
+  if triad == (4, None):
+    parsed.quality = CHORD_QUALITY_MAJOR
+  elif triad == (3, None):
+    parsed.quality = CHORD_QUALITY_MINOR
+  elif triad == (4, 7):
+    parsed.quality = CHORD_QUALITY_MAJOR
+  elif triad == (3, 7):
+    parsed.quality = CHORD_QUALITY_MINOR
+  elif triad == (4, 8):
+    parsed.quality = CHORD_QUALITY_AUGMENTED
+  elif triad == (3, 6):
+    parsed.quality = CHORD_QUALITY_DIMINISHED
+  else:
+    parsed.quality = CHORD_QUALITY_OTHER
+
+  return parsed
+
+
+def _voice_chord_symbol(parsed):
+  """Computes the MIDI pitches of a parsed chord symbol as music21 voices them.
+
+  Each chord tone is tracked as a [degree, step, pitch] list, where step is
+  the diatonic step number used by music21 to order and place pitches.
+
+  Args:
+    parsed: The _ParsedChordSymbol to voice.
+
+  Returns:
+    A list of MIDI pitches, lowest first.
+  """
+  letter_index = _LETTERS.index(parsed.letter)
+  root_step = 7 * _ROOT_OCTAVE + letter_index + 1
+  root_pitch = (12 * (_ROOT_OCTAVE + 1) + _LETTER_PITCH_CLASSES[parsed.letter] +
+                parsed.offset)
+
+  tones = sorted(
+      ([degree, root_step + (degree - 1) % 7,
+        root_pitch + semitones - 12 * ((degree - 1) // 7)]
+       for degree, semitones in _CHORD_KINDS[parsed.kind].items()),
+      key=lambda tone: tone[2])
+  if parsed.kind in _NINTH_KINDS:
+    extensions = [1]
+  elif parsed.kind in _ELEVENTH_KINDS:
+    extensions = [1, 3]
+  elif parsed.kind in _THIRTEENTH_KINDS:
+    extensions = [1, 3, 5]
+  else:
+    extensions = []
+  for i in extensions:
+    tones[i][1] += 7
+    tones[i][2] += 12
+  tones.sort(key=lambda tone: tone[1:])
+
+  if parsed.bass is not None and parsed.bass != (parsed.letter, parsed.offset):
+    bass_letter, bass_offset = parsed.bass
+    bass_letter_index = _LETTERS.index(bass_letter)
+    inversion = _BASS_LETTER_STEP_INVERSIONS[
+        (bass_letter_index - letter_index) % 7]
+    if ((inversion in (1, 2) and parsed.kind != 'pedal') or
+        (inversion == 3 and parsed.kind in _SEVENTH_KINDS) or
+        (inversion == 4 and parsed.kind in _EXTENDED_KINDS) or
+        (inversion == 5 and (parsed.kind in _ELEVENTH_KINDS or
+                             parsed.kind in _THIRTEENTH_KINDS))):
+      # Raise the tones below the bass note above it.
+      octaves = 2 if parsed.kind in _EXTENDED_KINDS else 1
+      for tone in tones[:inversion]:
+        tone[1] += 7 * octaves
+        tone[2] += 12 * octaves
+      bass_step = 7 * _INVERSION_BASS_OCTAVE + bass_letter_index + 1
+      for tone in tones:
+        if tone[1] < bass_step:
+          tone[1] += 7
+          tone[2] += 12
+    else:
+      tones.append([
+          None, 7 * _BASS_OCTAVE + bass_letter_index + 1,
+          (12 * (_BASS_OCTAVE + 1) + _LETTER_PITCH_CLASSES[bass_letter] +
+           bass_offset)])
+
+  for keyword, degree, semitones in parsed.modifications:
+    if keyword in ('omit', 'no'):
+      tones = [tone for tone in tones if tone[0] != degree]
+      continue
+    # Like music21, replace an unaltered tone of the kind, except a ninth or
+    # above, which is kept as is. Any other tone is added alongside.
+    if _CHORD_KINDS[parsed.kind].get(degree) == _DEGREE_SEMITONES[degree]:
+      if degree > 7:
+        continue
+      tones = [tone for tone in tones if tone[0] != degree]
+    step = root_step + (degree - 1) % 7
+    pitch = root_pitch + semitones - 12 * ((degree - 1) // 7)
+    if degree >= 7:
+      step += 7
+      pitch += 12
+    tones.append([degree, step, pitch])
+
+  if not tones:
+    return []
+  while max(tone[1] for tone in tones) > _HIGHEST_STEP:
+    for tone in tones:
+      tone[1] -= 7
+      tone[2] -= 12
+  while min(tone[1] for tone in tones) < _LOWEST_STEP:
+    for tone in tones:
+      tone[1] += 7
+      tone[2] += 12
+
+  return [tone[2] for tone in sorted(tones, key=lambda tone: tone[1:])]
+
+
+class BasicChordSymbolFunctions(ChordSymbolFunctions):
+  """A class that interprets chord symbol strings with table lookups.
+
+  Figures consist of a root pitch name, a chord kind such as 'm7' or 'sus2',
+  any number of modifications such as 'b9', 'add 11' or 'omit5', and an
+  optional slash bass. Figures that cannot be interpreted are passed to a
+  fallback ChordSymbolFunctions object, if one is given.
+
+  Roots and voicings match Music21ChordSymbolFunctions, as do the spellings
+  of transposed roots. Unlike music21, transposition keeps the rest
+  of the figure as written: music21 rewrites the kind (e.g. 'dim7' as 'o7')
+  and re-derives the slash bass from the transposed pitches, sometimes
+  dropping it. Voicings also differ where music21 itself misreads a figure:
+  kinds it doesn't know (e.g. 'maj9', '7sus4', '69'), power chords and 'm7b5'
+  chords with modifications or a slash bass, and omissions from extended
+  chords. Qualities match too, except where music21 picks a different root
+  for a figure with an omitted 5th (e.g. 'C6 omit5'), and for 'no'
+  modifications, which music21 fails to parse and drops.
+  """
+
+  version = 2
+
+  def __init__(self, fallback=None):
+    """Construct a BasicChordSymbolFunctions object.
+
+    Args:
+      fallback: An optional ChordSymbolFunctions object used for figures that
+          cannot be interpreted.
+    """
+    self._fallback = fallback
+    self._parsed_chord_symbols = {}
+
+  def __getstate__(self):
+    # Parsed figures are not picklable, and are reparsed as needed.
+    state = self.__dict__.copy()
+    state['_parsed_chord_symbols'] = {}
+    return state
+
+  def _parse(self, figure):
+    """Returns the memoized _ParsedChordSymbol for `figure`, or None."""
+    if figure not in self._parsed_chord_symbols:
+      self._parsed_chord_symbols[figure] = _parse_chord_symbol(figure)
+    return self._parsed_chord_symbols[figure]
+
+  def _check_fallback(self, figure):
+    if self._fallback is None:
+      raise ChordSymbolException('unable to parse chord symbol: %s' % figure)
+
+  def transpose_chord_symbol(self, figure, transpose_amount):
+    parsed = self._parse(figure)
+    if parsed is None:
+      self._check_fallback(figure)
+      return self._fallback.transpose_chord_symbol(figure, transpose_amount)
+    transposed_figure = _transpose_pitch_name(
+        parsed.letter, parsed.offset, transpose_amount) + parsed.suffix
+    if parsed.bass is not None:
+      transposed_figure += '/' + _transpose_pitch_name(
+          parsed.bass[0], parsed.bass[1], transpose_amount)
+    return transposed_figure
+
+  def chord_symbol_midi_pitches(self, figure):
+    parsed = self._parse(figure)
+    if parsed is None:
+      self._check_fallback(figure)
+      return self._fallback.chord_symbol_midi_pitches(figure)
+    return _voice_chord_symbol(parsed)
+
+  def chord_symbol_root(self, figure):
+    parsed = self._parse(figure)
+    if parsed is None:
+      self._check_fallback(figure)
+      return self._fallback.chord_symbol_root(figure)
+    return parsed.root
+
+  def chord_symbol_quality(self, figure):
+    parsed = self._parse(figure)
+    if parsed is None:
+      self._check_fallback(figure)
+      return self._fallback.chord_symbol_quality(figure)
+    return parsed.quality
+
+
 class Music21ChordSymbolFunctions(ChordSymbolFunctions):
   """A class that uses music21 to interpret chord symbol strings."""
 
@@ -154,6 +609,10 @@ class Music21ChordSymbolFunctions(ChordSymbolFunctions):
     if figure in self._music21_chord_symbol_dict:
       return self._music21_chord_symbol_dict[figure]
 
+    # music21 takes seconds to import, so it is only imported once a figure
+    # needs it.
+    import music21  # pylint: disable=g-import-not-at-top
+
     try:
       cs = music21.harmony.ChordSymbol(figure)
       self._music21_chord_symbol_dict[figure] = cs
@@ -200,3 +659,346 @@ class Music21ChordSymbolFunctions(ChordSymbolFunctions):
       return CHORD_QUALITY_OTHER
     else:
       return self._music21_chord_quality_mapping[quality_string]
+
+
+class CachedChordSymbolFunctions(ChordSymbolFunctions):
+  """Caches another ChordSymbolFunctions object's results in an sqlite file.
+
+  The root, quality and MIDI pitches of a figure are computed together the
+  first time any of them is requested, and each transposition of a figure is
+  computed the first time it is requested. Results are stored in the file, so
+  they are shared by every process and run using the same file, and are also
+  memoized in memory. Figures that cannot be interpreted are not cached.
+  """
+
+  def __init__(self, chord_symbol_functions, path):
+    """Construct a CachedChordSymbolFunctions object.
+
+    Args:
+      chord_symbol_functions: The ChordSymbolFunctions object whose results are
+          cached. Its class name and version are part of each cache entry's
+          key, so different implementations and versions can share a file.
+      path: Path to the sqlite database file, which is created if needed.
+    """
+    self._chord_symbol_functions = chord_symbol_functions
+    self._functions_name = '%s-%d' % (type(chord_symbol_functions).__name__,
+                                      chord_symbol_functions.version)
+    self._path = path
+    self._connection = None
+    self._connection_pid = None
+    self._chords = {}
+    self._transpositions = {}
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['_connection'] = None
+    state['_connection_pid'] = None
+    return state
+
+  def _connect(self):
+    """Returns this process's connection to the cache, opening it if needed.
+
+    A connection cannot be used by processes forked after it was opened, so
+    each worker process of `pipeline.run_pipeline_parallel` opens its own.
+
+    Returns:
+      A sqlite3.Connection.
+    """
+    if self._connection_pid != os.getpid():
+      # Wait for other processes' writes rather than failing.
+      self._connection = sqlite3.connect(self._path, timeout=60.0,
+                                         isolation_level=None)
+      self._connection_pid = os.getpid()
+      self._connection.text_factory = str
+      # Write-ahead logging lets readers proceed while another process writes.
+      self._connection.execute('PRAGMA journal_mode = WAL')
+      self._connection.execute('PRAGMA synchronous = OFF')
+      self._connection.execute(
+          'CREATE TABLE IF NOT EXISTS chords '
+          '(functions TEXT, figure TEXT, root INTEGER NOT NULL, '
+          'quality INTEGER NOT NULL, pitches TEXT NOT NULL, '
+          'PRIMARY KEY (functions, figure))')
+      self._connection.execute(
+          'CREATE TABLE IF NOT EXISTS transpositions '
+          '(functions TEXT, figure TEXT, amount INTEGER, '
+          'transposed TEXT NOT NULL, PRIMARY KEY (functions, figure, amount))')
+    return self._connection
+
+  def _chord(self, figure):
+    """Returns the (root, quality, MIDI pitches) of a figure."""
+    if figure in self._chords:
+      return self._chords[figure]
+
+    row = self._connect().execute(
+        'SELECT root, quality, pitches FROM chords '
+        'WHERE functions = ? AND figure = ?',
+        (self._functions_name, figure)).fetchone()
+    if row:
+      root, quality, pitches = row
+      pitches = [int(pitch) for pitch in pitches.split(',') if pitch]
+    else:
+      root = self._chord_symbol_functions.chord_symbol_root(figure)
+      quality = self._chord_symbol_functions.chord_symbol_quality(figure)
+      pitches = self._chord_symbol_functions.chord_symbol_midi_pitches(figure)
+      self._connect().execute(
+          'INSERT OR IGNORE INTO chords VALUES (?, ?, ?, ?, ?)',
+          (self._functions_name, figure, root, quality,
+           ','.join(str(pitch) for pitch in pitches)))
+
+    self._chords[figure] = (root, quality, pitches)
+    return self._chords[figure]
+
+  def transpose_chord_symbol(self, figure, transpose_amount):
+    key = (figure, transpose_amount)
+    if key in self._transpositions:
+      return self._transpositions[key]
+
+    row = self._connect().execute(
+        'SELECT transposed FROM transpositions '
+        'WHERE functions = ? AND figure = ? AND amount = ?',
+        (self._functions_name, figure, transpose_amount)).fetchone()
+    if row:
+      transposed_figure = row[0]
+    else:
+      transposed_figure = self._chord_symbol_functions.transpose_chord_symbol(
+          figure, transpose_amount)
+      self._connect().execute(
+          'INSERT OR IGNORE INTO transpositions VALUES (?, ?, ?, ?)',
+          (self._functions_name, figure, transpose_amount, transposed_figure))
+
+    self._transpositions[key] = transposed_figure
+    return transposed_figure
+
+  def chord_symbol_midi_pitches(self, figure):
+    return list(self._chord(figure)[2])
+
+  def chord_symbol_root(self, figure):
+    return self._chord(figure)[0]
+
+  def chord_symbol_quality(self, figure):
+    return self._chord(figure)[1]
+
+  def close(self):
+    """Closes this process's connection to the cache, if it has one.
+
+    A connection inherited from the process that forked this one is left for
+    that process to close.
+    """
+    if self._connection_pid == os.getpid():
+      self._connection.close()
+    self._connection = None
+    self._connection_pid = None
+
+
+class ChordVocabulary(object):
+  """Interns chord symbol figures as compact integer ids.
+
+  Each distinct figure is assigned an id the first time it is interned, with
+  NO_CHORD always id 0, so a corpus of chord progressions can be stored and
+  encoded as integers. The root, quality, and MIDI pitches of each id are
+  interpreted once, the first time any of them is requested, and each id's
+  transpositions are recorded in a map from transpose amount to transposed id.
+  Figures that cannot be interpreted are interned but not interpreted.
+
+  Interning is thread-safe. Ids are never removed, so a vocabulary grows with
+  the number of distinct figures interned in it; the shared vocabulary returned
+  by `get` holds every figure interned by default in the process. Interning
+  figures from an unbounded source, such as arbitrary user text, should use a
+  separate vocabulary that can be discarded.
+  """
+
+  NO_CHORD_ID = 0
+
+  _shared_vocabulary = None
+
+  def __init__(self, chord_symbol_functions=None):
+    """Construct a ChordVocabulary object.
+
+    Args:
+      chord_symbol_functions: The ChordSymbolFunctions object with which to
+          interpret and transpose figures. If None, the default implementation
+          is used.
+    """
+    if chord_symbol_functions is None:
+      chord_symbol_functions = ChordSymbolFunctions.get()
+    self._chord_symbol_functions = chord_symbol_functions
+    self._lock = threading.Lock()
+    self._figures = []
+    self._ids = {}
+    # Per-id (root, quality, MIDI pitches) tuples, or None if not interpreted.
+    self._chords = []
+    # Per-id lists of transposed ids indexed by transpose amount, or None.
+    self._transpositions = []
+    self.intern(NO_CHORD)
+
+  @staticmethod
+  def get():
+    """Returns the vocabulary shared by everything in this process."""
+    return _shared_chord_vocabulary()
+
+  def __reduce_ex__(self, protocol):
+    # The shared vocabulary unpickles as the unpickling process's own.
+    if self is ChordVocabulary._shared_vocabulary:
+      return _shared_chord_vocabulary, ()
+    return super(ChordVocabulary, self).__reduce_ex__(protocol)
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    del state['_lock']
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._lock = threading.Lock()
+
+  @property
+  def chord_symbol_functions(self):
+    return self._chord_symbol_functions
+
+  def __len__(self):
+    return len(self._figures)
+
+  def __contains__(self, figure):
+    return figure in self._ids
+
+  def intern(self, figure):
+    """Returns the id of a chord symbol figure, adding it if needed.
+
+    Args:
+      figure: A chord symbol figure string.
+
+    Returns:
+      The integer id of `figure`.
+    """
+    chord_id = self._ids.get(figure)
+    if chord_id is None:
+      with self._lock:
+        chord_id = self._ids.get(figure)
+        if chord_id is None:
+          chord_id = len(self._figures)
+          # The per-id lists are extended before the id is published.
+          self._figures.append(figure)
+          self._chords.append(None)
+          self._transpositions.append(None)
+          self._ids[figure] = chord_id
+    return chord_id
+
+  def figure(self, chord_id):
+    """Returns the chord symbol figure string with the given id."""
+    return self._figures[chord_id]
+
+  def _chord(self, chord_id):
+    """Returns the (root, quality, MIDI pitches) of the chord with an id."""
+    chord = self._chords[chord_id]
+    if chord is None:
+      figure = self._figures[chord_id]
+      chord = (self._chord_symbol_functions.chord_symbol_root(figure),
+               self._chord_symbol_functions.chord_symbol_quality(figure),
+               tuple(self._chord_symbol_functions.chord_symbol_midi_pitches(
+                   figure)))
+      self._chords[chord_id] = chord
+    return chord
+
+  def root(self, chord_id):
+    """Returns the root pitch class of the chord with the given id.
+
+    Args:
+      chord_id: The id of a chord other than NO_CHORD.
+
+    Returns:
+      The pitch class of the chord root, an integer between 0 and 11 inclusive.
+
+    Raises:
+      ChordSymbolException: If the chord symbol cannot be interpreted.
+    """
+    return self._chord(chord_id)[0]
+
+  def quality(self, chord_id):
+    """Returns the quality of the chord with the given id.
+
+    Args:
+      chord_id: The id of a chord other than NO_CHORD.
+
+    Returns:
+      One of CHORD_QUALITY_MAJOR, CHORD_QUALITY_MINOR, CHORD_QUALITY_AUGMENTED,
+      CHORD_QUALITY_DIMINISHED, or CHORD_QUALITY_OTHER.
+
+    Raises:
+      ChordSymbolException: If the chord symbol cannot be interpreted.
+    """
+    return self._chord(chord_id)[1]
+
+  def midi_pitches(self, chord_id):
+    """Returns the pitches of the chord with the given id as MIDI note values.
+
+    Args:
+      chord_id: The id of a chord other than NO_CHORD.
+
+    Returns:
+      A python list of pitches as integer MIDI note values.
+
+    Raises:
+      ChordSymbolException: If the chord symbol cannot be interpreted.
+    """
+    return list(self._chord(chord_id)[2])
+
+  def transpose(self, chord_id, transpose_amount):
+    """Returns the id of a chord transposed by the given amount.
+
+    NO_CHORD transposes to itself, and transpose amounts are taken modulo an
+    octave.
+
+    Args:
+      chord_id: The id of the chord to transpose.
+      transpose_amount: The integer number of half steps to transpose.
+
+    Returns:
+      The id of the transposed chord.
+
+    Raises:
+      ChordSymbolException: If the chord symbol cannot be interpreted.
+    """
+    transpose_amount %= NOTES_PER_OCTAVE
+    if chord_id == self.NO_CHORD_ID:
+      return chord_id
+    transpositions = self._transpositions[chord_id]
+    if transpositions is None:
+      transpositions = [None] * NOTES_PER_OCTAVE
+      self._transpositions[chord_id] = transpositions
+    if transpositions[transpose_amount] is None:
+      transposed_figure = self._chord_symbol_functions.transpose_chord_symbol(
+          self._figures[chord_id], transpose_amount)
+      transpositions[transpose_amount] = self.intern(transposed_figure)
+    return transpositions[transpose_amount]
+
+
+_shared_chord_vocabulary_lock = threading.Lock()
+_shared_chord_cache_path = None
+
+
+def _shared_chord_vocabulary():
+  """Returns the ChordVocabulary shared by everything in this process."""
+  if ChordVocabulary._shared_vocabulary is None:
+    with _shared_chord_vocabulary_lock:
+      if ChordVocabulary._shared_vocabulary is None:
+        ChordVocabulary._shared_vocabulary = ChordVocabulary(
+            ChordSymbolFunctions.get(cache_path=_shared_chord_cache_path))
+  return ChordVocabulary._shared_vocabulary
+
+
+def set_shared_chord_cache_path(path):
+  """Caches the shared ChordVocabulary's interpretations in an sqlite file.
+
+  Processes forked afterwards, such as the workers of
+  `pipeline.run_pipeline_parallel`, inherit the setting, so they and later
+  runs using the same file interpret each figure only once between them.
+
+  Args:
+    path: Path to the sqlite database file, or None to stop caching.
+  """
+  global _shared_chord_cache_path
+  with _shared_chord_vocabulary_lock:
+    _shared_chord_cache_path = path
+    if ChordVocabulary._shared_vocabulary is not None:
+      ChordVocabulary._shared_vocabulary._chord_symbol_functions = (
+          ChordSymbolFunctions.get(cache_path=path))
@@ -13,6 +13,12 @@
 # limitations under the License.
 """Tests for chord_symbols_lib."""
 
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+
 # internal imports
 import tensorflow as tf
 
@@ -23,6 +29,36 @@ CHORD_QUALITY_MINOR = chord_symbols_lib.CHORD_QUALITY_MINOR
 CHORD_QUALITY_AUGMENTED = chord_symbols_lib.CHORD_QUALITY_AUGMENTED
 CHORD_QUALITY_DIMINISHED = chord_symbols_lib.CHORD_QUALITY_DIMINISHED
 CHORD_QUALITY_OTHER = chord_symbols_lib.CHORD_QUALITY_OTHER
+NO_CHORD = chord_symbols_lib.NO_CHORD
+NO_CHORD_ID = chord_symbols_lib.ChordVocabulary.NO_CHORD_ID
+
+
+class CountingChordSymbolFunctions(
+    chord_symbols_lib.BasicChordSymbolFunctions):
+  """Counts the calls to BasicChordSymbolFunctions."""
+
+  def __init__(self):
+    super(CountingChordSymbolFunctions, self).__init__()
+    self.num_calls = 0
+
+  def transpose_chord_symbol(self, figure, transpose_amount):
+    self.num_calls += 1
+    return super(CountingChordSymbolFunctions, self).transpose_chord_symbol(
+        figure, transpose_amount)
+
+  def chord_symbol_midi_pitches(self, figure):
+    self.num_calls += 1
+    return super(
+        CountingChordSymbolFunctions, self).chord_symbol_midi_pitches(figure)
+
+  def chord_symbol_root(self, figure):
+    self.num_calls += 1
+    return super(CountingChordSymbolFunctions, self).chord_symbol_root(figure)
+
+  def chord_symbol_quality(self, figure):
+    self.num_calls += 1
+    return super(CountingChordSymbolFunctions, self).chord_symbol_quality(
+        figure)
 
 
 class ChordSymbolFunctionsTest(tf.test.TestCase):
@@ -45,7 +81,17 @@ class ChordSymbolFunctionsTest(tf.test.TestCase):
     figure = self.chord_symbol_functions.transpose_chord_symbol('D+', -3)
     self.assertEqual('B+', figure)
     figure = self.chord_symbol_functions.transpose_chord_symbol('F-9/A-', 2)
-    self.assertEqual('G-9/B-', figure)
+    self.assertEqual('F#9/B-', figure)
+
+    # Test that pitch names are spelled the way music21 spells them.
+    figure = self.chord_symbol_functions.transpose_chord_symbol('C', -4)
+    self.assertEqual('G#', figure)
+    figure = self.chord_symbol_functions.transpose_chord_symbol('D-m', -4)
+    self.assertEqual('Am', figure)
+    figure = self.chord_symbol_functions.transpose_chord_symbol('F#', 6)
+    self.assertEqual('C', figure)
+    figure = self.chord_symbol_functions.transpose_chord_symbol('C/E', 6)
+    self.assertEqual('F#/B-', figure)
 
   def testMidiPitches(self):
     # Check that pitch classes are correct.
@@ -70,6 +116,41 @@ class ChordSymbolFunctionsTest(tf.test.TestCase):
     bass_pitch_class = min(pitches) % 12
     self.assertEqual(6, bass_pitch_class)
 
+  def testMidiPitchesVoicing(self):
+    # Test that chords are voiced the way music21 voices them.
+    self.assertEqual(
+        [48, 52, 55],
+        self.chord_symbol_functions.chord_symbol_midi_pitches('C'))
+    self.assertEqual(
+        [45, 48, 52],
+        self.chord_symbol_functions.chord_symbol_midi_pitches('Am'))
+    self.assertEqual(
+        [36, 40, 43, 46, 50, 53, 57],
+        self.chord_symbol_functions.chord_symbol_midi_pitches('C13'))
+    self.assertEqual(
+        [34, 38, 41, 44, 48, 51],
+        self.chord_symbol_functions.chord_symbol_midi_pitches('B-11'))
+    self.assertEqual(
+        [36, 40, 43, 46, 54],
+        self.chord_symbol_functions.chord_symbol_midi_pitches('C7#11'))
+
+    # Test inversions and other slash chords.
+    self.assertEqual(
+        [52, 55, 60],
+        self.chord_symbol_functions.chord_symbol_midi_pitches('C/E'))
+    self.assertEqual(
+        [43, 48, 52],
+        self.chord_symbol_functions.chord_symbol_midi_pitches('C/G'))
+    self.assertEqual(
+        [43, 45, 48, 52],
+        self.chord_symbol_functions.chord_symbol_midi_pitches('Am7/G'))
+    self.assertEqual(
+        [52, 55, 58, 60, 62],
+        self.chord_symbol_functions.chord_symbol_midi_pitches('C9/E'))
+    self.assertEqual(
+        [38, 48, 52, 55],
+        self.chord_symbol_functions.chord_symbol_midi_pitches('C/D'))
+
   def testRoot(self):
     root = self.chord_symbol_functions.chord_symbol_root('Dm9')
     self.assertEqual(2, root)
@@ -117,6 +198,188 @@ class ChordSymbolFunctionsTest(tf.test.TestCase):
     quality = self.chord_symbol_functions.chord_symbol_quality('Dsus')
     self.assertEqual(CHORD_QUALITY_OTHER, quality)
 
+  def testQualityWithoutFifth(self):
+    # Test that chords with an omitted 5th have the quality music21 gives them.
+    music21_chord_symbol_functions = (
+        chord_symbols_lib.Music21ChordSymbolFunctions())
+    for figure in ['Comit5', 'Cm omit5', 'C+ omit5', 'Cdim omit5',
+                   'Cmaj7 omit5', 'Cm7 omit5', 'CmM7 omit5', 'Cdim7 omit5',
+                   'Cm7b5 omit5', 'C7#9 omit5', 'Cm9 omit5', 'C13 omit5']:
+      self.assertEqual(
+          music21_chord_symbol_functions.chord_symbol_quality(figure),
+          self.chord_symbol_functions.chord_symbol_quality(figure), figure)
+
+    quality = self.chord_symbol_functions.chord_symbol_quality('Cm7 omit5')
+    self.assertEqual(CHORD_QUALITY_MINOR, quality)
+    quality = self.chord_symbol_functions.chord_symbol_quality('C7 no5')
+    self.assertEqual(CHORD_QUALITY_MAJOR, quality)
+    quality = self.chord_symbol_functions.chord_symbol_quality('Cmaj7 omit5')
+    self.assertEqual(CHORD_QUALITY_MAJOR, quality)
+    quality = self.chord_symbol_functions.chord_symbol_quality('C7 omit3')
+    self.assertEqual(CHORD_QUALITY_OTHER, quality)
+
+  def testModifications(self):
+    # Test figures in the form music21 writes them.
+    pitches = self.chord_symbol_functions.chord_symbol_midi_pitches(
+        'C7 add b9')
+    pitch_classes = set(pitch % 12 for pitch in pitches)
+    self.assertEqual(set([0, 1, 4, 7, 10]), pitch_classes)
+    quality = self.chord_symbol_functions.chord_symbol_quality('G7 alter #5')
+    self.assertEqual(CHORD_QUALITY_AUGMENTED, quality)
+    figure = self.chord_symbol_functions.transpose_chord_symbol(
+        'G7 alter #5', 3)
+    self.assertEqual('B-7 alter #5', figure)
+
+    pitches = self.chord_symbol_functions.chord_symbol_midi_pitches('C9omit3')
+    pitch_classes = set(pitch % 12 for pitch in pitches)
+    self.assertEqual(set([0, 2, 7, 10]), pitch_classes)
+    quality = self.chord_symbol_functions.chord_symbol_quality('C9omit3')
+    self.assertEqual(CHORD_QUALITY_OTHER, quality)
+
+    # Test figures whose modifications start like a chord kind.
+    pitches = self.chord_symbol_functions.chord_symbol_midi_pitches('C7sus2')
+    self.assertEqual([48, 50, 55, 58], pitches)
+    pitches = self.chord_symbol_functions.chord_symbol_midi_pitches('Comit3')
+    self.assertEqual([48, 55], pitches)
+
+    # As in music21, 'b' is only a flat in modifications.
+    self.assertEqual(11, self.chord_symbol_functions.chord_symbol_root('Bb7'))
+    pitches = self.chord_symbol_functions.chord_symbol_midi_pitches('Bb7')
+    pitch_classes = set(pitch % 12 for pitch in pitches)
+    self.assertEqual(set([3, 6, 9, 11]), pitch_classes)
+
+  def testBasicChordSymbolFunctionsUnknownFigure(self):
+    chord_symbol_functions = chord_symbols_lib.BasicChordSymbolFunctions()
+    self.assertEqual(0, chord_symbol_functions.chord_symbol_root('Cm7'))
+    with self.assertRaises(chord_symbols_lib.ChordSymbolException):
+      chord_symbol_functions.chord_symbol_root('P#13')
+    with self.assertRaises(chord_symbols_lib.ChordSymbolException):
+      chord_symbol_functions.transpose_chord_symbol('C7alt', 2)
+
+  def testChordVocabulary(self):
+    counting = CountingChordSymbolFunctions()
+    vocabulary = chord_symbols_lib.ChordVocabulary(counting)
+    self.assertEqual(chord_symbols_lib.ChordVocabulary.NO_CHORD_ID,
+                     vocabulary.intern(NO_CHORD))
+    dm9 = vocabulary.intern('Dm9')
+    self.assertEqual(dm9, vocabulary.intern('Dm9'))
+    self.assertEqual(2, len(vocabulary))
+    self.assertEqual('Dm9', vocabulary.figure(dm9))
+    self.assertTrue('Dm9' in vocabulary)
+    self.assertFalse('Em9' in vocabulary)
+
+    for _ in range(2):
+      self.assertEqual(2, vocabulary.root(dm9))
+      self.assertEqual(CHORD_QUALITY_MINOR, vocabulary.quality(dm9))
+      self.assertEqual([38, 41, 45, 48, 52], vocabulary.midi_pitches(dm9))
+      em9 = vocabulary.transpose(dm9, 14)
+      self.assertEqual('Em9', vocabulary.figure(em9))
+      self.assertEqual(dm9, vocabulary.transpose(em9, -2))
+      self.assertEqual(NO_CHORD_ID, vocabulary.transpose(NO_CHORD_ID, 3))
+    # Dm9 was interpreted once and each transposition was computed once.
+    self.assertEqual(5, counting.num_calls)
+
+    with self.assertRaises(chord_symbols_lib.ChordSymbolException):
+      vocabulary.root(vocabulary.intern('P#13'))
+
+  def testChordVocabularyThreads(self):
+    vocabulary = chord_symbols_lib.ChordVocabulary()
+    figures = ['%s%s' % (root, kind) for root in 'CDEFGAB'
+               for kind in ['', 'm', '7', 'm7', 'maj7', 'dim']]
+
+    def intern_all():
+      for figure in figures:
+        vocabulary.intern(figure)
+
+    threads = [threading.Thread(target=intern_all) for _ in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(len(figures) + 1, len(vocabulary))
+    for figure in figures:
+      self.assertEqual(figure, vocabulary.figure(vocabulary.intern(figure)))
+
+  def testPickleChordVocabulary(self):
+    vocabulary = chord_symbols_lib.ChordVocabulary()
+    dm9 = vocabulary.intern('Dm9')
+    vocabulary_copy = pickle.loads(pickle.dumps(vocabulary))
+    self.assertEqual('Dm9', vocabulary_copy.figure(dm9))
+    self.assertEqual('Em9', vocabulary_copy.figure(
+        vocabulary_copy.transpose(dm9, 2)))
+    # The shared vocabulary unpickles as the shared vocabulary.
+    shared = chord_symbols_lib.ChordVocabulary.get()
+    self.assertTrue(shared is pickle.loads(pickle.dumps(shared)))
+
+  def testCachedChordSymbolFunctions(self):
+    path = os.path.join(tempfile.mkdtemp(dir=self.get_temp_dir()), 'chords.db')
+    for _ in range(2):
+      counting = CountingChordSymbolFunctions()
+      cached = chord_symbols_lib.CachedChordSymbolFunctions(counting, path)
+      for _ in range(2):
+        self.assertEqual('F#9/B-',
+                         cached.transpose_chord_symbol('F-9/A-', 2))
+        self.assertEqual(2, cached.chord_symbol_root('Dm9'))
+        self.assertEqual(CHORD_QUALITY_MINOR,
+                         cached.chord_symbol_quality('Dm9'))
+        self.assertEqual([38, 41, 45, 48, 52],
+                         cached.chord_symbol_midi_pitches('Dm9'))
+      cached.close()
+    # The second instance read every result from the file.
+    self.assertEqual(0, counting.num_calls)
+
+    cached = chord_symbols_lib.ChordSymbolFunctions.get(cache_path=path)
+    with self.assertRaises(chord_symbols_lib.ChordSymbolException):
+      cached.chord_symbol_root('P#13')
+    cached.close()
+
+  def testCachedChordSymbolFunctionsVersion(self):
+    path = os.path.join(tempfile.mkdtemp(dir=self.get_temp_dir()), 'chords.db')
+    counting = CountingChordSymbolFunctions()
+    cached = chord_symbols_lib.CachedChordSymbolFunctions(counting, path)
+    self.assertEqual(2, cached.chord_symbol_root('Dm9'))
+    cached.close()
+
+    # A new version doesn't read the old version's results.
+    counting = CountingChordSymbolFunctions()
+    counting.version += 1
+    cached = chord_symbols_lib.CachedChordSymbolFunctions(counting, path)
+    self.assertEqual(2, cached.chord_symbol_root('Dm9'))
+    self.assertEqual(3, counting.num_calls)
+    cached.close()
+
+  def testPickleCachedChordSymbolFunctions(self):
+    path = os.path.join(tempfile.mkdtemp(dir=self.get_temp_dir()), 'chords.db')
+    cached = chord_symbols_lib.CachedChordSymbolFunctions(
+        CountingChordSymbolFunctions(), path)
+    self.assertEqual(2, cached.chord_symbol_root('Dm9'))
+    # The copy opens its own connection to the same file.
+    cached_copy = pickle.loads(pickle.dumps(cached))
+    self.assertEqual('Em9', cached_copy.transpose_chord_symbol('Dm9', 2))
+    cached.close()
+    self.assertEqual('Em9', cached_copy.transpose_chord_symbol('Dm9', 2))
+    cached_copy.close()
+
+  def testSetSharedChordCachePath(self):
+    path = os.path.join(tempfile.mkdtemp(dir=self.get_temp_dir()), 'chords.db')
+    vocabulary = chord_symbols_lib.ChordVocabulary.get()
+    chord_symbols_lib.set_shared_chord_cache_path(path)
+    try:
+      self.assertTrue(isinstance(vocabulary.chord_symbol_functions,
+                                 chord_symbols_lib.CachedChordSymbolFunctions))
+      self.assertEqual(2, vocabulary.root(vocabulary.intern('Dm9')))
+    finally:
+      vocabulary.chord_symbol_functions.close()
+      chord_symbols_lib.set_shared_chord_cache_path(None)
+    self.assertFalse(isinstance(vocabulary.chord_symbol_functions,
+                                chord_symbols_lib.CachedChordSymbolFunctions))
+
+    # The interpretation was written to the file.
+    connection = sqlite3.connect(path)
+    self.assertEqual([('Dm9',)], connection.execute(
+        'SELECT figure FROM chords').fetchall())
+    connection.close()
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -21,8 +21,11 @@ NoteSequence proto, encoding the chords as text annotations.
 """
 
 import abc
-import copy
+import bisect
+import itertools
 
+# internal imports
+import numpy as np
 from six.moves import range  # pylint: disable=redefined-builtin
 
 from magenta.music import chord_symbols_lib
@@ -52,6 +55,187 @@ class ChordEncodingException(Exception):
   pass
 
 
+class _ChordRuns(object):
+  """A list of chord figures stored as runs of repeated chord ids.
+
+  Chords usually last for many steps, so storing each chord change once makes
+  the storage, transposition, and iteration by chord proportional to the
+  number of chord changes rather than the number of steps. Each run's figure
+  is stored as its id in a ChordVocabulary. The list supports `len`,
+  iteration, indexing, slicing (which returns a python list), and `append`,
+  all in terms of figures; other modifications go through methods that
+  rebuild the runs.
+  """
+  __slots__ = ('_vocabulary', '_starts', '_ids', '_length')
+
+  def __init__(self, events=(), vocabulary=None):
+    """Construct a _ChordRuns object.
+
+    Args:
+      events: An iterable of chord figures, one per step.
+      vocabulary: The ChordVocabulary in which figures are interned. If None,
+          the shared vocabulary is used.
+    """
+    if vocabulary is None:
+      vocabulary = chord_symbols_lib.ChordVocabulary.get()
+    self._vocabulary = vocabulary
+    self._starts = []
+    self._ids = []
+    self._length = 0
+    for event in events:
+      self.append(event)
+
+  def __reduce__(self):
+    # Chord ids are only meaningful within one vocabulary, so pickle figures
+    # and re-intern them in the same vocabulary.
+    return _ChordRuns, (list(self), self._vocabulary)
+
+  def _pairs(self, start=0, end=None):
+    """Returns (chord id, num_steps) pairs for the runs within [start, end)."""
+    if end is None:
+      end = self._length
+    pairs = []
+    if start >= end:
+      return pairs
+    first_run = bisect.bisect_right(self._starts, start) - 1
+    for i in range(first_run, len(self._starts)):
+      run_start = max(self._starts[i], start)
+      if run_start >= end:
+        break
+      run_end = (self._starts[i + 1] if i + 1 < len(self._starts)
+                 else self._length)
+      pairs.append((self._ids[i], min(run_end, end) - run_start))
+    return pairs
+
+  def _set_pairs(self, pairs):
+    """Replaces the runs with (chord id, num_steps) pairs, merging repeats."""
+    self._starts = []
+    self._ids = []
+    self._length = 0
+    for chord_id, num_steps in pairs:
+      if num_steps <= 0:
+        continue
+      if not self._ids or self._ids[-1] != chord_id:
+        self._starts.append(self._length)
+        self._ids.append(chord_id)
+      self._length += num_steps
+
+  @property
+  def vocabulary(self):
+    return self._vocabulary
+
+  def copy(self):
+    """Returns a copy of this _ChordRuns object."""
+    runs = _ChordRuns(vocabulary=self._vocabulary)
+    runs._starts = list(self._starts)
+    runs._ids = list(self._ids)
+    runs._length = self._length
+    return runs
+
+  def id_runs(self):
+    """Returns a list of (start, end, chord id) tuples, one per chord change."""
+    return list(zip(self._starts, self._starts[1:] + [self._length],
+                    self._ids))
+
+  def runs(self):
+    """Returns a list of (start, end, figure) tuples, one per chord change."""
+    return [(start, end, self._vocabulary.figure(chord_id))
+            for start, end, chord_id in self.id_runs()]
+
+  def ids(self):
+    """Returns an iterator over the chord id of each step."""
+    return itertools.chain.from_iterable(
+        itertools.repeat(chord_id, end - start)
+        for start, end, chord_id in self.id_runs())
+
+  def __len__(self):
+    return self._length
+
+  def __iter__(self):
+    figure = self._vocabulary.figure
+    return (figure(chord_id) for chord_id in self.ids())
+
+  def id_at(self, i):
+    """Returns the chord id of step `i`."""
+    if i < 0:
+      i += self._length
+    if not 0 <= i < self._length:
+      raise IndexError('chord index out of range: %d' % i)
+    return self._ids[bisect.bisect_right(self._starts, i) - 1]
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return list(self)[i]
+    return self._vocabulary.figure(self.id_at(i))
+
+  def append(self, figure):
+    chord_id = self._vocabulary.intern(figure)
+    if not self._ids or self._ids[-1] != chord_id:
+      self._starts.append(self._length)
+      self._ids.append(chord_id)
+    self._length += 1
+
+  def set_range(self, start, end, figure):
+    """Sets the figure of steps [start, end), padding with `figure` if needed.
+
+    Args:
+      start: The first step to set.
+      end: One past the last step to set.
+      figure: The chord figure.
+    """
+    self._set_pairs(self._pairs(0, start) +
+                    [(self._vocabulary.intern(figure), end - start)] +
+                    self._pairs(end))
+
+  def resize(self, length, pad_event, from_left=False):
+    """Truncates or pads the runs to `length` steps.
+
+    Args:
+      length: The new number of steps.
+      pad_event: The figure to pad with.
+      from_left: Whether to add or remove steps on the left.
+    """
+    num_steps = length - self._length
+    pad_id = self._vocabulary.intern(pad_event)
+    if from_left:
+      if num_steps > 0:
+        self._set_pairs([(pad_id, num_steps)] + self._pairs())
+      else:
+        self._set_pairs(self._pairs(-num_steps))
+    elif num_steps > 0:
+      self._set_pairs(self._pairs() + [(pad_id, num_steps)])
+    else:
+      self._set_pairs(self._pairs(0, length))
+
+  def map_ids(self, function):
+    """Replaces each run's chord id `i` with `function(i)`.
+
+    If `function` raises an exception, the runs are left unchanged.
+
+    Args:
+      function: A function from chord id to chord id.
+    """
+    self._set_pairs([(function(chord_id), end - start)
+                     for start, end, chord_id in self.id_runs()])
+
+  def map_figures(self, function):
+    """Replaces each run's figure `f` with `function(f)`.
+
+    If `function` raises an exception, the runs are left unchanged.
+
+    Args:
+      function: A function from chord figure to chord figure.
+    """
+    figure = self._vocabulary.figure
+    intern = self._vocabulary.intern
+    self.map_ids(lambda chord_id: intern(function(figure(chord_id))))
+
+  def scale(self, k):
+    """Repeats each step `k` times."""
+    self._starts = [start * k for start in self._starts]
+    self._length *= k
+
+
 class ChordProgression(events_lib.SimpleEventSequence):
   """Stores a quantized stream of chord events.
 
@@ -72,6 +256,12 @@ class ChordProgression(events_lib.SimpleEventSequence):
 
   Chords must be inserted in ascending order by start time.
 
+  The events are stored as runs of repeated chords, so transposition and
+  `runs` take time proportional to the number of chord changes rather than
+  the number of steps. Each chord is stored as its id in a ChordVocabulary,
+  available through `chord_id` and `chord_ids`, so chords are interpreted
+  and transposed once per vocabulary rather than once per progression.
+
   Attributes:
     start_step: The offset of the first step of the progression relative to the
         beginning of the source sequence.
@@ -81,16 +271,118 @@ class ChordProgression(events_lib.SimpleEventSequence):
     steps_per_bar: Number of steps in a bar (measure) of music.
   """
 
-  def __init__(self, events=None, **kwargs):
-    """Construct a ChordProgression."""
+  def __init__(self, events=None, vocabulary=None, **kwargs):
+    """Construct a ChordProgression.
+
+    Args:
+      events: List of chord figures to instantiate with.
+      vocabulary: The chord_symbols_lib.ChordVocabulary in which the chord
+          figures are interned. If None, the vocabulary shared by the process
+          is used.
+      **kwargs: Keyword arguments passed to SimpleEventSequence.
+    """
+    if vocabulary is None:
+      vocabulary = chord_symbols_lib.ChordVocabulary.get()
+    self._vocabulary = vocabulary
     super(ChordProgression, self).__init__(pad_event=NO_CHORD,
                                            events=events, **kwargs)
 
+  def _reset(self):
+    """Clear events and reset object state."""
+    super(ChordProgression, self)._reset()
+    self._events = _ChordRuns(vocabulary=self._vocabulary)
+
+  def __getstate__(self):
+    state = super(ChordProgression, self).__getstate__()
+    state['vocabulary'] = self._vocabulary
+    return state
+
+  def __setstate__(self, state):
+    self._vocabulary = state['vocabulary']
+    super(ChordProgression, self).__setstate__(state)
+
+  def _from_event_list(self, events, start_step=0,
+                       steps_per_bar=events_lib.DEFAULT_STEPS_PER_BAR,
+                       steps_per_quarter=events_lib.DEFAULT_STEPS_PER_QUARTER):
+    """Initializes with a list of chord figures and sets attributes."""
+    super(ChordProgression, self)._from_event_list(
+        events, start_step=start_step, steps_per_bar=steps_per_bar,
+        steps_per_quarter=steps_per_quarter)
+    self._events = _ChordRuns(self._events, self._vocabulary)
+
   def __deepcopy__(self, unused_memo=None):
-    return type(self)(events=copy.deepcopy(self._events),
-                      start_step=self.start_step,
-                      steps_per_bar=self.steps_per_bar,
-                      steps_per_quarter=self.steps_per_quarter)
+    """Returns a copy of this ChordProgression.
+
+    Chord symbol strings are immutable, so the copy shares this progression's
+    chord runs until either progression is modified.
+    """
+    return self._copy_on_write()
+
+  def _own_events(self):
+    """Copies the chord runs if they are shared with another progression."""
+    if self._events_shared:
+      self._events = self._events.copy()
+      self._events_shared = False
+
+  def runs(self):
+    """Returns the chords of this progression with their durations.
+
+    Returns:
+      A list of (start, end, figure) tuples, one for each chord change, where
+      `figure` is the chord at steps [start, end) of this progression.
+    """
+    return self._events.runs()
+
+  @property
+  def vocabulary(self):
+    """The chord_symbols_lib.ChordVocabulary of this progression's chords."""
+    return self._vocabulary
+
+  def chord_id(self, position):
+    """Returns the id in `vocabulary` of the chord at the given position."""
+    return self._events.id_at(position)
+
+  def chord_ids(self):
+    """Returns a python list of the id in `vocabulary` of each step's chord."""
+    return list(self._events.ids())
+
+  def set_length(self, steps, from_left=False):
+    """Sets the length of the progression to the specified number of steps.
+
+    If the progression is not long enough, pads with NO_CHORD to make it the
+    specified length. If it is too long, it will be truncated to the requested
+    length.
+
+    Args:
+      steps: How many steps long the progression should be.
+      from_left: Whether to add/remove from the left instead of right.
+    """
+    self._own_events()
+    self._events.resize(steps, self._pad_event, from_left)
+    if from_left:
+      self._start_step = self._end_step - steps
+    else:
+      self._end_step = self._start_step + steps
+
+  def increase_resolution(self, k, fill_event=None):
+    """Increase the resolution of a ChordProgression.
+
+    Args:
+      k: An integer, the factor by which to increase the resolution of the
+          progression.
+      fill_event: Event value to use to extend each low-resolution event. If
+          None, each low-resolution chord is repeated `k` times.
+    """
+    if fill_event is None:
+      self._own_events()
+      self._events.scale(k)
+      self._start_step *= k
+      self._end_step *= k
+      self._steps_per_bar *= k
+      self._steps_per_quarter *= k
+    else:
+      super(ChordProgression, self).increase_resolution(k, fill_event)
+      self._events = _ChordRuns(self._events, self._vocabulary)
 
   def __eq__(self, other):
     if not isinstance(other, ChordProgression):
@@ -121,9 +413,7 @@ class ChordProgression(events_lib.SimpleEventSequence):
           (start_step, end_step))
 
     self.set_length(end_step)
-
-    for i in range(start_step, end_step):
-      self._events[i] = figure
+    self._events.set_range(start_step, end_step, figure)
 
   def from_quantized_sequence(self, quantized_sequence, start_step, end_step):
     """Populate self with the chords from the given QuantizedSequence object.
@@ -156,23 +446,19 @@ class ChordProgression(events_lib.SimpleEventSequence):
     self._steps_per_bar = int(steps_per_bar_float)
     self._steps_per_quarter = quantized_sequence.steps_per_quarter
 
-    # Sort track by chord times.
-    chords = sorted(quantized_sequence.chords, key=lambda chord: chord.step)
+    chords, chord_steps = quantized_sequence.chord_index()
+    # The chords starting within the range, found by binary search.
+    first_chord_index = bisect.bisect_left(chord_steps, start_step)
+    end_chord_index = bisect.bisect_left(chord_steps, end_step)
 
-    prev_step = None
-    prev_figure = NO_CHORD
-
-    for chord in chords:
-      if chord.step >= end_step:
-        # No more chords within range.
-        break
-
-      elif chord.step < start_step:
-        # Chord is before start of range.
-        prev_step = chord.step
-        prev_figure = chord.figure
-        continue
+    if first_chord_index > 0:
+      # The last chord before the start of the range is still sounding.
+      prev_step, prev_figure = chords[first_chord_index - 1]
+    else:
+      prev_step = None
+      prev_figure = NO_CHORD
 
+    for chord in chords[first_chord_index:end_chord_index]:
       if chord.step == prev_step:
         if chord.figure == prev_figure:
           # Identical coincident chords, just skip.
@@ -224,7 +510,7 @@ class ChordProgression(events_lib.SimpleEventSequence):
     sequence.ticks_per_quarter = STANDARD_PPQ
 
     current_figure = NO_CHORD
-    for step, figure in enumerate(self):
+    for step, _, figure in self.runs():
       if figure != current_figure:
         current_figure = figure
         chord = sequence.text_annotations.add()
@@ -234,8 +520,7 @@ class ChordProgression(events_lib.SimpleEventSequence):
 
     return sequence
 
-  def transpose(self, transpose_amount, chord_symbol_functions=
-                chord_symbols_lib.ChordSymbolFunctions.get()):
+  def transpose(self, transpose_amount, chord_symbol_functions=None):
     """Transpose chords in this ChordProgression.
 
     Args:
@@ -243,16 +528,30 @@ class ChordProgression(events_lib.SimpleEventSequence):
           ChordProgression. Positive values transpose up. Negative values
           transpose down.
       chord_symbol_functions: ChordSymbolFunctions object with which to perform
-          the actual transposition of chord symbol strings.
+          the actual transposition of chord symbol strings. If None, the
+          chords are transposed by `vocabulary`, which remembers each
+          transposition of each chord.
 
     Raises:
       ChordSymbolException: If a chord (other than "no chord") fails to be
           interpreted by the ChordSymbolFunctions object.
     """
-    for i in xrange(len(self._events)):
-      if self._events[i] != NO_CHORD:
-        self._events[i] = chord_symbol_functions.transpose_chord_symbol(
-            self._events[i], transpose_amount % NOTES_PER_OCTAVE)
+    # Each chord change is transposed once, however many steps it lasts.
+    self._own_events()
+    if (chord_symbol_functions is None or
+        chord_symbol_functions is self._vocabulary.chord_symbol_functions):
+      self._events.map_ids(
+          lambda chord_id: self._vocabulary.transpose(chord_id,
+                                                      transpose_amount))
+      return
+
+    def transpose_figure(figure):
+      if figure == NO_CHORD:
+        return figure
+      return chord_symbol_functions.transpose_chord_symbol(
+          figure, transpose_amount % NOTES_PER_OCTAVE)
+
+    self._events.map_figures(transpose_figure)
 
 
 def extract_chords_for_melodies(quantized_sequence, melodies):
@@ -326,7 +625,8 @@ class BasicChordRenderer(ChordRenderer):
     self._velocity = velocity
     self._instrument = instrument
     self._program = program
-    self._chord_symbol_functions = chord_symbol_functions
+    # Each figure's pitches are computed once across all rendered sequences.
+    self._vocabulary = chord_symbols_lib.ChordVocabulary(chord_symbol_functions)
 
   def _render_notes(self, sequence, pitches, start_time, end_time):
     for pitch in pitches:
@@ -353,8 +653,8 @@ class BasicChordRenderer(ChordRenderer):
       if annotation.annotation_type == CHORD_SYMBOL:
         if prev_figure != NO_CHORD:
           # Render the previous chord.
-          pitches = self._chord_symbol_functions.chord_symbol_midi_pitches(
-              prev_figure)
+          pitches = self._vocabulary.midi_pitches(
+              self._vocabulary.intern(prev_figure))
           self._render_notes(sequence=sequence,
                              pitches=pitches,
                              start_time=prev_time,
@@ -366,8 +666,8 @@ class BasicChordRenderer(ChordRenderer):
     if (prev_time < sequence.total_time and
         prev_figure != NO_CHORD):
       # Render the last chord.
-      pitches = self._chord_symbol_functions.chord_symbol_midi_pitches(
-          prev_figure)
+      pitches = self._vocabulary.midi_pitches(
+          self._vocabulary.intern(prev_figure))
       self._render_notes(sequence=sequence,
                          pitches=pitches,
                          start_time=prev_time,
@@ -427,34 +727,67 @@ class MajorMinorEncoderDecoder(SingleChordEncoderDecoder):
   _PITCH_CLASS_MAPPING = ['C', 'C#', 'D', 'E-', 'E', 'F',
                           'F#', 'G', 'A-', 'A', 'B-', 'B']
 
-  def __init__(self, chord_symbol_functions=
-               chord_symbols_lib.ChordSymbolFunctions.get()):
+  def __init__(self, chord_symbol_functions=None, vocabulary=None):
     """Initialize the MajorMinorEncoderDecoder object.
 
     Args:
       chord_symbol_functions: ChordSymbolFunctions object with which to perform
-          the actual transposition of chord symbol strings.
+          the actual interpretation of chord symbol strings. Ignored if
+          `vocabulary` is given.
+      vocabulary: The chord_symbols_lib.ChordVocabulary in which chord figures
+          are interned. If None, a vocabulary using `chord_symbol_functions`
+          is created, or the shared vocabulary is used if that is also None.
     """
-    self._chord_symbol_functions = chord_symbol_functions
+    if vocabulary is None:
+      if chord_symbol_functions is None:
+        vocabulary = chord_symbols_lib.ChordVocabulary.get()
+      else:
+        vocabulary = chord_symbols_lib.ChordVocabulary(chord_symbol_functions)
+    self._vocabulary = vocabulary
+    # The encoding of each chord id, computed the first time it is encoded.
+    self._encodings = {chord_symbols_lib.ChordVocabulary.NO_CHORD_ID: 0}
+
+  @property
+  def vocabulary(self):
+    """The chord_symbols_lib.ChordVocabulary of the ids this encoder takes."""
+    return self._vocabulary
 
   @property
   def num_classes(self):
     return 2 * NOTES_PER_OCTAVE + 1
 
   def encode_chord(self, figure):
-    if figure == NO_CHORD:
-      return 0
+    return self.encode_chord_id(self._vocabulary.intern(figure))
+
+  def encode_chord_id(self, chord_id):
+    """Convert from a chord id in the vocabulary to a chord encoding integer.
+
+    Args:
+      chord_id: The id of the chord in this encoder's vocabulary.
+
+    Returns:
+      An integer representing the encoded chord, in range [0, self.num_classes).
 
-    root = self._chord_symbol_functions.chord_symbol_root(figure)
-    quality = self._chord_symbol_functions.chord_symbol_quality(figure)
+    Raises:
+      ChordEncodingException: If the chord is neither major nor minor.
+    """
+    encoding = self._encodings.get(chord_id)
+    if encoding is not None:
+      return encoding
+
+    root = self._vocabulary.root(chord_id)
+    quality = self._vocabulary.quality(chord_id)
 
     if quality == chord_symbols_lib.CHORD_QUALITY_MAJOR:
-      return root + 1
+      encoding = root + 1
     elif quality == chord_symbols_lib.CHORD_QUALITY_MINOR:
-      return root + NOTES_PER_OCTAVE + 1
+      encoding = root + NOTES_PER_OCTAVE + 1
     else:
       raise ChordEncodingException('chord is neither major nor minor: %s'
-                                   % figure)
+                                   % self._vocabulary.figure(chord_id))
+
+    self._encodings[chord_id] = encoding
+    return encoding
 
   def decode_chord(self, index):
     if index == 0:
@@ -527,15 +860,89 @@ class ChordsEncoderDecoder(events_lib.EventsEncoderDecoder):
     """
     pass
 
-  def transpose_and_encode(self, chords, transpose_amount):
+  def transpose_and_encode(self, chords, transpose_amount,
+                           sparse_inputs=False, serialized=False):
     """Returns a SequenceExample for the given chord progression.
 
     Args:
       chords: A ChordProgression object.
       transpose_amount: The number of half steps to transpose the chords.
+      sparse_inputs: If True, only the nonzero elements of each input vector
+          are stored in the SequenceExample.
+      serialized: If True, a magenta.common.SerializedSequenceExample written
+          directly in the wire format is returned instead.
 
     Returns:
       A tf.train.SequenceExample containing inputs and labels.
     """
     chords.transpose(transpose_amount)
-    return self._encode(chords)
+    return self._encode(chords, sparse_inputs, serialized)
+
+
+class OneHotChordsEncoderDecoder(ChordsEncoderDecoder):
+  """A ChordsEncoderDecoder that produces a one-hot encoding of each chord.
+
+  Each chord is encoded by a SingleChordEncoderDecoder. If that encoder can
+  encode chord ids and shares the vocabulary of a ChordProgression, the chords
+  are encoded by id, so each distinct chord is interpreted once rather than
+  once per step.
+  """
+
+  def __init__(self, single_chord_encoder_decoder=None):
+    """Initialize the OneHotChordsEncoderDecoder object.
+
+    Args:
+      single_chord_encoder_decoder: The SingleChordEncoderDecoder object with
+          which to encode individual chords. If None, a MajorMinorEncoderDecoder
+          using the shared vocabulary is used.
+    """
+    if single_chord_encoder_decoder is None:
+      single_chord_encoder_decoder = MajorMinorEncoderDecoder()
+    self._single_chord_encoder_decoder = single_chord_encoder_decoder
+
+  @property
+  def input_size(self):
+    return self._single_chord_encoder_decoder.num_classes
+
+  @property
+  def num_classes(self):
+    return self._single_chord_encoder_decoder.num_classes
+
+  def _encodes_ids(self, events):
+    """Returns whether the chords of `events` can be encoded by id."""
+    return (isinstance(events, ChordProgression) and
+            getattr(self._single_chord_encoder_decoder, 'vocabulary',
+                    None) is events.vocabulary)
+
+  def _encode_chord(self, events, position):
+    if self._encodes_ids(events):
+      return self._single_chord_encoder_decoder.encode_chord_id(
+          events.chord_id(position))
+    return self._single_chord_encoder_decoder.encode_chord(events[position])
+
+  def events_to_input(self, events, position):
+    input_ = [0.0] * self.input_size
+    input_[self._encode_chord(events, position)] = 1.0
+    return input_
+
+  def events_to_label(self, events, position):
+    return self._encode_chord(events, position)
+
+  def encode_batch(self, events):
+    if self._encodes_ids(events):
+      chord_ids = np.array(events.chord_ids(), dtype=np.int64)
+      # Encode each distinct chord once.
+      unique_ids, inverse = np.unique(chord_ids, return_inverse=True)
+      labels = np.array(
+          [self._single_chord_encoder_decoder.encode_chord_id(chord_id)
+           for chord_id in unique_ids], dtype=np.int64)[inverse]
+    else:
+      labels = np.array(
+          [self._single_chord_encoder_decoder.encode_chord(figure)
+           for figure in events], dtype=np.int64)
+    inputs = np.zeros((len(labels), self.input_size), dtype=np.float32)
+    inputs[np.arange(len(labels)), labels] = 1.0
+    return inputs, labels
+
+  def class_index_to_event(self, class_index, events):
+    return self._single_chord_encoder_decoder.decode_chord(class_index)
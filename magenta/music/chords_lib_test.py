@@ -13,6 +13,9 @@
 # limitations under the License.
 """Tests for chords_lib."""
 
+import copy
+import pickle
+
 # internal imports
 import tensorflow as tf
 
@@ -61,6 +64,96 @@ class ChordsLibTest(tf.test.TestCase):
     with self.assertRaises(chord_symbols_lib.ChordSymbolException):
       chords.transpose(transpose_amount=-4)
 
+  def testTransposeOncePerChordChange(self):
+    transposed_figures = []
+
+    class RecordingChordSymbolFunctions(
+        chord_symbols_lib.BasicChordSymbolFunctions):
+
+      def transpose_chord_symbol(self, figure, transpose_amount):
+        transposed_figures.append(figure)
+        return super(RecordingChordSymbolFunctions,
+                     self).transpose_chord_symbol(figure, transpose_amount)
+
+    chords = chords_lib.ChordProgression(
+        ['C'] * 16 + ['G7'] * 16 + [NO_CHORD] * 8 + ['C'] * 8)
+    chords.transpose(transpose_amount=2,
+                     chord_symbol_functions=RecordingChordSymbolFunctions())
+    self.assertEqual(['C', 'G7', 'C'], transposed_figures)
+    self.assertEqual(['D'] * 16 + ['A7'] * 16 + [NO_CHORD] * 8 + ['D'] * 8,
+                     list(chords))
+
+  def testChordIds(self):
+    vocabulary = chord_symbols_lib.ChordVocabulary()
+    chords = chords_lib.ChordProgression(
+        [NO_CHORD, 'C', 'C', 'G7', 'C'], vocabulary=vocabulary)
+    c = vocabulary.intern('C')
+    g7 = vocabulary.intern('G7')
+    self.assertEqual([0, c, c, g7, c], chords.chord_ids())
+    self.assertEqual(g7, chords.chord_id(3))
+    self.assertEqual(3, len(vocabulary))
+
+    chords.transpose(transpose_amount=2)
+    d = vocabulary.intern('D')
+    self.assertEqual(d, vocabulary.transpose(c, 2))
+    self.assertEqual([0, d, d, vocabulary.transpose(g7, 2), d],
+                     chords.chord_ids())
+    self.assertEqual([NO_CHORD, 'D', 'D', 'A7', 'D'], list(chords))
+
+  def testRuns(self):
+    chords = chords_lib.ChordProgression(['C', 'C', 'Am', 'Am', 'Am'])
+    self.assertEqual([(0, 2, 'C'), (2, 5, 'Am')], chords.runs())
+    self.assertEqual('Am', chords[2])
+    self.assertEqual('C', chords[-4])
+    self.assertEqual(['C', 'Am'], chords[1:3])
+
+    chords.append_event('Am')
+    chords.append_event('F')
+    chords.set_length(8)
+    self.assertEqual([(0, 2, 'C'), (2, 6, 'Am'), (6, 7, 'F'), (7, 8, NO_CHORD)],
+                     chords.runs())
+    chords.set_length(5, from_left=True)
+    self.assertEqual([(0, 3, 'Am'), (3, 4, 'F'), (4, 5, NO_CHORD)],
+                     chords.runs())
+    chords.increase_resolution(2)
+    self.assertEqual([(0, 6, 'Am'), (6, 8, 'F'), (8, 10, NO_CHORD)],
+                     chords.runs())
+
+  def testDeepcopyCopyOnWrite(self):
+    events = ['C', 'G7', NO_CHORD, 'F']
+    chords = chords_lib.ChordProgression(events)
+    chords_copy = copy.deepcopy(chords)
+    self.assertEqual(chords, chords_copy)
+
+    chords_copy.transpose(transpose_amount=2)
+    chords_copy.append_event('Am')
+    self.assertEqual(events, list(chords))
+    self.assertEqual(['D', 'A7', NO_CHORD, 'G', 'Am'], list(chords_copy))
+
+  def testPickle(self):
+    chords = chords_lib.ChordProgression(['C', 'G7', NO_CHORD], start_step=2)
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+      chords_copy = pickle.loads(pickle.dumps(chords, protocol))
+      self.assertEqual(chords, chords_copy)
+      self.assertEqual(2, chords_copy.start_step)
+
+    # Chord ids stay consistent with a progression's own vocabulary.
+    vocabulary = chord_symbols_lib.ChordVocabulary()
+    vocabulary.intern('D')
+    chords = chords_lib.ChordProgression(['C', 'G7', NO_CHORD],
+                                         vocabulary=vocabulary)
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+      chords_copy = pickle.loads(pickle.dumps(chords, protocol))
+      self.assertEqual(['C', 'G7', NO_CHORD], list(chords_copy))
+      self.assertEqual(
+          ['C', 'G7', NO_CHORD],
+          [chords_copy.vocabulary.figure(chord_id)
+           for chord_id in chords_copy.chord_ids()])
+      runs = pickle.loads(pickle.dumps(chords._events, protocol))  # pylint: disable=protected-access
+      self.assertEqual(['C', 'G7', NO_CHORD],
+                       [runs.vocabulary.figure(chord_id)
+                        for chord_id in runs.ids()])
+
   def testFromQuantizedSequence(self):
     testing_lib.add_quantized_chords_to_sequence(
         self.quantized_sequence,
@@ -204,6 +297,18 @@ class MajorMinorEncoderDecoderTest(tf.test.TestCase):
     with self.assertRaises(chords_lib.ChordEncodingException):
       self.encoder_decoder.encode_chord('B-5')
 
+  def testEncodeChordId(self):
+    vocabulary = chord_symbols_lib.ChordVocabulary()
+    encoder_decoder = chords_lib.MajorMinorEncoderDecoder(
+        vocabulary=vocabulary)
+    self.assertEquals(0, encoder_decoder.encode_chord_id(
+        vocabulary.intern(NO_CHORD)))
+    self.assertEquals(21, encoder_decoder.encode_chord_id(
+        vocabulary.intern('A-m9')))
+    self.assertEquals(21, encoder_decoder.encode_chord('A-m9'))
+    with self.assertRaises(chords_lib.ChordEncodingException):
+      encoder_decoder.encode_chord_id(vocabulary.intern('Gsus4'))
+
   def testDecodeNoChord(self):
     figure = self.encoder_decoder.decode_chord(0)
     self.assertEquals(NO_CHORD, figure)
@@ -218,5 +323,61 @@ class MajorMinorEncoderDecoderTest(tf.test.TestCase):
     self.assertEquals('Em', figure)
 
 
+
+class OneHotChordsEncoderDecoderTest(tf.test.TestCase):
+
+  def setUp(self):
+    self.encoder_decoder = chords_lib.OneHotChordsEncoderDecoder()
+
+  def testEncodeChords(self):
+    chords = chords_lib.ChordProgression([NO_CHORD, 'C', 'C', 'Am7', 'D'])
+    self.assertEqual(25, self.encoder_decoder.input_size)
+    self.assertEqual(25, self.encoder_decoder.num_classes)
+    self.assertEqual([0, 1, 1, 22, 3],
+                     [self.encoder_decoder.events_to_label(chords, i)
+                      for i in range(len(chords))])
+    self.assertEqual(22, self.encoder_decoder.events_to_input(
+        chords, 3).index(1.0))
+    testing_lib.assert_encode_batch_matches_events_to_input(
+        self, self.encoder_decoder, chords)
+    self.assertEqual('Am', self.encoder_decoder.class_index_to_event(22,
+                                                                     chords))
+
+  def testEncodeChordsByFigure(self):
+    # Chords interned in another vocabulary are encoded by figure.
+    chords = chords_lib.ChordProgression(
+        [NO_CHORD, 'C', 'Am7'], vocabulary=chord_symbols_lib.ChordVocabulary())
+    self.assertEqual([0, 1, 22], self.encoder_decoder.encode_batch(
+        chords)[1].tolist())
+    testing_lib.assert_encode_batch_matches_events_to_input(
+        self, self.encoder_decoder, chords)
+
+  def testEncodeChordIds(self):
+
+    class CountingChordSymbolFunctions(
+        chord_symbols_lib.BasicChordSymbolFunctions):
+
+      def __init__(self):
+        super(CountingChordSymbolFunctions, self).__init__()
+        self.num_calls = 0
+
+      def chord_symbol_root(self, figure):
+        self.num_calls += 1
+        return super(CountingChordSymbolFunctions, self).chord_symbol_root(
+            figure)
+
+    counting = CountingChordSymbolFunctions()
+    vocabulary = chord_symbols_lib.ChordVocabulary(counting)
+    encoder_decoder = chords_lib.OneHotChordsEncoderDecoder(
+        chords_lib.MajorMinorEncoderDecoder(vocabulary=vocabulary))
+    chords = chords_lib.ChordProgression(
+        [NO_CHORD] + ['Am7'] * 8 + ['C'] * 8 + ['Am7'] * 8,
+        vocabulary=vocabulary)
+    testing_lib.assert_encode_batch_matches_events_to_input(
+        self, encoder_decoder, chords)
+    # Each distinct chord was interpreted once.
+    self.assertEqual(2, counting.num_calls)
+
+
 if __name__ == '__main__':
   tf.test.main()
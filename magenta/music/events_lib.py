@@ -15,14 +15,17 @@
 
 The abstract `EventSequence` class is an interface for a sequence of musical
 events. The `SimpleEventSequence` class is a basic implementation of this
-interface.
+interface, and `EventSequenceView` is a read-only window onto one without
+copying its events.
 
 The `EventsEncoderDecoder` is an abstract class for translating between event
-sequences and model data.
+sequences and model data, and an `EncoderState` tracks the model input of an
+event sequence as it is extended during generation.
 """
 
 import abc
 import copy
+import itertools
 import numpy as np
 
 from six.moves import range  # pylint: disable=redefined-builtin
@@ -64,6 +67,7 @@ class EventSequence(object):
     steps_per_bar: Number of steps in a bar (measure) of music.
   """
   __metaclass__ = abc.ABCMeta
+  __slots__ = ()
 
   @abc.abstractproperty
   def start_step(self):
@@ -123,6 +127,8 @@ class SimpleEventSequence(EventSequence):
   class for Melody, ChordProgression, and any other simple stream of musical
   events.
   """
+  __slots__ = ('_pad_event', '_events', '_events_shared', '_start_step',
+               '_end_step', '_steps_per_bar', '_steps_per_quarter')
 
   def __init__(self, pad_event, events=None, start_step=0,
                steps_per_bar=DEFAULT_STEPS_PER_BAR,
@@ -145,7 +151,7 @@ class SimpleEventSequence(EventSequence):
                             steps_per_bar=steps_per_bar,
                             steps_per_quarter=steps_per_quarter)
     else:
-      self._events = []
+      self._reset()
       self._steps_per_bar = steps_per_bar
       self._steps_per_quarter = steps_per_quarter
       self._start_step = start_step
@@ -154,6 +160,7 @@ class SimpleEventSequence(EventSequence):
   def _reset(self):
     """Clear events and reset object state."""
     self._events = []
+    self._events_shared = False
     self._steps_per_bar = DEFAULT_STEPS_PER_BAR
     self._steps_per_quarter = DEFAULT_STEPS_PER_QUARTER
     self._start_step = 0
@@ -164,6 +171,7 @@ class SimpleEventSequence(EventSequence):
                        steps_per_quarter=DEFAULT_STEPS_PER_QUARTER):
     """Initializes with a list of event values and sets attributes."""
     self._events = list(events)
+    self._events_shared = False
     self._start_step = start_step
     self._end_step = start_step + len(self)
     self._steps_per_bar = steps_per_bar
@@ -193,6 +201,34 @@ class SimpleEventSequence(EventSequence):
     """
     return len(self._events)
 
+  def view(self, start=0, stop=None, stride=1):
+    """Returns a read-only view of a range of events in this sequence.
+
+    The view shares storage with this sequence, so creating it does not copy
+    any events. Indices are interpreted like the arguments to a slice.
+
+    Args:
+      start: Index of the first event in the view.
+      stop: Index one past the last event in the view. If None, the view
+          extends to the end of the sequence.
+      stride: A positive integer, the step between viewed events.
+
+    Returns:
+      An EventSequenceView object.
+    """
+    return EventSequenceView(self, start, stop, stride)
+
+  def prefix(self, length):
+    """Returns a read-only view of the first `length` events.
+
+    Args:
+      length: The number of events in the prefix.
+
+    Returns:
+      An EventSequenceView object.
+    """
+    return self.view(stop=length)
+
   def __deepcopy__(self, unused_memo=None):
     return type(self)(pad_event=self._pad_event,
                       events=copy.deepcopy(self._events),
@@ -200,6 +236,64 @@ class SimpleEventSequence(EventSequence):
                       steps_per_bar=self.steps_per_bar,
                       steps_per_quarter=self.steps_per_quarter)
 
+  def __copy__(self):
+    """Returns a shallow copy of this sequence that shares its event storage."""
+    sequence_copy = type(self).__new__(type(self))
+    for cls in type(self).__mro__:
+      for name in getattr(cls, '__slots__', ()):
+        if hasattr(self, name):
+          setattr(sequence_copy, name, getattr(self, name))
+    if hasattr(self, '__dict__'):
+      sequence_copy.__dict__.update(self.__dict__)
+    return sequence_copy
+
+  def __getstate__(self):
+    """Returns the state of this sequence for pickling.
+
+    Classes with `__slots__` can only be pickled at protocols below 2 if they
+    define `__getstate__`, so the events and attributes are returned as a
+    dictionary.
+
+    Returns:
+      A dictionary of the events and attributes of this sequence.
+    """
+    return {'pad_event': self._pad_event,
+            'events': list(self),
+            'start_step': self._start_step,
+            'end_step': self._end_step,
+            'steps_per_bar': self._steps_per_bar,
+            'steps_per_quarter': self._steps_per_quarter}
+
+  def __setstate__(self, state):
+    """Restores the state returned by `__getstate__`."""
+    self._pad_event = state['pad_event']
+    self._from_event_list(state['events'], start_step=state['start_step'],
+                          steps_per_bar=state['steps_per_bar'],
+                          steps_per_quarter=state['steps_per_quarter'])
+    self._end_step = state['end_step']
+
+  def _copy_on_write(self):
+    """Returns a copy of this sequence that shares its event storage.
+
+    Neither sequence copies the shared events until it is next mutated, so
+    this is only safe when the events themselves are immutable. Subclasses
+    with immutable events use it to implement a cheap `__deepcopy__`.
+
+    Returns:
+      A copy of this sequence.
+    """
+    self._events_shared = True
+    return copy.copy(self)
+
+  def _own_events(self):
+    """Copies the event storage if it is shared with another sequence.
+
+    Must be called before any operation that modifies the events in place.
+    """
+    if self._events_shared:
+      self._events = list(self._events)
+      self._events_shared = False
+
   def __eq__(self, other):
     if not isinstance(other, SimpleEventSequence):
       return False
@@ -231,6 +325,7 @@ class SimpleEventSequence(EventSequence):
     Args:
       event: The event to append to the end.
     """
+    self._own_events()
     self._events.append(event)
     self._end_step += 1
 
@@ -245,6 +340,7 @@ class SimpleEventSequence(EventSequence):
       steps: How many steps long the event sequence should be.
       from_left: Whether to add/remove from the left instead of right.
     """
+    self._own_events()
     if steps > len(self):
       if from_left:
         self._events[:0] = [self._pad_event] * (steps - len(self))
@@ -283,12 +379,223 @@ class SimpleEventSequence(EventSequence):
       new_events += fill(event)
 
     self._events = new_events
+    self._events_shared = False
     self._start_step *= k
     self._end_step *= k
     self._steps_per_bar *= k
     self._steps_per_quarter *= k
 
 
+class EventSequenceView(object):
+  """A read-only view of a range of events in a SimpleEventSequence.
+
+  Views are returned by `SimpleEventSequence.view` and `prefix`. They refer to
+  the events of the viewed sequence rather than copying them, so creating a
+  view is constant time regardless of its length. A view supports `len`,
+  iteration, and indexing like the sequence it was created from, and slicing
+  a view returns another view.
+
+  A view covers a fixed range of indices in the viewed sequence and reflects
+  later changes to it. If the sequence is shortened, the view only contains
+  the events of its range that still exist.
+
+  Attributes:
+    start_step: The step of the first viewed event, in the viewed sequence's
+        step units.
+    end_step: The step following the last viewed event, in the viewed
+        sequence's step units.
+    steps_per_quarter: Number of steps in in a quarter note of the viewed
+        sequence.
+    steps_per_bar: Number of steps in a bar (measure) of the viewed sequence.
+  """
+  __slots__ = ('_sequence', '_start', '_stop_index', '_stride')
+
+  def __init__(self, sequence, start=0, stop=None, stride=1):
+    """Construct an EventSequenceView.
+
+    Args:
+      sequence: The SimpleEventSequence to view.
+      start: Index of the first event in the view.
+      stop: Index one past the last event in the view. If None, the view
+          extends to the end of the sequence.
+      stride: A positive integer, the step between viewed events.
+
+    Raises:
+      ValueError: If `stride` is not positive.
+    """
+    if stride < 1:
+      raise ValueError('stride must be positive: %d' % stride)
+    start, stop, stride = slice(start, stop, stride).indices(len(sequence))
+    self._sequence = sequence
+    self._start = start
+    self._stop_index = max(start, stop)
+    self._stride = stride
+
+  def _num_events(self):
+    """Returns the number of viewed events that exist in the sequence."""
+    stop = min(self._stop_index, len(self._sequence))
+    if stop <= self._start:
+      return 0
+    return (stop - self._start - 1) // self._stride + 1
+
+  def _stop(self):
+    """Returns the index one past the last viewed event in the sequence."""
+    num_events = self._num_events()
+    if not num_events:
+      return self._start
+    return self._start + (num_events - 1) * self._stride + 1
+
+  def __iter__(self):
+    """Return an iterator over the viewed events.
+
+    Returns:
+      Python iterator over events.
+    """
+    return itertools.islice(self._sequence, self._start, self._stop(),
+                            self._stride)
+
+  def __getitem__(self, i):
+    """Returns the event at the given index, or a view for a slice."""
+    if isinstance(i, slice):
+      start, stop, stride = i.indices(self._num_events())
+      if stride < 1:
+        raise ValueError('views only support positive strides')
+      num_events = len(range(start, stop, stride))
+      start = self._start + start * self._stride
+      stride *= self._stride
+      return type(self)(self._sequence, start,
+                        start + (num_events - 1) * stride + 1 if num_events
+                        else start,
+                        stride)
+    num_events = self._num_events()
+    if i < 0:
+      i += num_events
+    if not 0 <= i < num_events:
+      raise IndexError('view index out of range')
+    return self._sequence[self._start + i * self._stride]
+
+  def __getslice__(self, i, j):
+    """Returns a view of the events in the given slice range."""
+    return self[i:j:1]
+
+  def __len__(self):
+    """How many events are in this view.
+
+    Returns:
+      Number of events as an integer.
+    """
+    return self._num_events()
+
+  def view(self, start=0, stop=None, stride=1):
+    """Returns a read-only view of a range of events in this view.
+
+    Args:
+      start: Index of the first event in the new view.
+      stop: Index one past the last event in the new view. If None, the new
+          view extends to the end of this view.
+      stride: A positive integer, the step between viewed events.
+
+    Returns:
+      A view of the same type over the same underlying sequence.
+
+    Raises:
+      ValueError: If `stride` is not positive.
+    """
+    if stride < 1:
+      raise ValueError('stride must be positive: %d' % stride)
+    return self[start:stop:stride]
+
+  def prefix(self, length):
+    """Returns a read-only view of the first `length` events in this view.
+
+    Args:
+      length: The number of events in the prefix.
+
+    Returns:
+      A view of the same type over the same underlying sequence.
+    """
+    return self.view(stop=length)
+
+  @property
+  def start_step(self):
+    return self._sequence.start_step + self._start
+
+  @property
+  def end_step(self):
+    return self._sequence.start_step + self._stop()
+
+  @property
+  def steps_per_bar(self):
+    return self._sequence.steps_per_bar
+
+  @property
+  def steps_per_quarter(self):
+    return self._sequence.steps_per_quarter
+
+
+class EncoderState(object):
+  """Tracks the model input for the newest event of a growing event sequence.
+
+  During generation an event sequence is extended by one event per step, and
+  the model needs the input vector for the newest event at each step. An
+  EncoderState visits each appended event exactly once, so encoder-decoders
+  whose inputs summarize the whole prefix can keep a running summary and
+  produce the newest input in constant time.
+
+  This base implementation keeps no running state and calls
+  `events_to_input` for the last event, which is already constant time for
+  encoder-decoders that only look back a fixed distance. Subclasses override
+  `_add_event` and `_get_input`.
+
+  The event sequence may only be appended to while it is being tracked.
+  """
+
+  def __init__(self, encoder_decoder, events):
+    """Construct an EncoderState.
+
+    Args:
+      encoder_decoder: The EventsEncoderDecoder whose inputs are computed.
+      events: The EventSequence to track. The events it already contains are
+          consumed immediately.
+    """
+    self._encoder_decoder = encoder_decoder
+    self._events = events
+    self._num_events = 0
+    self.update()
+
+  def update(self):
+    """Consumes the events appended to the sequence since the last update.
+
+    Raises:
+      ValueError: If the event sequence has gotten shorter.
+    """
+    num_events = len(self._events)
+    if num_events < self._num_events:
+      raise ValueError('event sequence has been shortened from %d to %d events'
+                       % (self._num_events, num_events))
+    for position in range(self._num_events, num_events):
+      self._add_event(position)
+    self._num_events = num_events
+
+  def get_input(self):
+    """Returns the input vector for the last event in the sequence.
+
+    Returns:
+      An input vector, a self.input_size length list of floats, equal to
+      `encoder_decoder.events_to_input(events, len(events) - 1)`.
+    """
+    self.update()
+    return self._get_input(self._num_events - 1)
+
+  def _add_event(self, position):
+    """Updates the running state with the event at the given position."""
+    pass
+
+  def _get_input(self, position):
+    """Returns the input vector for the given, most recently added position."""
+    return self._encoder_decoder.events_to_input(self._events, position)
+
+
 class EventsEncoderDecoder(object):
   """An abstract class for translating between events and model data.
 
@@ -311,21 +618,58 @@ class EventsEncoderDecoder(object):
   """
   __metaclass__ = abc.ABCMeta
 
-  def _encode(self, events):
+  # The version of an encoder-decoder's encoding. Bump it whenever the inputs
+  # or labels it produces for any event sequence change, so that caches of
+  # encoded sequences don't serve encodings made by the old version.
+  version = 0
+
+  def _encode(self, events, sparse_inputs=False, serialized=False):
     """Returns a SequenceExample for the given event sequence.
 
     Args:
       events: An EventSequence object.
+      sparse_inputs: If True, only the nonzero elements of each input vector
+          are stored in the SequenceExample.
+      serialized: If True, a SerializedSequenceExample written directly in the
+          wire format is returned instead, which is much faster to produce
+          than a proto when the example will only be written to disk.
 
     Returns:
       A tf.train.SequenceExample containing inputs and labels.
     """
-    inputs = []
-    labels = []
-    for i in range(len(events) - 1):
-      inputs.append(self.events_to_input(events, i))
-      labels.append(self.events_to_label(events, i + 1))
-    return sequence_example_lib.make_sequence_example(inputs, labels)
+    inputs, labels = self.encode_batch(events)
+    return self._make_sequence_example(inputs, labels, sparse_inputs,
+                                       serialized)
+
+  def _make_sequence_example(self, inputs, labels, sparse_inputs=False,
+                             serialized=False):
+    """Returns a SequenceExample for the inputs and labels of a sequence.
+
+    Each position's input is paired with the next position's label.
+
+    Args:
+      inputs: A float array of shape [len(events), self.input_size], as
+          returned by `encode_batch`.
+      labels: An int array of shape [len(events)], as returned by
+          `encode_batch`.
+      sparse_inputs: If True, only the nonzero elements of each input vector
+          are stored in the SequenceExample.
+      serialized: If True, a SerializedSequenceExample is returned instead.
+
+    Returns:
+      A tf.train.SequenceExample containing inputs and labels.
+    """
+    if serialized:
+      serialize = (sequence_example_lib.serialize_sparse_sequence_example
+                   if sparse_inputs else
+                   sequence_example_lib.serialize_sequence_example)
+      return sequence_example_lib.SerializedSequenceExample(
+          serialize(inputs[:-1], labels[1:]))
+    if sparse_inputs:
+      return sequence_example_lib.make_sparse_sequence_example(
+          inputs[:-1], labels[1:].tolist())
+    return sequence_example_lib.make_sequence_example(inputs[:-1].tolist(),
+                                                      labels[1:].tolist())
 
   @abc.abstractproperty
   def input_size(self):
@@ -372,6 +716,28 @@ class EventsEncoderDecoder(object):
     """
     pass
 
+  def encode_batch(self, events):
+    """Returns the inputs and labels for every position in an event sequence.
+
+    Row `i` of the inputs is `self.events_to_input(events, i)` and element `i`
+    of the labels is `self.events_to_label(events, i)`. This implementation
+    simply calls those per-position methods; subclasses can override it with a
+    vectorized version, for which the per-position methods stay the reference.
+
+    Args:
+      events: An EventSequence object.
+
+    Returns:
+      inputs: A float32 array of shape [len(events), self.input_size].
+      labels: An int64 array of shape [len(events)].
+    """
+    inputs = np.zeros((len(events), self.input_size), dtype=np.float32)
+    labels = np.zeros(len(events), dtype=np.int64)
+    for i in range(len(events)):
+      inputs[i] = self.events_to_input(events, i)
+      labels[i] = self.events_to_label(events, i)
+    return inputs, labels
+
   def get_inputs_batch(self, event_sequences, full_length=False):
     """Returns an inputs batch for the given event sequences.
 
@@ -392,15 +758,28 @@ class EventsEncoderDecoder(object):
     """
     inputs_batch = []
     for events in event_sequences:
-      inputs = []
       if full_length and len(event_sequences):
-        for i in range(len(events)):
-          inputs.append(self.events_to_input(events, i))
+        inputs_batch.append(self.encode_batch(events)[0].tolist())
       else:
-        inputs.append(self.events_to_input(events, len(events) - 1))
-      inputs_batch.append(inputs)
+        inputs_batch.append([self.events_to_input(events, len(events) - 1)])
     return inputs_batch
 
+  def get_encoder_state(self, events):
+    """Returns an EncoderState that tracks the inputs of a growing sequence.
+
+    Generation loops can call `get_input` on the returned state after each
+    appended event instead of calling `get_inputs_batch` on the sequence.
+    Encoder-decoders that can compute the newest input in constant time from
+    a running summary of the sequence override this method.
+
+    Args:
+      events: An EventSequence object that will only be appended to.
+
+    Returns:
+      An EncoderState object.
+    """
+    return EncoderState(self, events)
+
   @abc.abstractmethod
   def class_index_to_event(self, class_index, events):
     """Returns the event for the given class index.
@@ -416,16 +795,79 @@ class EventsEncoderDecoder(object):
     """
     pass
 
-  def extend_event_sequences(self, event_sequences, softmax):
+  def sample_classes(self, softmax, random_state=None, top_k=None):
+    """Samples a class for each sequence from its last softmax vector.
+
+    The classes of the whole batch are sampled at once by inverting the
+    cumulative distribution of each sequence's last softmax vector.
+
+    Args:
+      softmax: A list of softmax probability vectors, one list per sequence.
+      random_state: The source of randomness. Either a numpy RandomState used
+          for the whole batch, a list of RandomStates with one per sequence
+          (so that each sequence is reproducible regardless of the rest of the
+          batch), or None to use the global numpy random state.
+      top_k: If given, each sequence is sampled from only its `top_k` most
+          probable classes, renormalized.
+
+    Returns:
+      An int array of the sampled class index of each sequence.
+
+    Raises:
+      ValueError: If `random_state` is a list whose length differs from the
+          number of sequences, or if `top_k` is not positive.
+    """
+    num_sequences = len(softmax)
+    if isinstance(random_state, (list, tuple)):
+      if len(random_state) != num_sequences:
+        raise ValueError(
+            'Expected %d random states, one per event sequence, got %d' %
+            (num_sequences, len(random_state)))
+      uniforms = np.array([state.random_sample() for state in random_state])
+    elif random_state is not None:
+      uniforms = random_state.random_sample(num_sequences)
+    else:
+      uniforms = np.random.random_sample(num_sequences)
+
+    probs = np.array([softmax[i][-1] for i in range(num_sequences)],
+                     dtype=np.float64)
+    num_classes = probs.shape[1]
+    if top_k is not None:
+      if top_k <= 0:
+        raise ValueError('top_k must be positive, got %d' % top_k)
+      if top_k < num_classes:
+        rows = np.arange(num_sequences)[:, np.newaxis]
+        top_classes = np.argpartition(-probs, top_k - 1, axis=1)[:, :top_k]
+        truncated = np.zeros_like(probs)
+        truncated[rows, top_classes] = probs[rows, top_classes]
+        probs = truncated
+
+    # Class j is chosen when cdf[j - 1] <= u * cdf[-1] < cdf[j], so classes
+    # with zero probability are never chosen.
+    cdf = np.cumsum(probs, axis=1)
+    thresholds = uniforms * cdf[:, -1]
+    return np.minimum(
+        (cdf <= thresholds[:, np.newaxis]).sum(axis=1), num_classes - 1)
+
+  def extend_event_sequences(self, event_sequences, softmax, random_state=None,
+                             top_k=None):
     """Extends the event_sequences by sampling the softmax probabilities.
 
     Args:
       event_sequences: A list of EventSequence objects.
       softmax: A list of softmax probability vectors. The list of softmaxes
           should be the same length as the list of event_sequences.
+      random_state: The source of randomness, as in `sample_classes`.
+      top_k: If given, each sequence is sampled from only its `top_k` most
+          probable classes, renormalized.
+
+    Raises:
+      ValueError: If `random_state` is a list whose length differs from the
+          number of event sequences, or if `top_k` is not positive.
     """
-    num_classes = len(softmax[0][0])
-    for i in xrange(len(event_sequences)):
-      chosen_class = np.random.choice(num_classes, p=softmax[i][-1])
-      event = self.class_index_to_event(chosen_class, event_sequences[i])
+    chosen_classes = self.sample_classes(
+        softmax[:len(event_sequences)], random_state, top_k)
+    for i in range(len(event_sequences)):
+      event = self.class_index_to_event(int(chosen_classes[i]),
+                                        event_sequences[i])
       event_sequences[i].append_event(event)
@@ -33,6 +33,45 @@ class EventsLibTest(tf.test.TestCase):
     events.set_length(2)
     self.assertNotEqual(events, events_copy)
 
+  def testView(self):
+    events = events_lib.SimpleEventSequence(
+        pad_event=0, events=[0, 1, 2, 3, 4, 5, 6, 7], start_step=16)
+
+    prefix = events.prefix(3)
+    self.assertListEqual([0, 1, 2], list(prefix))
+    self.assertEqual(3, len(prefix))
+    self.assertEqual(16, prefix.start_step)
+    self.assertEqual(19, prefix.end_step)
+
+    window = events.view(2, 7, stride=2)
+    self.assertListEqual([2, 4, 6], list(window))
+    self.assertEqual(6, window[-1])
+    self.assertEqual(18, window.start_step)
+    self.assertEqual(23, window.end_step)
+    self.assertListEqual([4, 6], list(window[1:]))
+    self.assertListEqual([2, 6], list(window.view(stride=2)))
+    self.assertListEqual([], list(window.prefix(0)))
+    with self.assertRaises(IndexError):
+      _ = window[3]
+    with self.assertRaises(ValueError):
+      events.view(stride=0)
+
+    # Views share storage with the viewed sequence.
+    events.set_length(4)
+    self.assertListEqual([0, 1, 2], list(prefix))
+
+    # Views only contain the events of their range that still exist.
+    self.assertListEqual([2], list(window))
+    self.assertEqual(1, len(window))
+    with self.assertRaises(IndexError):
+      _ = window[1]
+    events.set_length(2)
+    self.assertEqual(2, len(prefix))
+    self.assertListEqual([], list(window))
+    self.assertEqual(18, window.end_step)
+    events.set_length(8)
+    self.assertListEqual([0, 0, 0], list(window))
+
   def testAppendEvent(self):
     events = events_lib.SimpleEventSequence(pad_event=0)
 
@@ -17,6 +17,9 @@ import abc
 import copy
 import itertools
 
+# internal imports
+import numpy as np
+
 from magenta.music import chords_lib
 from magenta.music import constants
 from magenta.music import events_lib
@@ -119,7 +122,42 @@ class LeadSheet(events_lib.EventSequence):
     """
     return len(self._melody)
 
+  def view(self, start=0, stop=None, stride=1):
+    """Returns a read-only LeadSheet over a range of this lead sheet's events.
+
+    The melody and chords of the returned lead sheet are views of this lead
+    sheet's melody and chords, so no events are copied. The returned lead
+    sheet can be iterated, indexed, and encoded, but not modified.
+
+    Args:
+      start: Index of the first event in the view.
+      stop: Index one past the last event in the view. If None, the view
+          extends to the end of the lead sheet.
+      stride: A positive integer, the step between viewed events.
+
+    Returns:
+      A LeadSheet object whose melody and chords are views.
+    """
+    return type(self)(self._melody.view(start, stop, stride),
+                      self._chords.view(start, stop, stride))
+
+  def prefix(self, length):
+    """Returns a read-only LeadSheet over the first `length` events.
+
+    Args:
+      length: The number of events in the prefix.
+
+    Returns:
+      A LeadSheet object whose melody and chords are views.
+    """
+    return self.view(stop=length)
+
   def __deepcopy__(self, unused_memo=None):
+    """Returns a copy of this LeadSheet.
+
+    The melody and chords are copied on write, so the copy shares their
+    events until either lead sheet is modified.
+    """
     return type(self)(copy.deepcopy(self._melody),
                       copy.deepcopy(self._chords))
 
@@ -361,17 +399,22 @@ class LeadSheetEncoderDecoder(events_lib.EventsEncoderDecoder):
     """
     pass
 
-  def squash_and_encode(self, lead_sheet):
+  def squash_and_encode(self, lead_sheet, sparse_inputs=False,
+                        serialized=False):
     """Returns a SequenceExample for the given lead sheet.
 
     Args:
       lead_sheet: A LeadSheet object.
+      sparse_inputs: If True, only the nonzero elements of each input vector
+          are stored in the SequenceExample.
+      serialized: If True, a magenta.common.SerializedSequenceExample written
+          directly in the wire format is returned instead.
 
     Returns:
       A tf.train.SequenceExample containing inputs and labels.
     """
     lead_sheet.squash(self.min_note, self.max_note, self.transpose_to_key)
-    return self._encode(lead_sheet)
+    return self._encode(lead_sheet, sparse_inputs, serialized)
 
 
 class LeadSheetProductEncoderDecoder(LeadSheetEncoderDecoder):
@@ -409,6 +452,19 @@ class LeadSheetProductEncoderDecoder(LeadSheetEncoderDecoder):
     return (self._melody_encoder_decoder.num_classes *
             self._chords_encoder_decoder.num_classes)
 
+  @property
+  def class_factors(self):
+    """The numbers of melody and chord classes that labels are a product of.
+
+    Models can use this to predict the melody and chord components of a label
+    with separate output heads.
+
+    Returns:
+      A (melody num_classes, chords num_classes) tuple.
+    """
+    return (self._melody_encoder_decoder.num_classes,
+            self._chords_encoder_decoder.num_classes)
+
   def events_to_input(self, events, position):
     """Returns the input vector for the lead sheet event at the given position.
 
@@ -424,7 +480,7 @@ class LeadSheetProductEncoderDecoder(LeadSheetEncoderDecoder):
     """
     melody_input = self._melody_encoder_decoder.events_to_input(
         events.melody, position)
-    chords_input = self.chords_encoder_decoder.events_to_input(
+    chords_input = self._chords_encoder_decoder.events_to_input(
         events.chords, position)
     return melody_input + chords_input
 
@@ -448,6 +504,28 @@ class LeadSheetProductEncoderDecoder(LeadSheetEncoderDecoder):
     return melody_label + (self._melody_encoder_decoder.num_classes *
                            chords_label)
 
+  def encode_batch(self, events):
+    """Returns the inputs and labels for every position in the lead sheet.
+
+    Combines the batch encodings of the melody and chords in the same way as
+    self.events_to_input and self.events_to_label combine them per position.
+
+    Args:
+      events: A LeadSheet object.
+
+    Returns:
+      inputs: A float32 array of shape [len(events), self.input_size].
+      labels: An int64 array of shape [len(events)].
+    """
+    melody_inputs, melody_labels = self._melody_encoder_decoder.encode_batch(
+        events.melody)
+    chords_inputs, chords_labels = self._chords_encoder_decoder.encode_batch(
+        events.chords)
+    inputs = np.concatenate([melody_inputs, chords_inputs], axis=1)
+    labels = melody_labels + (self._melody_encoder_decoder.num_classes *
+                              chords_labels)
+    return inputs, labels
+
   def class_index_to_event(self, class_index, events):
     """Returns the lead sheet event for the given class index.
 
@@ -470,3 +548,27 @@ class LeadSheetProductEncoderDecoder(LeadSheetEncoderDecoder):
                                                           events.melody),
         self._chords_encoder_decoder.class_index_to_event(chord_index,
                                                           events.chords))
+
+  def extend_event_sequences_from_factors(self, event_sequences,
+                                          melody_classes, chord_classes):
+    """Extends the lead sheets by the given melody and chord classes.
+
+    This is for models that predict the two factors of each label with
+    separate output heads (see `class_factors`). Such a model is sampled one
+    factor at a time, e.g. by passing each head's softmax to
+    `sample_classes`, so the joint label is never needed.
+
+    Args:
+      event_sequences: A list of LeadSheet objects.
+      melody_classes: A list of melody class indices, one per lead sheet, each
+          in the range [0, melody num_classes).
+      chord_classes: A list of chord class indices, one per lead sheet, each in
+          the range [0, chords num_classes).
+    """
+    for i in range(len(event_sequences)):
+      lead_sheet = event_sequences[i]
+      lead_sheet.append_event((
+          self._melody_encoder_decoder.class_index_to_event(
+              int(melody_classes[i]), lead_sheet.melody),
+          self._chords_encoder_decoder.class_index_to_event(
+              int(chord_classes[i]), lead_sheet.chords)))
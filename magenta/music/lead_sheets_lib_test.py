@@ -30,6 +30,32 @@ NO_EVENT = constants.MELODY_NO_EVENT
 NO_CHORD = constants.NO_CHORD
 
 
+class ChordIndexEncoderDecoder(chords_lib.ChordsEncoderDecoder):
+  """A ChordsEncoderDecoder over a fixed list of chord figures, for testing."""
+
+  def __init__(self, figures):
+    self._figures = figures
+
+  @property
+  def input_size(self):
+    return len(self._figures)
+
+  @property
+  def num_classes(self):
+    return len(self._figures)
+
+  def events_to_input(self, events, position):
+    input_ = [0.0] * self.input_size
+    input_[self._figures.index(events[position])] = 1.0
+    return input_
+
+  def events_to_label(self, events, position):
+    return self._figures.index(events[position])
+
+  def class_index_to_event(self, class_index, events):
+    return self._figures[class_index]
+
+
 class LeadSheetsLibTest(tf.test.TestCase):
 
   def setUp(self):
@@ -54,6 +80,23 @@ class LeadSheetsLibTest(tf.test.TestCase):
     self.assertEqual(expected_melody, lead_sheet.melody)
     self.assertEqual(expected_chords, lead_sheet.chords)
 
+  def testView(self):
+    melody_events = [12 * 5 + 4, NO_EVENT, 12 * 5 + 5,
+                     NOTE_OFF, 12 * 6, NO_EVENT]
+    chord_events = [NO_CHORD, 'C', 'F', 'Dm', 'D', 'G']
+    melody = melodies_lib.Melody(melody_events)
+    chords = chords_lib.ChordProgression(chord_events)
+    lead_sheet = lead_sheets_lib.LeadSheet(melody, chords)
+
+    prefix = lead_sheet.prefix(3)
+    self.assertEqual(3, len(prefix))
+    self.assertEqual(zip(melody_events[:3], chord_events[:3]), list(prefix))
+    self.assertIsInstance(prefix.melody, melodies_lib.MelodyView)
+    self.assertEqual(chord_events[:3], list(prefix.chords))
+
+    window = lead_sheet.view(2, 6, stride=2)
+    self.assertEqual([(12 * 5 + 5, 'F'), (12 * 6, 'D')], list(window))
+
   def testSquash(self):
     # LeadSheet squash should agree with melody squash & chords transpose.
     melody_events = [12 * 5, NO_EVENT, 12 * 5 + 2,
@@ -199,6 +242,48 @@ class LeadSheetsLibTest(tf.test.TestCase):
     self.assertProtoEquals(chords_sequence.text_annotations,
                            sequence.text_annotations)
 
+  def testProductEncodeBatch(self):
+    encoder_decoder = lead_sheets_lib.LeadSheetProductEncoderDecoder(
+        melodies_lib.OneHotMelodyEncoderDecoder(60, 72, 0),
+        ChordIndexEncoderDecoder([NO_CHORD, 'C', 'G7', 'Am']))
+    melody = melodies_lib.Melody(
+        [60, NO_EVENT, 64, NOTE_OFF, 67, 71, NO_EVENT, 62])
+    chords = chords_lib.ChordProgression(
+        [NO_CHORD, 'C', 'C', 'G7', 'G7', 'Am', 'Am', 'C'])
+    testing_lib.assert_encode_batch_matches_events_to_input(
+        self, encoder_decoder, lead_sheets_lib.LeadSheet(melody, chords))
+
+  def testProductClassFactors(self):
+    encoder_decoder = lead_sheets_lib.LeadSheetProductEncoderDecoder(
+        melodies_lib.OneHotMelodyEncoderDecoder(60, 72, 0),
+        ChordIndexEncoderDecoder([NO_CHORD, 'C', 'G7', 'Am']))
+    num_melody_classes, num_chord_classes = encoder_decoder.class_factors
+    self.assertEqual(14, num_melody_classes)
+    self.assertEqual(4, num_chord_classes)
+    self.assertEqual(encoder_decoder.num_classes,
+                     num_melody_classes * num_chord_classes)
+    lead_sheet = lead_sheets_lib.LeadSheet(
+        melodies_lib.Melody([67]), chords_lib.ChordProgression(['G7']))
+    label = encoder_decoder.events_to_label(lead_sheet, 0)
+    self.assertEqual(9, label % num_melody_classes)
+    self.assertEqual(2, label // num_melody_classes)
+
+  def testExtendEventSequencesFromFactors(self):
+    encoder_decoder = lead_sheets_lib.LeadSheetProductEncoderDecoder(
+        melodies_lib.OneHotMelodyEncoderDecoder(60, 72, 0),
+        ChordIndexEncoderDecoder([NO_CHORD, 'C', 'G7', 'Am']))
+    lead_sheets = [lead_sheets_lib.LeadSheet() for _ in range(2)]
+    melody_softmax = [[[0.0] * 9 + [1.0] + [0.0] * 4],
+                      [[1.0] + [0.0] * 13]]
+    chord_softmax = [[[0.0, 0.0, 1.0, 0.0]], [[0.0, 0.0, 0.0, 1.0]]]
+    encoder_decoder.extend_event_sequences_from_factors(
+        lead_sheets,
+        encoder_decoder.sample_classes(melody_softmax),
+        encoder_decoder.sample_classes(chord_softmax))
+    self.assertEqual([(67, 'G7')], list(lead_sheets[0]))
+    self.assertEqual([(melodies_lib.MELODY_NO_EVENT, 'Am')],
+                     list(lead_sheets[1]))
+
 
 if __name__ == '__main__':
   tf.test.main()
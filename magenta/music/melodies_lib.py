@@ -31,6 +31,7 @@ with an event sampled from the softmax output by the model.
 """
 
 import abc
+import bisect
 import copy
 
 # internal imports
@@ -58,6 +59,13 @@ DEFAULT_STEPS_PER_QUARTER = constants.DEFAULT_STEPS_PER_QUARTER
 STANDARD_PPQ = constants.STANDARD_PPQ
 NOTE_KEYS = constants.NOTE_KEYS
 
+# MAJOR_KEY_PROFILES[note, key] is 1 if pitch class `note` belongs to the major
+# key `key`, and 0 otherwise. Multiplying a pitch class histogram by this matrix
+# counts how many notes fit into each major key.
+MAJOR_KEY_PROFILES = np.array(
+    [[int(key in NOTE_KEYS[note]) for key in range(NOTES_PER_OCTAVE)]
+     for note in range(NOTES_PER_OCTAVE)])
+
 
 class PolyphonicMelodyException(Exception):
   pass
@@ -67,6 +75,110 @@ class BadNoteException(Exception):
   pass
 
 
+def _note_histogram(events):
+  """Returns a 12-bin pitch class histogram of the note-ons in `events`.
+
+  Args:
+    events: An integer array of Melody events.
+
+  Returns:
+    An array of 12 ints, one for each note value (C at index 0 through B at
+    index 11).
+  """
+  return np.bincount(events[events >= MIN_MIDI_PITCH] % NOTES_PER_OCTAVE,
+                     minlength=NOTES_PER_OCTAVE)
+
+
+def _major_key_histogram(note_histogram):
+  """Returns how many notes of `note_histogram` fit into each major key.
+
+  Args:
+    note_histogram: A 12-element pitch class histogram.
+
+  Returns:
+    An array of 12 counts, one for each major key (C Major at index 0 through B
+    Major at index 11).
+  """
+  return np.dot(note_histogram, MAJOR_KEY_PROFILES)
+
+
+def lookback_repeats(events, lookback_distance):
+  """Returns which events repeat the event `lookback_distance` steps earlier.
+
+  Args:
+    events: An integer array of Melody events.
+    lookback_distance: A positive number of steps.
+
+  Returns:
+    A boolean array the same length as `events`.
+  """
+  repeats = np.zeros(len(events), dtype=bool)
+  if lookback_distance < len(events):
+    repeats[lookback_distance:] = (
+        events[lookback_distance:] ==
+        events[:len(events) - lookback_distance])
+  return repeats
+
+
+class MajorKeyEstimator(object):
+  """Incrementally estimates the major key of a stream of melody events.
+
+  The estimator keeps a running pitch class histogram of the note-on events it
+  has seen, so adding or removing an event takes constant time and the key
+  histogram is a single 12x12 matrix product. This makes it cheap to track the
+  key of a melody as it is encoded or generated one event at a time.
+  """
+
+  def __init__(self, events=None):
+    """Construct a MajorKeyEstimator.
+
+    Args:
+      events: An optional iterable of Melody events to initialize the estimator
+          with.
+    """
+    self._note_histogram = np.zeros(NOTES_PER_OCTAVE, dtype=np.int64)
+    if events is not None:
+      self.add_events(events)
+
+  def add_event(self, event):
+    """Adds a single Melody event. Only note-on events affect the estimate."""
+    if event >= MIN_MIDI_PITCH:
+      self._note_histogram[event % NOTES_PER_OCTAVE] += 1
+
+  def remove_event(self, event):
+    """Removes a Melody event previously passed to `add_event`."""
+    if event >= MIN_MIDI_PITCH:
+      self._note_histogram[event % NOTES_PER_OCTAVE] -= 1
+
+  def add_events(self, events):
+    """Adds a sequence of Melody events.
+
+    Args:
+      events: An iterable of Melody events, such as a Melody or MelodyView.
+    """
+    if not isinstance(events, (np.ndarray, Melody, MelodyView)):
+      events = list(events)
+    self._note_histogram += _note_histogram(
+        np.asarray(events, dtype=np.int64))
+
+  def get_note_histogram(self):
+    """Returns a copy of the running 12-bin pitch class histogram."""
+    return self._note_histogram.copy()
+
+  def get_major_key_histogram(self):
+    """Returns how many of the added notes fit into each major key.
+
+    Returns:
+      An array of 12 counts, one for each major key (C Major at index 0 through
+      B Major at index 11).
+    """
+    return _major_key_histogram(self._note_histogram)
+
+  def get_major_key(self):
+    """Returns the most likely major key (C Major = 0 through B Major = 11)."""
+    return int(self.get_major_key_histogram().argmax())
+
+
 class Melody(events_lib.SimpleEventSequence):
   """Stores a quantized stream of monophonic melody events.
 
@@ -108,11 +220,51 @@ class Melody(events_lib.SimpleEventSequence):
     steps_per_bar: Number of steps in a bar (measure) of music.
   """
 
+  __slots__ = ('_event_buffer',)
+
   def __init__(self, events=None, **kwargs):
     """Construct a Melody."""
     super(Melody, self).__init__(pad_event=MELODY_NO_EVENT,
                                  events=events, **kwargs)
 
+  def _reset(self):
+    """Clear events and reset object state."""
+    super(Melody, self)._reset()
+    self._set_events([])
+
+  def _set_events(self, events):
+    """Replaces the stored events with a compact int8 copy of `events`.
+
+    Melody events are kept in an int8 NumPy buffer. `self._events` is always a
+    view of the first `len(self)` entries of that buffer; any remaining
+    capacity is used to make appending amortized constant time.
+
+    Args:
+      events: A list or array of Melody events.
+    """
+    self._event_buffer = np.array(events, dtype=np.int8)
+    self._events = self._event_buffer[:]
+    self._events_shared = False
+
+  def _own_events(self):
+    """Copies the event buffer if it is shared with another Melody."""
+    if self._events_shared:
+      self._set_events(self._events)
+
+  def _reserve(self, num_events):
+    """Ensures the event buffer can hold at least `num_events` events.
+
+    Args:
+      num_events: The number of events the buffer must be able to hold.
+    """
+    if num_events > len(self._event_buffer):
+      event_buffer = np.empty(max(num_events, 2 * len(self._event_buffer)),
+                              dtype=np.int8)
+      event_buffer[:len(self._events)] = self._events
+      self._event_buffer = event_buffer
+      self._events = event_buffer[:len(self._events)]
+      self._events_shared = False
+
   def _from_event_list(self, events, start_step=0,
                        steps_per_bar=DEFAULT_STEPS_PER_BAR,
                        steps_per_quarter=DEFAULT_STEPS_PER_QUARTER):
@@ -127,18 +279,94 @@ class Melody(events_lib.SimpleEventSequence):
     Raises:
       ValueError: If `events` contains an event that is not in the proper range.
     """
-    for event in events:
-      if not MIN_MELODY_EVENT <= event <= MAX_MELODY_EVENT:
-        raise ValueError('Melody event out of range: %d' % event)
-    super(Melody, self)._from_event_list(
-        events, start_step=start_step, steps_per_bar=steps_per_bar,
-        steps_per_quarter=steps_per_quarter)
+    if not isinstance(events, np.ndarray):
+      events = list(events)
+    events = np.asarray(events, dtype=np.int64)
+    out_of_range = np.flatnonzero((events < MIN_MELODY_EVENT) |
+                                  (events > MAX_MELODY_EVENT))
+    if out_of_range.size:
+      raise ValueError('Melody event out of range: %d' %
+                       events[out_of_range[0]])
+    self._set_events(events)
+    self._start_step = start_step
+    self._end_step = start_step + len(self)
+    self._steps_per_bar = steps_per_bar
+    self._steps_per_quarter = steps_per_quarter
+
+  def __iter__(self):
+    """Return an iterator over the events in this Melody.
+
+    Returns:
+      Python iterator over integer events.
+    """
+    return iter(self._events.tolist())
+
+  def __getitem__(self, i):
+    """Returns the event at the given index, or a list for a slice."""
+    if isinstance(i, slice):
+      return self._events[i].tolist()
+    return int(self._events[i])
+
+  def __getslice__(self, i, j):
+    """Returns the events in the given slice range."""
+    return self._events[i:j].tolist()
+
+  def __array__(self, dtype=None):
+    """Returns a read-only int8 array view of the events in this Melody."""
+    events = self._events.view()
+    events.flags.writeable = False
+    if dtype is not None:
+      return events.astype(dtype)
+    return events
+
+  def view(self, start=0, stop=None, stride=1):
+    """Returns a read-only MelodyView of a range of events in this melody.
+
+    Args:
+      start: Index of the first event in the view.
+      stop: Index one past the last event in the view. If None, the view
+          extends to the end of the melody.
+      stride: A positive integer, the step between viewed events.
+
+    Returns:
+      A MelodyView object sharing this melody's event buffer.
+    """
+    return MelodyView(self, start, stop, stride)
+
+  def window(self, start, stop):
+    """Returns a Melody of the events in the range [start, stop).
+
+    Unlike a MelodyView, the window is a full Melody, but it shares this
+    melody's event buffer until either melody is modified, so taking a window
+    is constant time.
+
+    Args:
+      start: Index of the first event in the window.
+      stop: Index one past the last event in the window.
+
+    Returns:
+      A Melody object starting `start` steps after this melody's start step.
+
+    Raises:
+      ValueError: If [start, stop) is not a range of events in this melody.
+    """
+    if not 0 <= start <= stop <= len(self):
+      raise ValueError('Window [%d, %d) is outside of a melody of length %d' %
+                       (start, stop, len(self)))
+    window = self._copy_on_write()
+    window._event_buffer = self._events[start:stop]
+    window._events = window._event_buffer[:]
+    window._start_step = self._start_step + start
+    window._end_step = window._start_step + stop - start
+    return window
 
   def __deepcopy__(self, unused_memo=None):
-    return type(self)(events=copy.deepcopy(self._events),
-                      start_step=self.start_step,
-                      steps_per_bar=self.steps_per_bar,
-                      steps_per_quarter=self.steps_per_quarter)
+    """Returns a copy of this Melody.
+
+    The copy shares this melody's event buffer until either melody is
+    modified, so copying is constant time.
+    """
+    return self._copy_on_write()
 
   def __eq__(self, other):
     if not isinstance(other, Melody):
@@ -170,11 +398,11 @@ class Melody(events_lib.SimpleEventSequence):
           (start_step, end_step))
 
     self.set_length(end_step + 1)
+    self._own_events()
 
     self._events[start_step] = pitch
     self._events[end_step] = MELODY_NOTE_OFF
-    for i in range(start_step + 1, end_step):
-      self._events[i] = MELODY_NO_EVENT
+    self._events[start_step + 1:end_step] = MELODY_NO_EVENT
 
   def _get_last_on_off_events(self):
     """Returns indexes of the most recent pitch and NOTE_OFF events.
@@ -186,13 +414,13 @@ class Melody(events_lib.SimpleEventSequence):
     Raises:
       ValueError: If `events` contains no NOTE_OFF or pitch events.
     """
-    last_off = len(self)
-    for i in range(len(self) - 1, -1, -1):
-      if self._events[i] == MELODY_NOTE_OFF:
-        last_off = i
-      if self._events[i] >= MIN_MIDI_PITCH:
-        return (i, last_off)
-    raise ValueError('No events in the stream')
+    note_ons = np.flatnonzero(self._events >= MIN_MIDI_PITCH)
+    if not note_ons.size:
+      raise ValueError('No events in the stream')
+    last_on = int(note_ons[-1])
+    note_offs = np.flatnonzero(self._events[last_on:] == MELODY_NOTE_OFF)
+    last_off = last_on + int(note_offs[0]) if note_offs.size else len(self)
+    return (last_on, last_off)
 
   def get_note_histogram(self):
     """Gets a histogram of the note occurrences in a melody.
@@ -202,10 +430,7 @@ class Melody(events_lib.SimpleEventSequence):
       index 11). Each int is the total number of times that note occurred in
       the melody.
     """
-    np_melody = np.array(self._events, dtype=int)
-    return np.bincount(np_melody[np_melody >= MIN_MIDI_PITCH] %
-                       NOTES_PER_OCTAVE,
-                       minlength=NOTES_PER_OCTAVE)
+    return _note_histogram(self._events)
 
   def get_major_key_histogram(self):
     """Gets a histogram of the how many notes fit into each key.
@@ -215,11 +440,7 @@ class Melody(events_lib.SimpleEventSequence):
       B Major at index 11). Each int is the total number of notes that could
       fit into that key.
     """
-    note_histogram = self.get_note_histogram()
-    key_histogram = np.zeros(NOTES_PER_OCTAVE)
-    for note, count in enumerate(note_histogram):
-      key_histogram[NOTE_KEYS[note]] += count
-    return key_histogram
+    return _major_key_histogram(self.get_note_histogram())
 
   def get_major_key(self):
     """Finds the major key that this melody most likely belongs to.
@@ -246,7 +467,12 @@ class Melody(events_lib.SimpleEventSequence):
     """
     if not MIN_MELODY_EVENT <= event <= MAX_MELODY_EVENT:
       raise ValueError('Event out of range: %d' % event)
-    super(Melody, self).append_event(event)
+    self._own_events()
+    num_events = len(self._events)
+    self._reserve(num_events + 1)
+    self._event_buffer[num_events] = event
+    self._events = self._event_buffer[:num_events + 1]
+    self._end_step += 1
 
   def from_quantized_sequence(self,
                               quantized_sequence,
@@ -323,7 +549,7 @@ class Melody(events_lib.SimpleEventSequence):
       start_index = note.start - offset
       end_index = note.end - offset
 
-      if not self._events:
+      if not len(self):
         # If there are no events, we don't need to check for polyphony.
         self._add_note(note.pitch, start_index, end_index)
         continue
@@ -354,7 +580,7 @@ class Melody(events_lib.SimpleEventSequence):
       # Add the note-on and off events to the melody.
       self._add_note(note.pitch, start_index, end_index)
 
-    if not self._events:
+    if not len(self):
       # If no notes were added, don't set `start_step` and `end_step`.
       return
 
@@ -362,7 +588,7 @@ class Melody(events_lib.SimpleEventSequence):
 
     # Strip final MELODY_NOTE_OFF event.
     if self._events[-1] == MELODY_NOTE_OFF:
-      del self._events[-1]
+      self._events = self._events[:-1]
 
     length = len(self)
     # Optionally round up `end_step` to a multiple of `steps_per_bar`.
@@ -445,17 +671,19 @@ class Melody(events_lib.SimpleEventSequence):
       min_note: Minimum pitch (inclusive) that the resulting notes will take on.
       max_note: Maximum pitch (exclusive) that the resulting notes will take on.
     """
-    for i in range(len(self)):
-      # Transpose MIDI pitches. Special events below MIN_MIDI_PITCH are not
-      # changed.
-      if self._events[i] >= MIN_MIDI_PITCH:
-        self._events[i] += transpose_amount
-        if self._events[i] < min_note:
-          self._events[i] = (
-              min_note + (self._events[i] - min_note) % NOTES_PER_OCTAVE)
-        elif self._events[i] >= max_note:
-          self._events[i] = (max_note - NOTES_PER_OCTAVE +
-                             (self._events[i] - max_note) % NOTES_PER_OCTAVE)
+    # Transpose MIDI pitches. Special events below MIN_MIDI_PITCH are not
+    # changed. Pitches are widened to int16 so they can't overflow before being
+    # octave shifted back into range.
+    self._own_events()
+    is_note = self._events >= MIN_MIDI_PITCH
+    pitches = self._events[is_note].astype(np.int16) + transpose_amount
+    too_low = pitches < min_note
+    too_high = pitches >= max_note
+    pitches[too_low] = (
+        min_note + (pitches[too_low] - min_note) % NOTES_PER_OCTAVE)
+    pitches[too_high] = (max_note - NOTES_PER_OCTAVE +
+                         (pitches[too_high] - max_note) % NOTES_PER_OCTAVE)
+    self._events[is_note] = pitches
 
   def squash(self, min_note, max_note, transpose_to_key):
     """Transpose and octave shift the notes in this Melody.
@@ -473,14 +701,13 @@ class Melody(events_lib.SimpleEventSequence):
     Returns:
       How much notes are transposed by.
     """
-    melody_key = self.get_major_key()
+    melody_key = MajorKeyEstimator(self).get_major_key()
     key_diff = transpose_to_key - melody_key
-    midi_notes = [note for note in self._events
-                  if MIN_MIDI_PITCH <= note <= MAX_MIDI_PITCH]
-    if not midi_notes:
+    midi_notes = self._events[self._events >= MIN_MIDI_PITCH]
+    if not midi_notes.size:
       return 0
-    melody_min_note = min(midi_notes)
-    melody_max_note = max(midi_notes)
+    melody_min_note = int(midi_notes.min())
+    melody_max_note = int(midi_notes.max())
     melody_center = (melody_min_note + melody_max_note) / 2
     target_center = (min_note + max_note - 1) / 2
     center_diff = target_center - (melody_center + key_diff)
@@ -503,15 +730,27 @@ class Melody(events_lib.SimpleEventSequence):
       from_left: Whether to add/remove from the left instead of right.
     """
     old_len = len(self)
-    super(Melody, self).set_length(steps, from_left=from_left)
+    if from_left:
+      if steps > old_len:
+        events = np.full(steps, MELODY_NO_EVENT, dtype=np.int8)
+        events[steps - old_len:] = self._events
+      else:
+        events = self._events[-steps:]
+      self._set_events(events)
+      self._start_step = self._end_step - steps
+    else:
+      if steps > old_len:
+        self._own_events()
+        self._reserve(steps)
+        self._event_buffer[old_len:steps] = MELODY_NO_EVENT
+      self._events = self._event_buffer[:steps]
+      self._end_step = self._start_step + steps
+
     if steps > old_len and not from_left:
       # When extending the melody on the right, we end any sustained notes.
-      for i in reversed(range(old_len)):
-        if self._events[i] == MELODY_NOTE_OFF:
-          break
-        elif self._events[i] != MELODY_NO_EVENT:
-          self._events[old_len] = MELODY_NOTE_OFF
-          break
+      events = np.flatnonzero(self._events[:old_len] != MELODY_NO_EVENT)
+      if events.size and self._events[events[-1]] != MELODY_NOTE_OFF:
+        self._events[old_len] = MELODY_NOTE_OFF
 
   def increase_resolution(self, k):
     """Increase the resolution of a Melody.
@@ -523,8 +762,66 @@ class Melody(events_lib.SimpleEventSequence):
       k: An integer, the factor by which to increase the resolution of the
           melody.
     """
-    super(Melody, self).increase_resolution(
-        k, fill_event=MELODY_NO_EVENT)
+    events = np.full(len(self) * k, MELODY_NO_EVENT, dtype=np.int8)
+    events[::k] = self._events
+    self._set_events(events)
+    self._start_step *= k
+    self._end_step *= k
+    self._steps_per_bar *= k
+    self._steps_per_quarter *= k
+
+
+class MelodyView(events_lib.EventSequenceView):
+  """A read-only view of a range of events in a Melody.
+
+  In addition to the EventSequenceView interface, a MelodyView supports the
+  read-only analysis methods of Melody, computed directly on the viewed slice
+  of the melody's event buffer. This lets encoders inspect melody prefixes
+  without copying them.
+  """
+  __slots__ = ()
+
+  def __array__(self, dtype=None):
+    """Returns a read-only int8 array view of the viewed events."""
+    events = np.asarray(self._sequence)[
+        self._start:self._stop():self._stride]
+    if dtype is not None:
+      return events.astype(dtype)
+    return events
+
+  def __iter__(self):
+    """Return an iterator over the viewed events.
+
+    Returns:
+      Python iterator over integer events.
+    """
+    return iter(np.asarray(self).tolist())
+
+  def get_note_histogram(self):
+    """Gets a histogram of the note occurrences in the viewed events.
+
+    Returns:
+      A list of 12 ints, one for each note value (C at index 0 through B at
+      index 11).
+    """
+    return _note_histogram(np.asarray(self))
+
+  def get_major_key_histogram(self):
+    """Gets a histogram of the how many viewed notes fit into each key.
+
+    Returns:
+      A list of 12 ints, one for each Major key (C Major at index 0 through
+      B Major at index 11).
+    """
+    return _major_key_histogram(self.get_note_histogram())
+
+  def get_major_key(self):
+    """Finds the major key that the viewed events most likely belong to.
+
+    Returns:
+      An int for the most likely key (C Major = 0 through B Major = 11)
+    """
+    return self.get_major_key_histogram().argmax()
 
 
 def extract_melodies(quantized_sequence,
@@ -576,7 +873,7 @@ def extract_melodies(quantized_sequence,
 
   Returns:
     melodies: A python list of Melody instances.
-    stats: A dictionary mapping string names to `statistics.Statistic` objects.
+    stats: A list of the `statistics.Statistic` objects that were incremented.
 
   Raises:
     NonIntegerStepsPerBarException: If `quantized_sequence`'s bar length
@@ -586,20 +883,15 @@ def extract_melodies(quantized_sequence,
   # TODO(danabo): Convert `ignore_polyphonic_notes` into a float which controls
   # the degree of polyphony that is acceptable.
   melodies = []
-  stats = dict([(stat_name, statistics.Counter(stat_name)) for stat_name in
-                ['polyphonic_tracks_discarded',
-                 'melodies_discarded_too_short',
-                 'melodies_discarded_too_few_pitches',
-                 'melodies_discarded_too_long',
-                 'melodies_truncated']])
-  # Create a histogram measuring melody lengths (in bars not steps).
-  # Capture melodies that are very small, in the range of the filter lower
-  # bound `min_bars`, and large. The bucket intervals grow approximately
-  # exponentially.
-  stats['melody_lengths_in_bars'] = statistics.Histogram(
-      'melody_lengths_in_bars',
-      [0, 1, 10, 20, 30, 40, 50, 100, 200, 500, min_bars // 2, min_bars,
-       min_bars + 1, min_bars - 1])
+  # Statistics are only created when they are first incremented.
+  stats = statistics.StatisticsRegistry()
+  # A histogram measuring melody lengths (in bars not steps) is only computed
+  # at DETAILED statistics verbosity. Capture melodies that are very small, in
+  # the range of the filter lower bound `min_bars`, and large. The bucket
+  # intervals grow approximately exponentially.
+  record_lengths = statistics.get_verbosity() >= statistics.DETAILED
+  length_buckets = [0, 1, 10, 20, 30, 40, 50, 100, 200, 500, min_bars // 2,
+                    min_bars, min_bars + 1, min_bars - 1]
   for track in quantized_sequence.tracks:
     start = 0
 
@@ -616,7 +908,7 @@ def extract_melodies(quantized_sequence,
             ignore_polyphonic_notes=ignore_polyphonic_notes,
             pad_end=pad_end)
       except PolyphonicMelodyException:
-        stats['polyphonic_tracks_discarded'].increment()
+        stats.counter('polyphonic_tracks_discarded').increment()
         break  # Look for monophonic melodies in other tracks.
       except events_lib.NonIntegerStepsPerBarException:
         raise
@@ -625,15 +917,16 @@ def extract_melodies(quantized_sequence,
         break
 
       # Require a certain melody length.
-      stats['melody_lengths_in_bars'].increment(
-          len(melody) // melody.steps_per_bar)
+      if record_lengths:
+        stats.histogram('melody_lengths_in_bars', length_buckets).increment(
+            len(melody) // melody.steps_per_bar)
       if len(melody) - 1 < melody.steps_per_bar * min_bars:
-        stats['melodies_discarded_too_short'].increment()
+        stats.counter('melodies_discarded_too_short').increment()
         continue
 
       # Discard melodies that are too long.
       if max_steps_discard is not None and len(melody) > max_steps_discard:
-        stats['melodies_discarded_too_long'].increment()
+        stats.counter('melodies_discarded_too_long').increment()
         continue
 
       # Truncate melodies that are too long.
@@ -642,13 +935,13 @@ def extract_melodies(quantized_sequence,
         if pad_end:
           truncated_length -= max_steps_truncate % melody.steps_per_bar
         melody.set_length(truncated_length)
-        stats['melodies_truncated'].increment()
+        stats.counter('melodies_truncated').increment()
 
       # Require a certain number of unique pitches.
       note_histogram = melody.get_note_histogram()
       unique_pitches = np.count_nonzero(note_histogram)
       if unique_pitches < min_unique_pitches:
-        stats['melodies_discarded_too_few_pitches'].increment()
+        stats.counter('melodies_discarded_too_few_pitches').increment()
         continue
 
       # TODO(danabo)
@@ -659,6 +952,160 @@ def extract_melodies(quantized_sequence,
   return melodies, stats.values()
 
 
+class StreamingMelodyBuilder(object):
+  """Quantizes notes into a monophonic Melody incrementally as they arrive.
+
+  Adding the notes of a NoteSequence one at a time produces the same melody as
+  quantizing the whole sequence with `QuantizedSequence.from_note_sequence` and
+  then calling `extract_melodies` with `min_bars=0`, `min_unique_pitches=1`,
+  `gap_bars=float('inf')`, and `ignore_polyphonic_notes=True`. This lets live
+  MIDI capture keep an always-current melody, so nothing needs to be quantized
+  or extracted when the captured melody is used as a generation primer.
+
+  Notes that arrive in start time order, as they do from a monophonic
+  capture, are added in amortized constant time. A note that starts before the
+  most recent note causes the melody to be rebuilt from all notes received.
+
+  All notes are treated as a single track in a 4/4 (or `quarters_per_bar`)
+  time signature.
+  """
+
+  def __init__(self, qpm, steps_per_quarter=DEFAULT_STEPS_PER_QUARTER,
+               start_time=0.0, quarters_per_bar=4):
+    """Construct a StreamingMelodyBuilder.
+
+    Args:
+      qpm: Quarter notes per minute (float) used to quantize note times.
+      steps_per_quarter: How many quantization steps per quarter note.
+      start_time: The time in seconds (float) that quantization step 0 lands
+          on. Note times are measured relative to it.
+      quarters_per_bar: The integer number of quarter notes in a bar.
+    """
+    self._steps_per_second = steps_per_quarter * qpm / 60.0
+    self._steps_per_quarter = steps_per_quarter
+    self._steps_per_bar = steps_per_quarter * quarters_per_bar
+    self._start_time = start_time
+    # The (pitch, velocity, start_time, end_time) of each note, in the order
+    # they were added.
+    self._notes = []
+    self._reset()
+
+  def _reset(self):
+    """Clears the melody while keeping the received notes."""
+    # Sort keys of the quantized notes: (start_step, -pitch, index, end_step).
+    self._sorted_notes = []
+    self._melody = Melody(steps_per_bar=self._steps_per_bar,
+                          steps_per_quarter=self._steps_per_quarter)
+    self._offset = None
+    self._last_on = None
+
+  def _quantize(self, time):
+    """Returns the quantization step of a time in seconds."""
+    return int((time - self._start_time) * self._steps_per_second +
+               (1 - sequences_lib.QUANTIZE_CUTOFF))
+
+  def add_note(self, note):
+    """Adds a note to the melody.
+
+    Args:
+      note: A NoteSequence.Note proto with its end time set.
+
+    Raises:
+      NegativeTimeException: If the note starts or ends before `start_time`.
+    """
+    self._notes.append((note.pitch, note.velocity, note.start_time,
+                        note.end_time))
+    self._add_note(len(self._notes) - 1)
+
+  def _add_note(self, index):
+    """Quantizes the note at `index` in `self._notes` and adds it."""
+    pitch, velocity, start_time, end_time = self._notes[index]
+    start_step = self._quantize(start_time)
+    end_step = self._quantize(end_time)
+    if end_step == start_step:
+      end_step += 1
+    if start_step < 0 or end_step < 0:
+      raise sequences_lib.NegativeTimeException(
+          'Got negative note time: start_step = %s, end_step = %s' %
+          (start_step, end_step))
+
+    # Ignore 0 velocity notes.
+    if not velocity:
+      return
+
+    key = (start_step, -pitch, index, end_step)
+    if self._sorted_notes and key < self._sorted_notes[-1]:
+      # The note belongs before notes that were already added.
+      bisect.insort(self._sorted_notes, key)
+      self._rebuild()
+    else:
+      self._sorted_notes.append(key)
+      self._add_quantized_note(pitch, start_step, end_step)
+
+  def _add_quantized_note(self, pitch, start_step, end_step):
+    """Adds a quantized note that starts on or after all previous notes."""
+    if self._offset is None:
+      self._offset = start_step - start_step % self._steps_per_bar
+    start_index = start_step - self._offset
+    end_index = end_step - self._offset
+
+    # Notes on the same step are ordered by pitch descending, so if a note
+    # already starts on this step it's the highest pitch.
+    if start_index == self._last_on:
+      return
+
+    # pylint: disable=protected-access
+    self._melody._add_note(pitch, start_index, end_index)
+    # pylint: enable=protected-access
+    self._last_on = start_index
+
+  def _rebuild(self):
+    """Rebuilds the melody from the sorted quantized notes."""
+    sorted_notes = self._sorted_notes
+    self._reset()
+    self._sorted_notes = sorted_notes
+    for start_step, negative_pitch, _, end_step in sorted_notes:
+      self._add_quantized_note(-negative_pitch, start_step, end_step)
+
+  def truncate(self, end_time):
+    """Removes and truncates notes the way `MidiCaptor` ends a capture.
+
+    Notes that start at or after `end_time` are removed, and notes that end
+    after it are shortened to end at `end_time`.
+
+    Args:
+      end_time: The time in seconds (float) at which to truncate.
+    """
+    notes = []
+    for pitch, velocity, start_time, note_end_time in self._notes:
+      if start_time >= end_time:
+        continue
+      notes.append((pitch, velocity, start_time, min(note_end_time, end_time)))
+    if notes != self._notes:
+      self._notes = notes
+      self._reset()
+      for index in range(len(notes)):
+        self._add_note(index)
+
+  @property
+  def melody(self):
+    """A Melody of the notes added so far.
+
+    The melody starts at the first bar containing a note and does not end with
+    a NOTE_OFF event. It is empty if no notes have been added.
+    """
+    melody = copy.deepcopy(self._melody)
+    if len(melody):
+      # pylint: disable=protected-access
+      melody._start_step = self._offset
+      # Strip final MELODY_NOTE_OFF event.
+      if melody._events[-1] == MELODY_NOTE_OFF:
+        melody._events = melody._events[:-1]
+      # pylint: enable=protected-access
+      melody.set_length(len(melody))
+    return melody
+
+
 def midi_file_to_melody(midi_file, steps_per_quarter=4, qpm=None,
                         ignore_polyphonic_notes=True):
   """Loads a melody from a MIDI file.
@@ -843,17 +1290,78 @@ class MelodyEncoderDecoder(events_lib.EventsEncoderDecoder):
     """
     pass
 
-  def squash_and_encode(self, melody):
+  def squash_and_encode(self, melody, sparse_inputs=False, serialized=False):
     """Returns a SequenceExample for the given melody after squashing.
 
     Args:
       melody: A Melody object.
+      sparse_inputs: If True, only the nonzero elements of each input vector
+          are stored in the SequenceExample.
+      serialized: If True, a magenta.common.SerializedSequenceExample written
+          directly in the wire format is returned instead.
 
     Returns:
       A tf.train.SequenceExample containing inputs and labels.
     """
     melody.squash(self._min_note, self._max_note, self._transpose_to_key)
-    return self._encode(melody)
+    return self._encode(melody, sparse_inputs, serialized)
+
+  def encode_transpositions_batch(self, melody, transpositions):
+    """Returns the inputs and labels of several transpositions of a melody.
+
+    Transposition `i` moves every note of `melody` by `transpositions[i]` half
+    steps, and its encoding is that of `encode_batch` on the transposed
+    melody. This implementation encodes each transposition separately;
+    subclasses whose encodings have parts that don't depend on the key can
+    override it to compute those parts only once.
+
+    Args:
+      melody: A Melody object.
+      transpositions: A list of integer transposition amounts in half steps.
+          Every transposed note must be in [`min_note`, `max_note`).
+
+    Returns:
+      inputs: A float32 array of shape
+          [len(transpositions), len(melody), self.input_size].
+      labels: An int64 array of shape [len(transpositions), len(melody)].
+    """
+    events = np.asarray(melody, dtype=np.int64)
+    is_note = events >= MIN_MIDI_PITCH
+    inputs = np.zeros((len(transpositions), len(events), self.input_size),
+                      dtype=np.float32)
+    labels = np.zeros((len(transpositions), len(events)), dtype=np.int64)
+    for i, transposition in enumerate(transpositions):
+      transposed = Melody(np.where(is_note, events + transposition, events),
+                          start_step=melody.start_step,
+                          steps_per_bar=melody.steps_per_bar,
+                          steps_per_quarter=melody.steps_per_quarter)
+      inputs[i], labels[i] = self.encode_batch(transposed)
+    return inputs, labels
+
+  def encode_transpositions(self, melody, transpositions, sparse_inputs=False,
+                            serialized=False):
+    """Returns SequenceExamples for several transpositions of a melody.
+
+    All transpositions are encoded by a single `encode_transpositions_batch`
+    call. Unlike `squash_and_encode`, the melody is not squashed, since that
+    would transpose every transposition back into the same key.
+
+    Args:
+      melody: A Melody object.
+      transpositions: A list of integer transposition amounts in half steps.
+          Every transposed note must be in [`min_note`, `max_note`).
+      sparse_inputs: If True, only the nonzero elements of each input vector
+          are stored in the SequenceExamples.
+      serialized: If True, magenta.common.SerializedSequenceExamples are
+          returned instead.
+
+    Returns:
+      A list of tf.train.SequenceExamples, one per transposition.
+    """
+    inputs, labels = self.encode_transpositions_batch(melody, transpositions)
+    return [self._make_sequence_example(inputs[i], labels[i], sparse_inputs,
+                                        serialized)
+            for i in range(len(transpositions))]
 
 
 class OneHotMelodyEncoderDecoder(MelodyEncoderDecoder):
@@ -888,6 +1396,27 @@ class OneHotMelodyEncoderDecoder(MelodyEncoderDecoder):
             if events[position] < 0
             else events[position] - self.min_note + NUM_SPECIAL_MELODY_EVENTS)
 
+  def encode_batch(self, events):
+    events = np.asarray(events, dtype=np.int64)
+    labels = np.where(events < 0,
+                      events + NUM_SPECIAL_MELODY_EVENTS,
+                      events - self.min_note + NUM_SPECIAL_MELODY_EVENTS)
+    inputs = np.zeros((len(labels), self._input_size), dtype=np.float32)
+    inputs[np.arange(len(labels)), labels] = 1.0
+    return inputs, labels
+
+  def encode_transpositions_batch(self, melody, transpositions):
+    # Only the labels of notes depend on the key, and they move with it.
+    _, labels = self.encode_batch(melody)
+    is_note = np.asarray(melody, dtype=np.int64) >= MIN_MIDI_PITCH
+    labels = (labels[np.newaxis, :] +
+              np.outer(np.asarray(transpositions, dtype=np.int64), is_note))
+    inputs = np.zeros(labels.shape + (self._input_size,), dtype=np.float32)
+    inputs[np.arange(labels.shape[0])[:, np.newaxis],
+           np.arange(labels.shape[1])[np.newaxis, :],
+           labels] = 1.0
+    return inputs, labels
+
   def class_index_to_event(self, class_index, events):
     return (class_index - NUM_SPECIAL_MELODY_EVENTS
             if class_index < NUM_SPECIAL_MELODY_EVENTS
@@ -13,9 +13,12 @@
 # limitations under the License.
 """Tests for melodies_lib."""
 
+import copy
 import os
+import pickle
 
 # internal imports
+import numpy as np
 import tensorflow as tf
 
 from magenta.common import sequence_example_lib
@@ -23,6 +26,8 @@ from magenta.music import constants
 from magenta.music import melodies_lib
 from magenta.music import sequences_lib
 from magenta.music import testing_lib
+from magenta.pipelines import statistics
+from magenta.protobuf import music_pb2
 
 NOTE_OFF = constants.MELODY_NOTE_OFF
 NO_EVENT = constants.MELODY_NO_EVENT
@@ -35,6 +40,119 @@ class MelodiesLibTest(tf.test.TestCase):
     self.quantized_sequence.qpm = 60.0
     self.quantized_sequence.steps_per_quarter = 4
 
+  def testCompactStorage(self):
+    events = [NO_EVENT, 12 * 5, NOTE_OFF, 12 * 10 + 7]
+    melody = melodies_lib.Melody(events)
+    events_array = np.asarray(melody)
+    self.assertEqual(np.int8, events_array.dtype)
+    self.assertFalse(events_array.flags.writeable)
+    self.assertEqual(events, events_array.tolist())
+
+    # Indexing, slicing, and iteration return plain Python ints.
+    self.assertIs(int, type(melody[1]))
+    self.assertEqual([12 * 5, NOTE_OFF], melody[1:3])
+    self.assertTrue(all(type(event) is int for event in melody))
+
+    with self.assertRaises(ValueError):
+      melodies_lib.Melody([12 * 5, 128])
+    with self.assertRaises(ValueError):
+      melodies_lib.Melody([-3])
+
+  def testMelodyView(self):
+    events = [NO_EVENT, 12 * 5 + 2, NOTE_OFF, 12 * 4 + 4, 12 * 6 + 6, NO_EVENT]
+    melody = melodies_lib.Melody(events, start_step=32)
+    prefix = melody.prefix(4)
+    self.assertIsInstance(prefix, melodies_lib.MelodyView)
+    self.assertEqual(events[:4], list(prefix))
+    self.assertEqual(events[:4], np.asarray(prefix).tolist())
+    self.assertEqual(
+        list(melodies_lib.Melody(events[:4]).get_major_key_histogram()),
+        list(prefix.get_major_key_histogram()))
+    self.assertEqual(melodies_lib.Melody(events[:4]).get_major_key(),
+                     prefix.get_major_key())
+
+    window = melody.view(1, stride=3)
+    self.assertIsInstance(window, melodies_lib.MelodyView)
+    self.assertEqual([12 * 5 + 2, 12 * 6 + 6], list(window))
+    self.assertEqual([0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0, 0],
+                     list(window.get_note_histogram()))
+
+    # Views read through to the melody's current events.
+    melody.transpose(1)
+    self.assertEqual([12 * 5 + 3, 12 * 6 + 7], list(window))
+
+    melody.set_length(2)
+    self.assertEqual(1, len(window))
+    self.assertEqual([12 * 5 + 3], np.asarray(window).tolist())
+    with self.assertRaises(IndexError):
+      _ = window[1]
+
+  def testAppendEvent(self):
+    melody = melodies_lib.Melody()
+    for i in range(100):
+      melody.append_event(i)
+    self.assertEqual(list(range(100)), list(melody))
+    self.assertEqual(100, melody.end_step)
+
+    melody.set_length(50)
+    melody.append_event(NOTE_OFF)
+    self.assertEqual(list(range(50)) + [NOTE_OFF], list(melody))
+
+  def testDeepcopyCopyOnWrite(self):
+    events = [12 * 5, NO_EVENT, NOTE_OFF, 12 * 5 + 4]
+    melody = melodies_lib.Melody(events, start_step=4)
+    melody_copy = copy.deepcopy(melody)
+    self.assertEqual(melody, melody_copy)
+
+    # Mutating either melody must not affect the other.
+    melody_copy.transpose(2)
+    melody_copy.append_event(NOTE_OFF)
+    self.assertEqual(events, list(melody))
+    self.assertEqual([12 * 5 + 2, NO_EVENT, NOTE_OFF, 12 * 5 + 6, NOTE_OFF],
+                     list(melody_copy))
+
+    melody_copy = copy.deepcopy(melody)
+    melody.set_length(2)
+    melody.append_event(12 * 6)
+    melody.set_length(6)
+    self.assertEqual(events, list(melody_copy))
+    self.assertEqual([12 * 5, NO_EVENT, 12 * 6, NOTE_OFF, NO_EVENT, NO_EVENT],
+                     list(melody))
+
+  def testPickle(self):
+    melody = melodies_lib.Melody([12 * 5, NO_EVENT, NOTE_OFF], start_step=4,
+                                 steps_per_bar=8, steps_per_quarter=2)
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+      melody_copy = pickle.loads(pickle.dumps(melody, protocol))
+      self.assertEqual(melody, melody_copy)
+      self.assertEqual(4, melody_copy.start_step)
+      self.assertEqual(8, melody_copy.steps_per_bar)
+      melody_copy.append_event(12 * 6)
+      self.assertEqual([12 * 5, NO_EVENT, NOTE_OFF, 12 * 6], list(melody_copy))
+
+  def testWindow(self):
+    events = [12 * 5, NO_EVENT, NOTE_OFF, 12 * 5 + 4, NO_EVENT, 12 * 6]
+    melody = melodies_lib.Melody(events, start_step=4, steps_per_bar=2)
+    window = melody.window(2, 5)
+    self.assertEqual([NOTE_OFF, 12 * 5 + 4, NO_EVENT], list(window))
+    self.assertEqual(6, window.start_step)
+    self.assertEqual(9, window.end_step)
+    self.assertEqual(2, window.steps_per_bar)
+    self.assertTrue(np.may_share_memory(np.asarray(melody),
+                                        np.asarray(window)))
+
+    # Mutating either melody must not affect the other.
+    window.transpose(2)
+    window.append_event(12 * 7)
+    self.assertEqual(events, list(melody))
+    self.assertEqual([NOTE_OFF, 12 * 5 + 6, NO_EVENT, 12 * 7], list(window))
+    window = melody.window(0, 3)
+    melody.transpose(-2)
+    self.assertEqual(events[:3], list(window))
+
+    with self.assertRaises(ValueError):
+      melody.window(4, 7)
+
   def testGetNoteHistogram(self):
     events = [NO_EVENT, NOTE_OFF, 12 * 2 + 1, 12 * 3, 12 * 5 + 11, 12 * 6 + 3,
               12 * 4 + 11]
@@ -90,6 +208,28 @@ class MelodiesLibTest(tf.test.TestCase):
     melody = melodies_lib.Melody(events)
     self.assertEqual(0, melody.get_major_key())
 
+  def testMajorKeyEstimator(self):
+    # D Major.
+    events = [NO_EVENT, 12 * 2 + 2, 12 * 3 + 4, 12 * 5 + 1, 12 * 6 + 6,
+              12 * 4 + 11, 12 * 3 + 9, 12 * 5 + 7, NOTE_OFF]
+    melody = melodies_lib.Melody(events)
+    estimator = melodies_lib.MajorKeyEstimator()
+    for event in events:
+      estimator.add_event(event)
+    self.assertEqual(list(melody.get_note_histogram()),
+                     list(estimator.get_note_histogram()))
+    self.assertEqual(list(melody.get_major_key_histogram()),
+                     list(estimator.get_major_key_histogram()))
+    self.assertEqual(2, estimator.get_major_key())
+    self.assertEqual(
+        list(estimator.get_major_key_histogram()),
+        list(melodies_lib.MajorKeyEstimator(melody).get_major_key_histogram()))
+
+    # Removing the added notes in reverse leaves an empty histogram.
+    for event in reversed(events):
+      estimator.remove_event(event)
+    self.assertEqual([0] * 12, list(estimator.get_note_histogram()))
+
   def testTranspose(self):
     # Melody transposed down 5 half steps. 2 octave range.
     events = [12 * 5 + 4, NO_EVENT, 12 * 5 + 5, NOTE_OFF, 12 * 6, NO_EVENT]
@@ -569,6 +709,49 @@ class MelodiesLibTest(tf.test.TestCase):
         {float('-inf'): 0, 0: 1, 1: 0, 2: 1, 10: 1, 20: 0, 30: 0, 40: 0, 50: 0,
          100: 0, 200: 0, 500: 0})
 
+    statistics.set_verbosity(statistics.BASIC)
+    try:
+      _, stats = melodies_lib.extract_melodies(
+          self.quantized_sequence, min_bars=1, gap_bars=1,
+          min_unique_pitches=2, ignore_polyphonic_notes=False)
+    finally:
+      statistics.set_verbosity(statistics.DETAILED)
+    self.assertEqual(
+        set(['polyphonic_tracks_discarded', 'melodies_discarded_too_short',
+             'melodies_discarded_too_few_pitches']),
+        set(stat.name for stat in stats))
+
+  def testStreamingMelodyBuilder(self):
+    note_sequence = music_pb2.NoteSequence()
+    note_sequence.tempos.add(qpm=60.0)
+    # Notes overlap, two start on the same step, and one arrives late.
+    testing_lib.add_track_to_sequence(
+        note_sequence, 0,
+        [(60, 100, 4.0, 5.1), (64, 100, 5.0, 6.0), (62, 100, 5.02, 5.5),
+         (67, 100, 7.0, 8.0), (55, 100, 6.5, 7.0), (50, 0, 7.5, 8.0)])
+
+    def extract(note_sequence):
+      quantized_sequence = sequences_lib.QuantizedSequence()
+      quantized_sequence.from_note_sequence(note_sequence, 4)
+      melodies, _ = melodies_lib.extract_melodies(
+          quantized_sequence, min_bars=0, min_unique_pitches=1,
+          gap_bars=float('inf'), ignore_polyphonic_notes=True)
+      return melodies[0]
+
+    builder = melodies_lib.StreamingMelodyBuilder(
+        60.0, steps_per_quarter=4, start_time=1.0)
+    for note in note_sequence.notes:
+      builder.add_note(note)
+    for note in note_sequence.notes:
+      note.start_time -= 1.0
+      note.end_time -= 1.0
+    self.assertEqual(extract(note_sequence), builder.melody)
+
+    builder.truncate(5.75)
+    del note_sequence.notes[3:]
+    note_sequence.notes[1].end_time = 4.75
+    self.assertEqual(extract(note_sequence), builder.melody)
+
   def testMidiFileToMelody(self):
     filename = os.path.join(tf.resource_loader.get_data_files_path(),
                             'testdata', 'melody.mid')
@@ -627,6 +810,62 @@ class MelodyEncoderDecoderTest(tf.test.TestCase):
         expected_inputs, expected_labels)
     self.assertEqual(sequence_example, expected_sequence_example)
 
+  def testLookbackRepeats(self):
+    events = np.array([60, NO_EVENT, 62, 60, NO_EVENT, 64])
+    self.assertEqual([False, False, False, True, True, False],
+                     melodies_lib.lookback_repeats(events, 3).tolist())
+    self.assertEqual([False] * 6,
+                     melodies_lib.lookback_repeats(events, 6).tolist())
+
+  def testEncodeBatch(self):
+    events = [60, 60, 67, 71, NO_EVENT, 62, 70, NOTE_OFF, NO_EVENT]
+    testing_lib.assert_encode_batch_matches_events_to_input(
+        self, self.melody_encoder_decoder, melodies_lib.Melody(events))
+
+  def testEncodeTranspositions(self):
+    melody = melodies_lib.Melody(
+        [61, 61, 67, 70, NO_EVENT, 62, 69, NOTE_OFF, NO_EVENT])
+    testing_lib.assert_encode_transpositions_matches_encode_batch(
+        self, self.melody_encoder_decoder, melody, [-1, 0, 1])
+
+    sequence_examples = self.melody_encoder_decoder.encode_transpositions(
+        melody, [-1, 1])
+    self.assertEqual(2, len(sequence_examples))
+    transposed = melodies_lib.Melody(
+        [62, 62, 68, 71, NO_EVENT, 63, 70, NOTE_OFF, NO_EVENT])
+    inputs, labels = self.melody_encoder_decoder.encode_batch(transposed)
+    self.assertEqual(
+        sequence_example_lib.make_sequence_example(inputs[:-1].tolist(),
+                                                   labels[1:].tolist()),
+        sequence_examples[1])
+
+  def testEncoderState(self):
+    melody = melodies_lib.Melody([60, 62])
+    encoder_state = self.melody_encoder_decoder.get_encoder_state(melody)
+    self.assertEqual(self.melody_encoder_decoder.events_to_input(melody, 1),
+                     encoder_state.get_input())
+    melody.append_event(NOTE_OFF)
+    self.assertEqual(self.melody_encoder_decoder.events_to_input(melody, 2),
+                     encoder_state.get_input())
+
+  def testSquashAndEncodeSparseInputs(self):
+    events = [100, 100, 107, 111, NO_EVENT, 99, 112, NOTE_OFF, NO_EVENT]
+    sequence_example = self.melody_encoder_decoder.squash_and_encode(
+        melodies_lib.Melody(events), sparse_inputs=True)
+    feature_list = sequence_example.feature_lists.feature_list
+    self.assertEqual(
+        [[2], [2], [9], [13], [0], [13], [2], [1]],
+        [list(feature.int64_list.value)
+         for feature in feature_list['input_indices'].feature])
+    self.assertEqual(
+        [[1.0]] * 8,
+        [list(feature.float_list.value)
+         for feature in feature_list['input_values'].feature])
+    self.assertEqual(
+        [2, 9, 13, 0, 13, 2, 1, 0],
+        [feature.int64_list.value[0]
+         for feature in feature_list['labels'].feature])
+
   def testGetInputsBatch(self):
     events1 = [100, 100, 107, 111, NO_EVENT, 99, 112, NOTE_OFF, NO_EVENT]
     melody1 = melodies_lib.Melody(events1)
@@ -694,6 +933,47 @@ class MelodyEncoderDecoderTest(tf.test.TestCase):
     self.assertListEqual(list(melody3), [60, NO_EVENT])
     self.assertListEqual(list(melody4), [60, NOTE_OFF])
 
+  def testExtendMelodiesRandomStates(self):
+    softmax = np.random.RandomState(3).rand(3, 1, 14)
+    softmax /= softmax.sum(axis=2, keepdims=True)
+    melodies = [melodies_lib.Melody([60]) for _ in range(3)]
+    random_states = [np.random.RandomState(seed) for seed in range(3)]
+    for _ in range(20):
+      self.melody_encoder_decoder.extend_event_sequences(
+          melodies, softmax, random_state=random_states)
+
+    # Each sequence's samples depend only on its own random state, so sampling
+    # a sequence alone with the same seed gives the same events.
+    for i in range(3):
+      melody = melodies_lib.Melody([60])
+      random_state = np.random.RandomState(i)
+      for _ in range(20):
+        self.melody_encoder_decoder.extend_event_sequences(
+            [melody], softmax[i:i + 1], random_state=[random_state])
+      self.assertListEqual(list(melody), list(melodies[i]))
+    # The random states advance between steps rather than repeating a sample.
+    self.assertGreater(len(set(list(melodies[1])[1:])), 1)
+
+    with self.assertRaises(ValueError):
+      self.melody_encoder_decoder.extend_event_sequences(
+          melodies, softmax, random_state=[np.random.RandomState(0)])
+
+  def testExtendMelodiesTopK(self):
+    softmax = [[[0.0, 0.1, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
+                 0.5, 0.4]]]
+    random_state = np.random.RandomState(0)
+    melody = melodies_lib.Melody([60])
+    for _ in range(100):
+      self.melody_encoder_decoder.extend_event_sequences(
+          [melody], softmax, random_state=random_state, top_k=1)
+    self.assertEqual([60] + [70] * 100, list(melody))
+
+    melody = melodies_lib.Melody([60])
+    for _ in range(100):
+      self.melody_encoder_decoder.extend_event_sequences(
+          [melody], softmax, random_state=random_state, top_k=2)
+    self.assertEqual(set([70, 71]), set(list(melody)[1:]))
+
 
 if __name__ == '__main__':
   tf.test.main()
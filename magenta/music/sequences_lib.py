@@ -14,8 +14,10 @@
 """Defines sequence of notes objects for creating datasets.
 """
 
+import bisect
 import collections
-import copy
+import math
+
 from magenta.protobuf import music_pb2
 
 # Set the quantization cutoff.
@@ -59,7 +61,8 @@ class QuantizedSequence(object):
   Attributes:
     tracks: A dictionary mapping track number to list of Note tuples. Track
         number is taken from the instrument number of each NoteSequence note.
-    chords: A list of ChordSymbol tuples.
+    chords: A list of ChordSymbol tuples. `from_note_sequence` leaves them
+        sorted by step.
     qpm: Quarters per minute. This is needed to recover tempo if converting back
         to MIDI.
     time_signature: This determines the length of a bar of music. This is just
@@ -85,6 +88,7 @@ class QuantizedSequence(object):
   def _reset(self):
     self.tracks = {}
     self.chords = []
+    self._chord_index = None
     self.qpm = 120.0
     self.time_signature = QuantizedSequence.TimeSignature(numerator=4,
                                                           denominator=4)
@@ -101,6 +105,25 @@ class QuantizedSequence(object):
     steps_per_bar_float = (self.steps_per_quarter * quarters_per_bar)
     return steps_per_bar_float
 
+  def chord_index(self):
+    """Returns the chords sorted by step, along with their steps.
+
+    Chords at the same step keep their order in `chords`. The index is cached
+    until `chords` is replaced or appended to, so looking up the chords in a
+    range of steps with `bisect` on the returned steps is O(log chords).
+
+    Returns:
+      A tuple (sorted_chords, steps), where `sorted_chords` is a list of
+      ChordSymbol tuples sorted by step and `steps` is the list of their steps.
+    """
+    chords = self.chords
+    if (self._chord_index is None or self._chord_index[0] is not chords or
+        self._chord_index[1] != len(chords)):
+      sorted_chords = sorted(chords, key=lambda chord: chord.step)
+      steps = [chord.step for chord in sorted_chords]
+      self._chord_index = (chords, len(chords), sorted_chords, steps)
+    return self._chord_index[2], self._chord_index[3]
+
   def from_note_sequence(self, note_sequence, steps_per_quarter):
     """Populate self with a music_pb2.NoteSequence proto.
 
@@ -186,6 +209,7 @@ class QuantizedSequence(object):
               'Got negative chord time: step = %s' % step)
         self.chords.append(
             QuantizedSequence.ChordSymbol(step=step, figure=annotation.text))
+    self.chords.sort(key=lambda chord: chord.step)
 
   def __eq__(self, other):
     if not isinstance(other, QuantizedSequence):
@@ -201,10 +225,128 @@ class QuantizedSequence(object):
         set(self.chords) == set(other.chords))
 
   def __deepcopy__(self, unused_memo=None):
+    # Notes and chord symbols are immutable namedtuples, so only the containers
+    # holding them need to be copied.
     new_copy = type(self)()
-    new_copy.tracks = copy.deepcopy(self.tracks)
-    new_copy.chords = copy.deepcopy(self.chords)
+    new_copy.tracks = dict((instrument, list(notes))
+                           for instrument, notes in self.tracks.items())
+    new_copy.chords = list(self.chords)
     new_copy.qpm = self.qpm
     new_copy.time_signature = self.time_signature
     new_copy.steps_per_quarter = self.steps_per_quarter
     return new_copy
+
+
+def split_note_sequence_on_silence(note_sequence, gap_bars=1.0):
+  """Splits a NoteSequence into chunks at long silences across all tracks.
+
+  A split is made wherever no note in any instrument sounds for at least
+  `gap_bars` bars, so melody extraction with the same or a smaller `gap_bars`
+  would end a melody there anyway. Bar lengths are computed from the first
+  tempo and time signature, as in `QuantizedSequence.from_note_sequence`.
+
+  Each chunk is shifted earlier in time by a whole number of bars, so notes
+  keep their position within the bar. Chunks copy the tempos, time signatures,
+  key signatures, and other metadata of `note_sequence`. Notes, pitch bends,
+  control changes, and text annotations are assigned to the chunk in which
+  they occur, and the most recent chord symbol before a chunk is repeated at
+  the chunk's start (unless the chunk has its own chord there) so chord
+  extraction is unaffected by the split.
+
+  Since notes are quantized after splitting, rounding can shorten a silence by
+  up to a step; use a `gap_bars` slightly larger than the melody extractor's
+  if melody boundaries must be identical.
+
+  Args:
+    note_sequence: The NoteSequence proto to split.
+    gap_bars: The minimum length of an all-track silence, in bars, at which to
+        split.
+
+  Returns:
+    A list of NoteSequence protos in time order. If no silence is long enough
+    to split at, the list contains only `note_sequence` itself.
+  """
+  qpm = note_sequence.tempos[0].qpm if note_sequence.tempos else 120.0
+  if note_sequence.time_signatures:
+    time_signature = note_sequence.time_signatures[0]
+    quarters_per_bar = (4.0 / time_signature.denominator *
+                        time_signature.numerator)
+  else:
+    quarters_per_bar = 4.0
+  seconds_per_bar = quarters_per_bar * 60.0 / qpm
+  gap_seconds = gap_bars * seconds_per_bar
+
+  # Find the start times of notes that follow a long enough silence.
+  notes = sorted(note_sequence.notes, key=lambda note: note.start_time)
+  split_times = []
+  max_end_time = None
+  for note in notes:
+    if (max_end_time is not None and
+        note.start_time - max_end_time >= gap_seconds):
+      split_times.append(note.start_time)
+    if max_end_time is None or note.end_time > max_end_time:
+      max_end_time = note.end_time
+  if not split_times:
+    return [note_sequence]
+
+  template = music_pb2.NoteSequence()
+  template.CopyFrom(note_sequence)
+  del template.notes[:]
+  del template.pitch_bends[:]
+  del template.control_changes[:]
+  del template.text_annotations[:]
+  template.total_time = 0.0
+
+  chunks = []
+  offsets = [0.0]
+  for _ in range(len(split_times) + 1):
+    chunk = music_pb2.NoteSequence()
+    chunk.CopyFrom(template)
+    chunks.append(chunk)
+  for split_time in split_times:
+    offsets.append(
+        math.floor(split_time / seconds_per_bar) * seconds_per_bar)
+
+  def chunk_index(time):
+    return bisect.bisect_right(split_times, time)
+
+  for note in notes:
+    i = chunk_index(note.start_time)
+    chunk_note = chunks[i].notes.add()
+    chunk_note.CopyFrom(note)
+    chunk_note.start_time -= offsets[i]
+    chunk_note.end_time -= offsets[i]
+    chunks[i].total_time = max(chunks[i].total_time, chunk_note.end_time)
+
+  for field in ['pitch_bends', 'control_changes']:
+    for event in getattr(note_sequence, field):
+      i = chunk_index(event.time)
+      chunk_event = getattr(chunks[i], field).add()
+      chunk_event.CopyFrom(event)
+      chunk_event.time = max(event.time - offsets[i], 0.0)
+
+  last_chords = [None] * len(chunks)
+  for annotation in sorted(note_sequence.text_annotations,
+                           key=lambda annotation: annotation.time):
+    i = chunk_index(annotation.time)
+    chunk_annotation = chunks[i].text_annotations.add()
+    chunk_annotation.CopyFrom(annotation)
+    chunk_annotation.time = max(annotation.time - offsets[i], 0.0)
+    if annotation.annotation_type == CHORD_SYMBOL:
+      last_chords[i] = annotation
+
+  # Start each chunk with the chord active at the end of the previous chunks,
+  # unless the chunk has its own chord at its start.
+  last_chord = None
+  for i, chunk in enumerate(chunks):
+    has_initial_chord = any(
+        annotation.annotation_type == CHORD_SYMBOL and annotation.time <= 0.0
+        for annotation in chunk.text_annotations)
+    if last_chord is not None and not has_initial_chord:
+      chord = chunk.text_annotations.add()
+      chord.CopyFrom(last_chord)
+      chord.time = 0.0
+    if last_chords[i] is not None:
+      last_chord = last_chords[i]
+
+  return chunks
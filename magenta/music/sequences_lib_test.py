@@ -197,6 +197,21 @@ class SequencesLibTest(tf.test.TestCase):
     quantized.from_note_sequence(self.note_sequence, self.steps_per_quarter)
     self.assertEqual(12.0, quantized.steps_per_bar())
 
+  def testChordIndex(self):
+    quantized = sequences_lib.QuantizedSequence()
+    testing_lib.add_quantized_chords_to_sequence(
+        quantized, [('C', 8), ('Am', 0), ('G7', 8), ('F', 4)])
+    sorted_chords, steps = quantized.chord_index()
+    self.assertEqual(['Am', 'F', 'C', 'G7'],
+                     [chord.figure for chord in sorted_chords])
+    self.assertEqual([0, 4, 8, 8], steps)
+    self.assertIs(sorted_chords, quantized.chord_index()[0])
+
+    # Appending a chord invalidates the index.
+    testing_lib.add_quantized_chords_to_sequence(quantized, [('Dm', 2)])
+    sorted_chords, steps = quantized.chord_index()
+    self.assertEqual([0, 2, 4, 8, 8], steps)
+
   def testDeepcopy(self):
     quantized = sequences_lib.QuantizedSequence()
     testing_lib.add_track_to_sequence(
@@ -214,6 +229,69 @@ class SequencesLibTest(tf.test.TestCase):
 
     self.assertNotEqual(quantized, quantized_copy)
 
+  def testSplitNoteSequenceOnSilence(self):
+    # At 60 qpm in 4/4, a bar is 4 seconds long.
+    testing_lib.add_track_to_sequence(
+        self.note_sequence, 0,
+        [(60, 100, 0.0, 2.0), (62, 100, 1.0, 3.0), (65, 100, 9.5, 10.0),
+         (67, 100, 11.0, 12.0), (69, 100, 20.0, 21.0)])
+    testing_lib.add_track_to_sequence(
+        self.note_sequence, 1,
+        [(64, 100, 2.5, 5.0), (48, 100, 14.0, 14.5)])
+    testing_lib.add_chords_to_sequence(
+        self.note_sequence, [('C', 0.0), ('G', 6.0), ('F', 12.0)])
+
+    expected_chunks = []
+    for notes, chords, total_time in [
+        ([(60, 100, 0.0, 2.0, 0), (62, 100, 1.0, 3.0, 0),
+          (64, 100, 2.5, 5.0, 1)], [('C', 0.0), ('G', 6.0)], 5.0),
+        ([(65, 100, 1.5, 2.0, 0), (67, 100, 3.0, 4.0, 0),
+          (48, 100, 6.0, 6.5, 1)], [('F', 4.0), ('G', 0.0)], 6.5),
+        ([(69, 100, 0.0, 1.0, 0)], [('F', 0.0)], 1.0)]:
+      chunk = music_pb2.NoteSequence()
+      chunk.time_signatures.add(numerator=4, denominator=4)
+      chunk.tempos.add(qpm=60)
+      for pitch, velocity, start_time, end_time, instrument in notes:
+        testing_lib.add_track_to_sequence(
+            chunk, instrument, [(pitch, velocity, start_time, end_time)])
+      testing_lib.add_chords_to_sequence(chunk, chords)
+      chunk.total_time = total_time
+      expected_chunks.append(chunk)
+
+    chunks = sequences_lib.split_note_sequence_on_silence(
+        self.note_sequence, gap_bars=1.0)
+    self.assertEqual(expected_chunks, chunks)
+
+    # A longer gap only splits at the second silence.
+    chunks = sequences_lib.split_note_sequence_on_silence(
+        self.note_sequence, gap_bars=1.25)
+    self.assertEqual(2, len(chunks))
+    self.assertEqual(6, len(chunks[0].notes))
+
+  def testSplitNoteSequenceOnSilenceChordChangeAtSplit(self):
+    # The chord changes exactly where the second chunk starts, so the first
+    # chunk's chord is not repeated there.
+    testing_lib.add_track_to_sequence(
+        self.note_sequence, 0,
+        [(60, 100, 0.0, 1.0), (62, 100, 8.0, 9.0)])
+    testing_lib.add_chords_to_sequence(
+        self.note_sequence, [('C', 0.0), ('G', 8.0)])
+    chunks = sequences_lib.split_note_sequence_on_silence(
+        self.note_sequence, gap_bars=1.0)
+    self.assertEqual(2, len(chunks))
+    self.assertEqual(
+        [('G', 0.0)],
+        [(annotation.text, annotation.time)
+         for annotation in chunks[1].text_annotations])
+
+  def testSplitNoteSequenceOnSilenceNoSplit(self):
+    testing_lib.add_track_to_sequence(
+        self.note_sequence, 0,
+        [(60, 100, 0.0, 2.0), (62, 100, 5.0, 6.0)])
+    chunks = sequences_lib.split_note_sequence_on_silence(
+        self.note_sequence, gap_bars=1.0)
+    self.assertEqual([self.note_sequence], chunks)
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -14,6 +14,8 @@
 """Testing support code."""
 
 # internal imports
+import numpy as np
+
 from magenta.music import sequences_lib
 from magenta.protobuf import music_pb2
 
@@ -58,3 +60,57 @@ def add_quantized_chords_to_sequence(quantized_sequence, chords):
     chord = sequences_lib.QuantizedSequence.ChordSymbol(step=step,
                                                         figure=figure)
     quantized_sequence.chords.append(chord)
+
+
+def assert_encode_batch_matches_events_to_input(test_case, encoder_decoder,
+                                                events):
+  """Asserts that `encode_batch` agrees with the per-position encoding.
+
+  This function calls into tf.test.TestCase.assert* methods and behaves
+  like a test assert.
+
+  Args:
+    test_case: A tf.test.TestCase instance from a test.
+    encoder_decoder: An EventsEncoderDecoder instance.
+    events: An event sequence that `encoder_decoder` can encode.
+  """
+  inputs, labels = encoder_decoder.encode_batch(events)
+  test_case.assertEqual((len(events), encoder_decoder.input_size),
+                        inputs.shape)
+  test_case.assertEqual(np.float32, inputs.dtype)
+  test_case.assertEqual((len(events),), labels.shape)
+  test_case.assertEqual(np.int64, labels.dtype)
+  for i in range(len(events)):
+    test_case.assertListEqual(encoder_decoder.events_to_input(events, i),
+                              inputs[i].tolist())
+    test_case.assertEqual(encoder_decoder.events_to_label(events, i),
+                          labels[i])
+
+
+def assert_encode_transpositions_matches_encode_batch(
+    test_case, encoder_decoder, melody, transpositions):
+  """Asserts that `encode_transpositions_batch` agrees with `encode_batch`.
+
+  This function calls into tf.test.TestCase.assert* methods and behaves
+  like a test assert.
+
+  Args:
+    test_case: A tf.test.TestCase instance from a test.
+    encoder_decoder: A MelodyEncoderDecoder instance.
+    melody: A Melody that `encoder_decoder` can encode in every transposition.
+    transpositions: A list of integer transposition amounts in half steps.
+  """
+  inputs, labels = encoder_decoder.encode_transpositions_batch(
+      melody, transpositions)
+  test_case.assertEqual(
+      (len(transpositions), len(melody), encoder_decoder.input_size),
+      inputs.shape)
+  test_case.assertEqual((len(transpositions), len(melody)), labels.shape)
+  for i, transposition in enumerate(transpositions):
+    transposed = type(melody)(
+        [event + transposition if event >= 0 else event for event in melody],
+        start_step=melody.start_step, steps_per_bar=melody.steps_per_bar,
+        steps_per_quarter=melody.steps_per_quarter)
+    expected_inputs, expected_labels = encoder_decoder.encode_batch(transposed)
+    test_case.assertListEqual(expected_inputs.tolist(), inputs[i].tolist())
+    test_case.assertListEqual(expected_labels.tolist(), labels[i].tolist())
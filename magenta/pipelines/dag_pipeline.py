@@ -186,6 +186,28 @@ class InvalidTransformOutputException(Exception):
   pass
 
 
+class _BatchItemResults(object):
+  """The outputs each unit of a DAG computed for one input of a batch.
+
+  Maps each unit to its list or dictionary of outputs for the input, like the
+  unit outputs database of a single input.
+  """
+
+  def __init__(self, results, index):
+    """Constructs a _BatchItemResults.
+
+    Args:
+      results: A dictionary mapping each unit to a list of its outputs for each
+          input of the batch.
+      index: The index of the input in the batch.
+    """
+    self._results = results
+    self._index = index
+
+  def __getitem__(self, unit):
+    return self._results[unit][self._index]
+
+
 class DAGPipeline(pipeline.Pipeline):
   """A directed acyclic graph pipeline.
 
@@ -477,34 +499,59 @@ class DAGPipeline(pipeline.Pipeline):
       depend on implementation. Each output name corresponds to an output
       collection. See get_output_names method.
     """
-    def stats_accumulator(unit, unit_inputs, cumulative_stats):
-      for single_input in unit_inputs:
-        results_ = unit.transform(single_input)
-        stats = unit.get_stats()
-        cumulative_stats.extend(stats)
-        yield results_
+    return self.transform_batch([input_object])[0]
+
+  def transform_batch(self, input_objects):
+    """Runs the DAG on each of a list of inputs.
 
+    Each pipeline in the DAG runs once, on a batch of all of its inputs for
+    all of `input_objects`, using its `transform_batch` method. The outputs are
+    the same as those of calling `transform` on each input.
+
+    Args:
+      input_objects: A list of objects. The required type depends on
+          implementation.
+
+    Returns:
+      A list containing, for each input in order, a dictionary mapping output
+      names to lists of objects, as returned by `transform`.
+    """
     stats = []
-    results = {self.input: [input_object]}
+    # Maps each unit to a list of its outputs for each input object.
+    results = {self.input: [[input_object] for input_object in input_objects]}
+    # Views of `results` for each input object.
+    input_results = [_BatchItemResults(results, i)
+                     for i in range(len(input_objects))]
     for unit in self.call_list[1:]:
       # Compute transformation.
 
       if isinstance(unit, Output):
-        unit_outputs = self._get_outputs_as_signature(self.dag[unit], results)
-      else:
-        unit_inputs = self._get_inputs_for_unit(unit, results)
-        if not unit_inputs:
-          # If this unit has no inputs don't run it.
-          results[unit] = []
-          continue
+        results[unit] = [
+            self._get_outputs_as_signature(self.dag[unit], item_results)
+            for item_results in input_results]
+        continue
+
+      unit_inputs = []
+      input_ends = []
+      for item_results in input_results:
+        unit_inputs += self._get_inputs_for_unit(unit, item_results)
+        input_ends.append(len(unit_inputs))
+      if not unit_inputs:
+        # If this unit has no inputs don't run it.
+        results[unit] = [[] for _ in input_objects]
+        continue
 
-        unjoined_outputs = list(
-            stats_accumulator(unit, unit_inputs, stats))
-        unit_outputs = self._join_lists_or_dicts(unjoined_outputs, unit)
-      results[unit] = unit_outputs
+      unjoined_outputs = unit.transform_batch(unit_inputs)
+      stats.extend(unit.get_stats())
+      input_starts = [0] + input_ends[:-1]
+      results[unit] = [
+          self._join_lists_or_dicts(unjoined_outputs[start:end], unit)
+          for start, end in zip(input_starts, input_ends)]
 
     self._set_stats(stats)
-    return dict([(output.name, results[output]) for output in self.outputs])
+    return [dict([(output.name, results[output][i])
+                  for output in self.outputs])
+            for i in range(len(input_objects))]
 
   def _get_outputs_as_signature(self, dependency, outputs):
     """Returns a list or dict which matches the type signature of dependency.
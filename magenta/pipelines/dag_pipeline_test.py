@@ -395,6 +395,38 @@ class DAGPipelineTest(tf.test.TestCase):
     p = dag_pipeline.DAGPipeline(dag)
     self.assertEqual(p.transform(Type0(1, 2, 3)), {'output': [Type0(1, 2, 3)]})
 
+  def testTransformBatch(self):
+
+    class BatchUnitB(UnitB):
+
+      def __init__(self):
+        UnitB.__init__(self)
+        self.batch_sizes = []
+
+      def transform_batch(self, input_objects):
+        self.batch_sizes.append(len(input_objects))
+        self._set_stats([statistics.Counter('batch_items',
+                                            len(input_objects))])
+        return [self.transform(input_object) for input_object in input_objects]
+
+    a, b, c, d = UnitA(), BatchUnitB(), UnitC(), UnitD()
+    dag = {a: dag_pipeline.Input(Type0),
+           b: a['t1'],
+           c: {'A_data': a['t2'], 'B_data': b},
+           d: {'0': c['regular_data'], '1': b, '2': c['special_data']},
+           dag_pipeline.Output('abcdz'): d}
+    p = dag_pipeline.DAGPipeline(dag)
+    inputs = [Type0(1, 2, 3), Type0(4, 5, 6), Type0(7, 8, 9)]
+
+    outputs = p.transform_batch(inputs)
+    # Each unit ran once on the inputs for the whole batch.
+    self.assertEqual([3], b.batch_sizes)
+    self.assertEqual(['DAGPipeline_BatchUnitB_batch_items'],
+                     [stat.name for stat in p.get_stats()])
+    self.assertEqual([p.transform(input_object) for input_object in inputs],
+                     outputs)
+    self.assertEqual([], p.transform_batch([]))
+
   def testStatistics(self):
 
     class UnitQ(pipeline.Pipeline):
@@ -15,9 +15,12 @@
 
 import abc
 import inspect
+import multiprocessing
 import os.path
+import random
 
 # internal imports
+import numpy as np
 import tensorflow as tf
 
 from magenta.pipelines import statistics
@@ -69,7 +72,7 @@ class Key(object):
 
 def _guarantee_dict(given, default_name):
   if not isinstance(given, dict):
-    return {default_name: dict}
+    return {default_name: given}
   return given
 
 
@@ -113,9 +116,13 @@ class Pipeline(object):
   a list of transformed outputs, or a dictionary mapping names to lists of
   transformed outputs for each name.
 
+  The `transform_batch` method runs the pipeline on a list of inputs at once.
+  By default it calls `transform` on each input, but pipelines that can
+  process many inputs more efficiently together may override it.
+
   The `get_stats` method returns any statistics that were collected during the
-  last call to `transform`. These statistics can give feedback about why any
-  data was discarded and what the input data is like.
+  last call to `transform` or `transform_batch`. These statistics can give
+  feedback about why any data was discarded and what the input data is like.
 
   `Pipeline` implementers should call `_set_stats` from within `transform` to
   set the statistics that will be returned by the next call to `get_stats`.
@@ -217,6 +224,30 @@ class Pipeline(object):
     """
     pass
 
+  def transform_batch(self, input_objects):
+    """Runs the pipeline on each of a list of inputs.
+
+    After `transform_batch`, `get_stats` returns the statistics of the whole
+    batch. Subclasses may override this method to process the inputs together,
+    but must return the same outputs as calling `transform` on each input.
+
+    Args:
+      input_objects: A list of inputs, each of which is an object or
+          dictionary mapping names to objects that match `input_type`.
+
+    Returns:
+      A list containing, for each input in order, the value `transform`
+      returns for that input.
+    """
+    outputs = []
+    stats = []
+    for input_object in input_objects:
+      outputs.append(self.transform(input_object))
+      stats.extend(self._stats)
+    # The statistics were already named by `_set_stats`.
+    self._stats = stats
+    return outputs
+
   def _set_stats(self, stats):
     """Overwrites the current statistics returned by `get_stats`.
 
@@ -307,31 +338,20 @@ def tf_record_iterator(tfrecord_file, proto):
     yield proto.FromString(raw_bytes)
 
 
-def run_pipeline_serial(pipeline,
-                        input_iterator,
-                        output_dir,
-                        output_file_base=None):
-  """Runs the a pipeline on a data source and writes to a directory.
-
-  Run the the pipeline on each input from the iterator one at a time.
-  A file will be written to `output_dir` for each dataset name specified
-  by the pipeline. pipeline.transform is called on each input and the
-  results are aggregated into their correct datasets.
-
-  The output type or types given by `pipeline.output_type` must be protocol
-  buffers or objects that have a SerializeToString method.
+def _open_writers(pipeline, output_dir, output_file_base=None):
+  """Opens a TFRecord writer for each of a pipeline's datasets.
 
   Args:
     pipeline: A Pipeline instance. `pipeline.output_type` must be a protocol
         buffer or a dictionary mapping names to protocol buffers.
-    input_iterator: Iterates over the input data. Items returned by it are fed
-        directly into the pipeline's `transform` method.
-    output_dir: Path to directory where datasets will be written. Each dataset
-        is a file whose name contains the pipeline's dataset name. If the
+    output_dir: Path to directory where datasets will be written. If the
         directory does not exist, it will be created.
     output_file_base: An optional string prefix for all datasets output by this
         run. The prefix will also be followed by an underscore.
 
+  Returns:
+    A dictionary mapping dataset names to tf.python_io.TFRecordWriter objects.
+
   Raises:
     ValueError: If any of `pipeline`'s output types do not have a
         SerializeToString method.
@@ -361,28 +381,202 @@ def run_pipeline_serial(pipeline,
                                  '%s_%s.tfrecord' % (output_file_base, name))
                     for name in output_names]
 
-  writers = dict([(name, tf.python_io.TFRecordWriter(path))
-                  for name, path in zip(output_names, output_paths)])
+  return dict([(name, tf.python_io.TFRecordWriter(path))
+               for name, path in zip(output_names, output_paths)])
+
+
+def run_pipeline_serial(pipeline,
+                        input_iterator,
+                        output_dir,
+                        output_file_base=None):
+  """Runs the a pipeline on a data source and writes to a directory.
+
+  Run the the pipeline on each input from the iterator one at a time.
+  A file will be written to `output_dir` for each dataset name specified
+  by the pipeline. pipeline.transform is called on each input and the
+  results are aggregated into their correct datasets.
+
+  The output type or types given by `pipeline.output_type` must be protocol
+  buffers or objects that have a SerializeToString method.
+
+  Args:
+    pipeline: A Pipeline instance. `pipeline.output_type` must be a protocol
+        buffer or a dictionary mapping names to protocol buffers.
+    input_iterator: Iterates over the input data. Items returned by it are fed
+        directly into the pipeline's `transform` method.
+    output_dir: Path to directory where datasets will be written. Each dataset
+        is a file whose name contains the pipeline's dataset name. If the
+        directory does not exist, it will be created.
+    output_file_base: An optional string prefix for all datasets output by this
+        run. The prefix will also be followed by an underscore.
+
+  Raises:
+    ValueError: If any of `pipeline`'s output types do not have a
+        SerializeToString method.
+  """
+  writers = _open_writers(pipeline, output_dir, output_file_base)
+  output_names = pipeline.output_type_as_dict.keys()
 
   total_inputs = 0
   total_outputs = 0
-  stats = []
-  for input_ in input_iterator:
-    total_inputs += 1
-    for name, outputs in _guarantee_dict(pipeline.transform(input_),
-                                         output_names[0]).items():
-      for output in outputs:
-        writers[name].write(output.SerializeToString())
-        total_outputs += 1
-    stats = statistics.merge_statistics(stats + pipeline.get_stats())
-    if total_inputs % 500 == 0:
-      tf.logging.info('Processed %d inputs so far. Produced %d outputs.',
-                      total_inputs, total_outputs)
-      statistics.log_statistics_list(stats, tf.logging.info)
+  stats = statistics.StatisticsRegistry()
+  try:
+    for input_ in input_iterator:
+      total_inputs += 1
+      for name, outputs in _guarantee_dict(pipeline.transform(input_),
+                                           output_names[0]).items():
+        for output in outputs:
+          writers[name].write(output.SerializeToString())
+          total_outputs += 1
+      stats.merge(pipeline.get_stats())
+      if total_inputs % 500 == 0:
+        tf.logging.info('Processed %d inputs so far. Produced %d outputs.',
+                        total_inputs, total_outputs)
+        statistics.log_statistics_list(stats.values(), tf.logging.info)
+  finally:
+    for writer in writers.values():
+      writer.close()
+  tf.logging.info('\n\nCompleted.\n')
+  tf.logging.info('Processed %d inputs total. Produced %d outputs.',
+                  total_inputs, total_outputs)
+  statistics.log_statistics_list(stats.values(), tf.logging.info)
+
+
+# The pipeline run by each worker process of `run_pipeline_parallel`, and
+# whether the worker's inputs are serialized protocol buffers.
+_worker_pipeline = None
+_worker_deserializes_inputs = False
+
+# The number of inputs sent to a worker process at a time, which the worker
+# processes with a single call to `transform_batch`.
+_PARALLEL_BATCH_SIZE = 16
+
+
+def _init_worker(pipeline, deserialize_inputs):
+  """Initializes a `run_pipeline_parallel` worker process."""
+  global _worker_pipeline, _worker_deserializes_inputs
+  _worker_pipeline = pipeline
+  _worker_deserializes_inputs = deserialize_inputs
+  # Forked workers inherit the parent's random state, so without reseeding
+  # they would all make the same random choices.
+  seed = random.SystemRandom().randint(0, 2 ** 32 - 1)
+  random.seed(seed)
+  np.random.seed(seed)
+
+
+def _transform_in_worker(inputs):
+  """Runs the worker's pipeline on a batch of inputs with `transform_batch`.
+
+  Args:
+    inputs: A list of inputs to the pipeline, serialized if the pipeline's
+        input type is a protocol buffer.
+
+  Returns:
+    A (num_inputs, outputs, stats) tuple, where `outputs` is a list of
+    (dataset name, serialized output) tuples and `stats` is a list of
+    `Statistic` objects.
+  """
+  if _worker_deserializes_inputs:
+    inputs = [_worker_pipeline.input_type.FromString(input_)
+              for input_ in inputs]
+  output_names = _worker_pipeline.output_type_as_dict.keys()
+  outputs = [(name, output.SerializeToString())
+             for input_outputs in _worker_pipeline.transform_batch(inputs)
+             for name, outputs in _guarantee_dict(
+                 input_outputs, output_names[0]).items()
+             for output in outputs]
+  return len(inputs), outputs, _worker_pipeline.get_stats()
+
+
+def _batches(iterator, batch_size):
+  """Yields lists of up to `batch_size` consecutive items from `iterator`."""
+  batch = []
+  for item in iterator:
+    batch.append(item)
+    if len(batch) == batch_size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+
+def run_pipeline_parallel(pipeline,
+                          input_iterator,
+                          output_dir,
+                          num_workers=None,
+                          output_file_base=None):
+  """Runs a pipeline on a data source in parallel and writes to a directory.
+
+  Like `run_pipeline_serial`, but the pipeline is run in `num_workers` worker
+  processes, each running `pipeline.transform_batch` on small batches of
+  inputs. Inputs are sent to the workers serialized if the pipeline's input
+  type is a protocol buffer, the workers return their outputs serialized along
+  with their statistics, and this process writes the outputs and merges the
+  statistics. The datasets written are the same as those written by
+  `run_pipeline_serial`, except for the order of records.
+
+  The workers are forked from this process, so `pipeline` does not need to be
+  picklable, but it must not share resources such as open database
+  connections between processes. Each worker reseeds the `random` and
+  `numpy.random` generators, so pipelines that make random choices do not
+  make the same choices in every worker.
+
+  Args:
+    pipeline: A Pipeline instance. `pipeline.output_type` must be a protocol
+        buffer or a dictionary mapping names to protocol buffers.
+    input_iterator: Iterates over the input data. Items returned by it are fed
+        into the pipeline's `transform` method, and must be picklable unless
+        they are protocol buffers.
+    output_dir: Path to directory where datasets will be written. Each dataset
+        is a file whose name contains the pipeline's dataset name. If the
+        directory does not exist, it will be created.
+    num_workers: The number of worker processes. Defaults to the number of
+        CPUs.
+    output_file_base: An optional string prefix for all datasets output by this
+        run. The prefix will also be followed by an underscore.
+
+  Raises:
+    ValueError: If any of `pipeline`'s output types do not have a
+        SerializeToString method, or if `num_workers` is not positive.
+  """
+  if num_workers is None:
+    num_workers = multiprocessing.cpu_count()
+  if num_workers < 1:
+    raise ValueError('num_workers must be positive: %d' % num_workers)
+
+  writers = _open_writers(pipeline, output_dir, output_file_base)
+
+  serialize_inputs = hasattr(pipeline.input_type, 'FromString')
+  if serialize_inputs:
+    input_iterator = (input_.SerializeToString() for input_ in input_iterator)
+
+  total_inputs = 0
+  total_outputs = 0
+  stats = statistics.StatisticsRegistry()
+  pool = multiprocessing.Pool(num_workers, initializer=_init_worker,
+                              initargs=(pipeline, serialize_inputs))
+  try:
+    for num_inputs, outputs, batch_stats in pool.imap_unordered(
+        _transform_in_worker, _batches(input_iterator, _PARALLEL_BATCH_SIZE)):
+      for name, serialized in outputs:
+        writers[name].write(serialized)
+      previous_total_inputs = total_inputs
+      total_inputs += num_inputs
+      total_outputs += len(outputs)
+      stats.merge(batch_stats)
+      if total_inputs // 500 > previous_total_inputs // 500:
+        tf.logging.info('Processed %d inputs so far. Produced %d outputs.',
+                        total_inputs, total_outputs)
+        statistics.log_statistics_list(stats.values(), tf.logging.info)
+  finally:
+    pool.terminate()
+    pool.join()
+    for writer in writers.values():
+      writer.close()
   tf.logging.info('\n\nCompleted.\n')
   tf.logging.info('Processed %d inputs total. Produced %d outputs.',
                   total_inputs, total_outputs)
-  statistics.log_statistics_list(stats, tf.logging.info)
+  statistics.log_statistics_list(stats.values(), tf.logging.info)
 
 
 def load_pipeline(pipeline, input_iterator):
@@ -405,7 +599,7 @@ def load_pipeline(pipeline, input_iterator):
       [(name, []) for name in pipeline.output_type_as_dict])
   total_inputs = 0
   total_outputs = 0
-  stats = []
+  stats = statistics.StatisticsRegistry()
   for input_object in input_iterator:
     total_inputs += 1
     outputs = _guarantee_dict(pipeline.transform(input_object),
@@ -413,13 +607,13 @@ def load_pipeline(pipeline, input_iterator):
     for name, output_list in outputs.items():
       aggregated_outputs[name].extend(output_list)
       total_outputs += len(output_list)
-    stats = statistics.merge_statistics(stats + pipeline.get_stats())
+    stats.merge(pipeline.get_stats())
     if total_inputs % 500 == 0:
       tf.logging.info('Processed %d inputs so far. Produced %d outputs.',
                       total_inputs, total_outputs)
-      statistics.log_statistics_list(stats, tf.logging.info)
+      statistics.log_statistics_list(stats.values(), tf.logging.info)
   tf.logging.info('\n\nCompleted.\n')
   tf.logging.info('Processed %d inputs total. Produced %d outputs.',
                   total_inputs, total_outputs)
-  statistics.log_statistics_list(stats, tf.logging.info)
+  statistics.log_statistics_list(stats.values(), tf.logging.info)
   return aggregated_outputs
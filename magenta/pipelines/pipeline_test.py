@@ -22,6 +22,7 @@ import tensorflow as tf
 from magenta.common import testing_lib
 from magenta.pipelines import pipeline
 from magenta.pipelines import statistics
+from magenta.protobuf import music_pb2
 
 
 MockStringProto = testing_lib.MockStringProto  # pylint: disable=invalid-name
@@ -43,6 +44,18 @@ class MockPipeline(pipeline.Pipeline):
         'dataset_2': [MockStringProto(input_object + '_C')]}
 
 
+class MockNoteSequencePipeline(pipeline.Pipeline):
+
+  def __init__(self):
+    super(MockNoteSequencePipeline, self).__init__(
+        input_type=music_pb2.NoteSequence,
+        output_type=MockStringProto)
+
+  def transform(self, input_object):
+    return [MockStringProto('%s_%d' % (input_object.id, note.pitch))
+            for note in input_object.notes]
+
+
 class PipelineTest(tf.test.TestCase):
 
   def testFileIteratorRecursive(self):
@@ -125,6 +138,66 @@ class PipelineTest(tf.test.TestCase):
         set(['serialized:%s_C' % s for s in strings]),
         set(dataset_2_reader))
 
+  def testRunPipelineSerialClosesWritersOnError(self):
+    def inputs():
+      yield 'abcdefg'
+      raise ValueError('bad input')
+
+    root_dir = tempfile.mkdtemp(dir=self.get_temp_dir())
+    with self.assertRaises(ValueError):
+      pipeline.run_pipeline_serial(MockPipeline(), inputs(), root_dir)
+
+    # The outputs produced before the error were flushed to disk.
+    self.assertEqual(
+        ['serialized:abcdefg_C'],
+        list(tf.python_io.tf_record_iterator(
+            os.path.join(root_dir, 'dataset_2.tfrecord'))))
+
+  def testRunPipelineParallel(self):
+    strings = ['string_%d' % i for i in range(100)]
+    serial_dir = tempfile.mkdtemp(dir=self.get_temp_dir())
+    parallel_dir = tempfile.mkdtemp(dir=self.get_temp_dir())
+    pipeline.run_pipeline_serial(MockPipeline(), iter(strings), serial_dir)
+    pipeline.run_pipeline_parallel(
+        MockPipeline(), iter(strings), parallel_dir, num_workers=3)
+
+    for name in ['dataset_1', 'dataset_2']:
+      serial_records = list(tf.python_io.tf_record_iterator(
+          os.path.join(serial_dir, name + '.tfrecord')))
+      parallel_records = list(tf.python_io.tf_record_iterator(
+          os.path.join(parallel_dir, name + '.tfrecord')))
+      self.assertEqual(sorted(serial_records), sorted(parallel_records))
+
+    # Protocol buffer inputs are sent to the workers serialized.
+    note_sequences = []
+    for i in range(20):
+      note_sequence = music_pb2.NoteSequence(id='sequence_%d' % i)
+      for pitch in range(i % 4):
+        note_sequence.notes.add(pitch=60 + pitch)
+      note_sequences.append(note_sequence)
+    parallel_dir = tempfile.mkdtemp(dir=self.get_temp_dir())
+    pipeline.run_pipeline_parallel(
+        MockNoteSequencePipeline(), iter(note_sequences), parallel_dir,
+        num_workers=2)
+    parallel_records = list(tf.python_io.tf_record_iterator(
+        os.path.join(parallel_dir, 'dataset.tfrecord')))
+    self.assertEqual(
+        sorted('serialized:%s' % output.string
+               for note_sequence in note_sequences
+               for output in MockNoteSequencePipeline().transform(
+                   note_sequence)),
+        sorted(parallel_records))
+
+    with self.assertRaises(ValueError):
+      pipeline.run_pipeline_parallel(
+          MockPipeline(), iter(strings), parallel_dir, num_workers=0)
+
+  def testTransformBatch(self):
+    strings = ['abcdefg', 'helloworld!', 'qwerty']
+    mock_pipeline = MockPipeline()
+    self.assertEqual([mock_pipeline.transform(s) for s in strings],
+                     mock_pipeline.transform_batch(strings))
+
   def testPipelineIterator(self):
     strings = ['abcdefg', 'helloworld!', 'qwerty']
     result = pipeline.load_pipeline(MockPipeline(), iter(strings))
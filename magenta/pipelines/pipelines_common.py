@@ -23,6 +23,8 @@ import random
 import numpy as np
 import tensorflow as tf
 
+from magenta.common import sequence_example_lib
+from magenta.music import constants
 from magenta.music import melodies_lib
 from magenta.music import sequences_lib
 from magenta.pipelines import pipeline
@@ -52,6 +54,28 @@ class Quantizer(pipeline.Pipeline):
       return []
 
 
+class SilenceSplitter(pipeline.Pipeline):
+  """Splits NoteSequences at long all-track silences into independent chunks.
+
+  Place this before a Quantizer so that very long sequences, such as multi-hour
+  recordings or concatenated medleys, are quantized and extracted in smaller
+  pieces. `gap_bars` should be at least the `gap_bars` of the MelodyExtractor
+  downstream, so that the splits fall on melody boundaries.
+  """
+
+  def __init__(self, gap_bars=1.0):
+    super(SilenceSplitter, self).__init__(
+        input_type=music_pb2.NoteSequence,
+        output_type=music_pb2.NoteSequence)
+    self.gap_bars = gap_bars
+
+  def transform(self, note_sequence):
+    chunks = sequences_lib.split_note_sequence_on_silence(
+        note_sequence, self.gap_bars)
+    self._set_stats([statistics.Counter('note_sequence_chunks', len(chunks))])
+    return chunks
+
+
 class MelodyExtractor(pipeline.Pipeline):
   """Extracts monophonic melodies from a QuantizedSequence."""
 
@@ -81,6 +105,141 @@ class MelodyExtractor(pipeline.Pipeline):
     return melodies
 
 
+class MelodyTransposer(pipeline.Pipeline):
+  """Augments data by transposing each Melody into several keys.
+
+  All requested transpositions of a melody are computed at once as a single
+  array operation over its events. Transpositions that would move any note
+  outside of [`min_note`, `max_note`) are skipped rather than octave shifted,
+  so every output melody keeps the contour of the input.
+
+  If an encoder-decoder is given, the transpositions are output already
+  encoded, by a single call to its `encode_transpositions`, so encoders can
+  compute the parts of the encoding that don't depend on the key only once
+  per melody.
+  """
+
+  def __init__(self, transposition_range=range(-5, 7), min_note=None,
+               max_note=None, encoder_decoder=None, sparse_inputs=False):
+    """Constructs a MelodyTransposer.
+
+    Args:
+      transposition_range: An iterable of integer transposition amounts in half
+          steps. The default covers all 12 keys. Including 0 outputs a copy of
+          the input melody.
+      min_note: Minimum pitch (inclusive) that the transposed notes may take.
+          Defaults to the encoder-decoder's `min_note` if one is given, and to
+          0 otherwise.
+      max_note: Maximum pitch (exclusive) that the transposed notes may take.
+          Defaults to the encoder-decoder's `max_note` if one is given, and to
+          128 otherwise.
+      encoder_decoder: An optional magenta.music.MelodyEncoderDecoder. If
+          given, serialized SequenceExamples of the transpositions are output
+          instead of melodies. Input melodies are not squashed, since that
+          would undo the transpositions.
+      sparse_inputs: If True, only the nonzero elements of each input vector
+          are stored in the output SequenceExamples.
+    """
+    if encoder_decoder is None:
+      output_type = melodies_lib.Melody
+      default_min_note, default_max_note = 0, constants.MAX_MIDI_PITCH + 1
+    else:
+      output_type = sequence_example_lib.SerializedSequenceExample
+      default_min_note = encoder_decoder.min_note
+      default_max_note = encoder_decoder.max_note
+    super(MelodyTransposer, self).__init__(
+        input_type=melodies_lib.Melody,
+        output_type=output_type)
+    self.transpositions = np.array(sorted(set(transposition_range)),
+                                   dtype=np.int16)
+    self.min_note = default_min_note if min_note is None else min_note
+    self.max_note = default_max_note if max_note is None else max_note
+    self.encoder_decoder = encoder_decoder
+    self.sparse_inputs = sparse_inputs
+
+  def transform(self, melody):
+    events = np.asarray(melody, dtype=np.int16)
+    is_note = events >= constants.MIN_MIDI_PITCH
+    notes = events[is_note]
+    stats = []
+    if notes.size:
+      transpositions = self.transpositions[
+          (notes.min() + self.transpositions >= self.min_note) &
+          (notes.max() + self.transpositions < self.max_note)]
+      stats.append(statistics.Counter(
+          'transpositions_discarded_out_of_range',
+          len(self.transpositions) - len(transpositions)))
+    else:
+      # Without any notes, every transposition is the same melody.
+      transpositions = self.transpositions[:1]
+      stats.append(statistics.Counter('melodies_without_notes', 1))
+
+    stats.append(
+        statistics.Counter('transpositions_generated', len(transpositions)))
+    self._set_stats(stats)
+
+    if self.encoder_decoder is not None:
+      return self.encoder_decoder.encode_transpositions(
+          melody, transpositions, sparse_inputs=self.sparse_inputs,
+          serialized=True)
+
+    # One row of events per transposition.
+    transposed_events = np.tile(events, (len(transpositions), 1))
+    transposed_events[:, is_note] += transpositions[:, np.newaxis]
+    return [melodies_lib.Melody(transposed,
+                                start_step=melody.start_step,
+                                steps_per_bar=melody.steps_per_bar,
+                                steps_per_quarter=melody.steps_per_quarter)
+            for transposed in transposed_events]
+
+
+class MelodyWindower(pipeline.Pipeline):
+  """Slices each Melody into fixed-length windows with a fixed stride.
+
+  Windows are `window_bars` bars long and start every `stride_bars` bars from
+  the start of the melody, so every output melody has the same length and
+  training batches need no padding. Melodies are bar aligned, so the windows
+  are too. The final steps of a melody that do not fill a whole window are
+  dropped, as are melodies shorter than a single window. Windows share their
+  melody's event buffer until they are modified, e.g. when they are encoded.
+  """
+
+  def __init__(self, window_bars=16, stride_bars=None):
+    """Constructs a MelodyWindower.
+
+    Args:
+      window_bars: The length of each window in bars.
+      stride_bars: The number of bars between the starts of consecutive
+          windows. Defaults to `window_bars`, which gives non-overlapping
+          windows.
+
+    Raises:
+      ValueError: If `window_bars` or `stride_bars` is not positive.
+    """
+    super(MelodyWindower, self).__init__(
+        input_type=melodies_lib.Melody,
+        output_type=melodies_lib.Melody)
+    if stride_bars is None:
+      stride_bars = window_bars
+    if window_bars <= 0 or stride_bars <= 0:
+      raise ValueError('window_bars and stride_bars must be positive, got %s '
+                       'and %s' % (window_bars, stride_bars))
+    self.window_bars = window_bars
+    self.stride_bars = stride_bars
+
+  def transform(self, melody):
+    window_steps = self.window_bars * melody.steps_per_bar
+    stride_steps = self.stride_bars * melody.steps_per_bar
+    windows = [melody.window(start, start + window_steps)
+               for start in range(0, len(melody) - window_steps + 1,
+                                  stride_steps)]
+    self._set_stats([
+        statistics.Counter('melody_windows', len(windows)),
+        statistics.Counter('melodies_discarded_shorter_than_window',
+                           0 if windows else 1)])
+    return windows
+
+
 class RandomPartition(pipeline.Pipeline):
   """Outputs multiple datasets.
 
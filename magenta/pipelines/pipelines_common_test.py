@@ -16,6 +16,7 @@
 # internal imports
 import tensorflow as tf
 
+from magenta.common import sequence_example_lib
 from magenta.common import testing_lib as common_testing_lib
 from magenta.music import constants
 from magenta.music import melodies_lib
@@ -66,6 +67,29 @@ class PipelineUnitsCommonTest(tf.test.TestCase):
     self._unit_transform_test(unit, note_sequence,
                               [expected_quantized_sequence])
 
+  def testSilenceSplitter(self):
+    note_sequence = common_testing_lib.parse_test_proto(
+        music_pb2.NoteSequence,
+        """
+        time_signatures: {
+          numerator: 4
+          denominator: 4}
+        tempos: {
+          qpm: 60}""")
+    testing_lib.add_track_to_sequence(
+        note_sequence, 0,
+        [(12, 100, 0.0, 2.0), (11, 55, 10.0, 11.0)])
+    expected_chunks = [music_pb2.NoteSequence(), music_pb2.NoteSequence()]
+    for chunk, note in zip(expected_chunks, [(12, 100, 0.0, 2.0),
+                                             (11, 55, 2.0, 3.0)]):
+      chunk.time_signatures.add(numerator=4, denominator=4)
+      chunk.tempos.add(qpm=60)
+      testing_lib.add_track_to_sequence(chunk, 0, [note])
+      chunk.total_time = note[3]
+
+    unit = pipelines_common.SilenceSplitter(gap_bars=1.0)
+    self._unit_transform_test(unit, note_sequence, expected_chunks)
+
   def testMelodyExtractor(self):
     quantized_sequence = sequences_lib.QuantizedSequence()
     quantized_sequence.steps_per_quarter = 1
@@ -87,6 +111,81 @@ class PipelineUnitsCommonTest(tf.test.TestCase):
         min_bars=1, min_unique_pitches=1, gap_bars=1)
     self._unit_transform_test(unit, quantized_sequence, expected_melodies)
 
+  def testMelodyTransposer(self):
+    melody = melodies_lib.Melody(
+        [NO_EVENT, 60, NOTE_OFF, 64, NO_EVENT, 71], start_step=4,
+        steps_per_quarter=1, steps_per_bar=4)
+    expected_melodies = []
+    for amount in [-2, 0, 1, 2]:
+      expected_melodies.append(melodies_lib.Melody(
+          [NO_EVENT, 60 + amount, NOTE_OFF, 64 + amount, NO_EVENT,
+           71 + amount],
+          start_step=4, steps_per_quarter=1, steps_per_bar=4))
+    # Transposing down by 3 moves C5 below min_note, and transposing up by 3
+    # moves B5 to max_note.
+    unit = pipelines_common.MelodyTransposer(
+        transposition_range=[-3, -2, 0, 1, 2, 3], min_note=58, max_note=74)
+    self._unit_transform_test(unit, melody, expected_melodies)
+    stats = dict((stat.name, stat.count) for stat in unit.get_stats())
+    self.assertEqual(4, stats['MelodyTransposer_transpositions_generated'])
+    self.assertEqual(
+        2, stats['MelodyTransposer_transpositions_discarded_out_of_range'])
+
+    # A melody without notes is only output once.
+    melody = melodies_lib.Melody([NO_EVENT, NOTE_OFF])
+    unit = pipelines_common.MelodyTransposer()
+    self._unit_transform_test(unit, melody, [melody])
+    stats = dict((stat.name, stat.count) for stat in unit.get_stats())
+    self.assertEqual(1, stats['MelodyTransposer_melodies_without_notes'])
+    self.assertEqual(1, stats['MelodyTransposer_transpositions_generated'])
+    self.assertNotIn(
+        'MelodyTransposer_transpositions_discarded_out_of_range', stats)
+
+  def testMelodyTransposerEncoded(self):
+    melody = melodies_lib.Melody(
+        [NO_EVENT, 60, NOTE_OFF, 64, NO_EVENT, 71], start_step=4,
+        steps_per_quarter=1, steps_per_bar=4)
+    encoder_decoder = melodies_lib.OneHotMelodyEncoderDecoder(58, 74, 0)
+    expected = []
+    for amount in [-2, 0, 1, 2]:
+      transposed = melodies_lib.Melody(
+          [NO_EVENT, 60 + amount, NOTE_OFF, 64 + amount, NO_EVENT,
+           71 + amount])
+      inputs, labels = encoder_decoder.encode_batch(transposed)
+      expected.append(sequence_example_lib.SerializedSequenceExample(
+          sequence_example_lib.serialize_sequence_example(inputs[:-1],
+                                                          labels[1:])))
+    # The note range defaults to the encoder-decoder's.
+    unit = pipelines_common.MelodyTransposer(
+        transposition_range=[-3, -2, 0, 1, 2, 3],
+        encoder_decoder=encoder_decoder)
+    self._unit_transform_test(unit, melody, expected)
+    stats = dict((stat.name, stat.count) for stat in unit.get_stats())
+    self.assertEqual(
+        2, stats['MelodyTransposer_transpositions_discarded_out_of_range'])
+
+  def testMelodyWindower(self):
+    events = [60, NO_EVENT, NOTE_OFF, 62, 64, NO_EVENT, 65, NOTE_OFF, 67]
+    melody = melodies_lib.Melody(events, start_step=4, steps_per_quarter=1,
+                                 steps_per_bar=2)
+    expected_melodies = [
+        melodies_lib.Melody(events[start:start + 4], start_step=4 + start,
+                            steps_per_quarter=1, steps_per_bar=2)
+        for start in [0, 2, 4]]
+    unit = pipelines_common.MelodyWindower(window_bars=2, stride_bars=1)
+    self._unit_transform_test(unit, melody, expected_melodies)
+    stats = dict((stat.name, stat.count) for stat in unit.get_stats())
+    self.assertEqual(3, stats['MelodyWindower_melody_windows'])
+
+    unit = pipelines_common.MelodyWindower(window_bars=2)
+    self._unit_transform_test(unit, melody, expected_melodies[::2])
+
+    unit = pipelines_common.MelodyWindower(window_bars=5)
+    self._unit_transform_test(unit, melody, [])
+    stats = dict((stat.name, stat.count) for stat in unit.get_stats())
+    self.assertEqual(
+        1, stats['MelodyWindower_melodies_discarded_shorter_than_window'])
+
   def testRandomPartition(self):
     random_partition = pipelines_common.RandomPartition(
         str, ['a', 'b', 'c'], [0.1, 0.4])
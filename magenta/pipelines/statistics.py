@@ -21,10 +21,39 @@ import copy
 import tensorflow as tf
 
 
+# Statistics verbosity levels. At BASIC verbosity only counters are computed;
+# at DETAILED verbosity, histograms and other statistics that are expensive to
+# compute or print are computed as well.
+BASIC = 0
+DETAILED = 1
+
+_verbosity = DETAILED
+
+
 class MergeStatisticsException(Exception):
   pass
 
 
+def set_verbosity(verbosity):
+  """Sets the statistics verbosity level of this process.
+
+  Args:
+    verbosity: BASIC or DETAILED.
+
+  Raises:
+    ValueError: If `verbosity` is not a verbosity level.
+  """
+  global _verbosity
+  if verbosity not in (BASIC, DETAILED):
+    raise ValueError('Unknown statistics verbosity: %s' % verbosity)
+  _verbosity = verbosity
+
+
+def get_verbosity():
+  """Returns the statistics verbosity level of this process."""
+  return _verbosity
+
+
 class Statistic(object):
   """Holds statistics about a Pipeline run.
 
@@ -141,6 +170,72 @@ def merge_statistics(stats_list):
   return name_map.values()
 
 
+class StatisticsRegistry(object):
+  """Holds statistics by name, updating each one in place.
+
+  A statistic is created the first time it is requested by `counter` or
+  `histogram` and incremented in place afterward, and each statistic passed to
+  `merge` is merged into the one registered under the same name. Accumulating
+  statistics in a registry therefore only touches the statistics that were
+  actually produced, rather than rebuilding every statistic each time.
+  """
+
+  def __init__(self):
+    self._stats = {}
+
+  def counter(self, name):
+    """Returns the `Counter` with the given name, creating it if needed."""
+    stat = self._stats.get(name)
+    if stat is None:
+      stat = Counter(name)
+      self._stats[name] = stat
+    return stat
+
+  def histogram(self, name, buckets, verbose_pretty_print=False):
+    """Returns the `Histogram` with the given name, creating it if needed.
+
+    Args:
+      name: String name of the histogram.
+      buckets: The bucket lower bounds used if the histogram is created.
+      verbose_pretty_print: Whether a created histogram prints every bucket.
+
+    Returns:
+      The `Histogram` registered under `name`.
+    """
+    stat = self._stats.get(name)
+    if stat is None:
+      stat = Histogram(name, buckets, verbose_pretty_print)
+      self._stats[name] = stat
+    return stat
+
+  def merge(self, stats_list):
+    """Merges statistics into the ones registered under the same names.
+
+    The given statistics are not modified; statistics with new names are
+    registered as copies.
+
+    Args:
+      stats_list: An iterable of `Statistic` objects.
+
+    Raises:
+      MergeStatisticsException: If a statistic cannot be merged into the one
+          registered under the same name.
+    """
+    for stat in stats_list:
+      registered = self._stats.get(stat.name)
+      if registered is None:
+        self._stats[stat.name] = stat.copy()
+      else:
+        registered.merge_from(stat)
+
+  def values(self):
+    """Returns a list of the registered `Statistic` objects."""
+    return list(self._stats.values())
+
+  def __len__(self):
+    return len(self._stats)
+
+
 def log_statistics_list(stats_list, logger_fn=tf.logging.info):
   """Calls the given logger function on each `Statistic` in the list.
 
@@ -280,4 +375,6 @@ class Histogram(Statistic):
          if self.verbose_pretty_print or self.counters[lower]])
 
   def copy(self):
-    return copy.copy(self)
+    histogram_copy = copy.copy(self)
+    histogram_copy.counters = dict(self.counters)
+    return histogram_copy
@@ -90,6 +90,39 @@ class StatisticsTest(tf.test.TestCase):
     self.assertEqual(histo_copy.counters,
                      {float('-inf'): 6, 1: 1, 2: 13, 10: 3})
     self.assertEqual(histo_copy.name, 'name_123')
+    histo_copy.increment(1)
+    self.assertEqual(histo.counters, {float('-inf'): 6, 1: 1, 2: 13, 10: 3})
+
+  def testStatisticsRegistry(self):
+    registry = statistics.StatisticsRegistry()
+    registry.counter('counter').increment()
+    registry.counter('counter').increment(2)
+    registry.histogram('histo', [1, 2]).increment(1)
+    self.assertEqual(2, len(registry))
+
+    counter = statistics.Counter('counter', 10)
+    new_counter = statistics.Counter('new_counter', 5)
+    registry.merge([counter, new_counter])
+    registry.merge([new_counter])
+    self.assertEqual(10, counter.count)
+    self.assertEqual(5, new_counter.count)
+    stats = dict((stat.name, stat) for stat in registry.values())
+    self.assertEqual(13, stats['counter'].count)
+    self.assertEqual(10, stats['new_counter'].count)
+    self.assertEqual({float('-inf'): 0, 1: 1, 2: 0}, stats['histo'].counters)
+
+    with self.assertRaises(statistics.MergeStatisticsException):
+      registry.merge([statistics.Histogram('counter', [1])])
+
+  def testVerbosity(self):
+    self.assertEqual(statistics.DETAILED, statistics.get_verbosity())
+    statistics.set_verbosity(statistics.BASIC)
+    try:
+      self.assertEqual(statistics.BASIC, statistics.get_verbosity())
+      with self.assertRaises(ValueError):
+        statistics.set_verbosity(2)
+    finally:
+      statistics.set_verbosity(statistics.DETAILED)
 
   def testMergeDifferentNames(self):
     counter_1 = statistics.Counter('counter_1')